@@ -0,0 +1,398 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+
+from formula_catalog import is_cross_sheet
+from markdown_index import is_index_file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    id INTEGER PRIMARY KEY,
+    workbook_dir TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    sheet_count INTEGER,
+    formula_count INTEGER,
+    complexity_rating TEXT,
+    ui_components INTEGER,
+    business_rules INTEGER,
+    complexity_score INTEGER,
+    cross_sheet_references INTEGER,
+    converted_at TEXT
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY,
+    workbook_id INTEGER NOT NULL REFERENCES workbooks(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    file_stem TEXT NOT NULL,
+    dimensions TEXT,
+    cell_count INTEGER,
+    formula_count INTEGER,
+    repeated_formulas INTEGER,
+    table_count INTEGER,
+    dependency_count INTEGER,
+    validation_count INTEGER,
+    ui_components INTEGER,
+    business_rules INTEGER
+);
+CREATE TABLE IF NOT EXISTS cells (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    row_number INTEGER NOT NULL,
+    column_number INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    value,
+    cell_type TEXT,
+    has_formula INTEGER,
+    cached_value,
+    has_validation INTEGER,
+    has_comment INTEGER,
+    business_context TEXT,
+    sampled INTEGER,
+    PRIMARY KEY (sheet_id, row_number, column_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS formulas (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    address TEXT NOT NULL,
+    formula TEXT,
+    category TEXT,
+    section TEXT,
+    cached_value,
+    complexity_score INTEGER,
+    implementation_notes TEXT
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    calculation_order INTEGER,
+    target_cell TEXT NOT NULL,
+    formula TEXT,
+    dependency_type TEXT,
+    complexity_score INTEGER,
+    local_dependencies TEXT,
+    sheet_dependencies TEXT,
+    named_dependencies TEXT
+);
+CREATE TABLE IF NOT EXISTS tables (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    name TEXT,
+    cell_range TEXT,
+    headers TEXT,
+    row_count INTEGER,
+    business_context TEXT,
+    is_input_table INTEGER,
+    is_calculation_table INTEGER,
+    is_output_table INTEGER
+);
+CREATE TABLE IF NOT EXISTS validations (
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    address TEXT NOT NULL,
+    validation_type TEXT,
+    formula TEXT,
+    error_message TEXT,
+    input_message TEXT
+);
+CREATE INDEX IF NOT EXISTS sheets_by_workbook ON sheets (workbook_id, position);
+CREATE INDEX IF NOT EXISTS cells_by_context ON cells (sheet_id, business_context);
+CREATE INDEX IF NOT EXISTS formulas_by_category ON formulas (sheet_id, category);
+CREATE INDEX IF NOT EXISTS formulas_by_address ON formulas (sheet_id, address);
+CREATE INDEX IF NOT EXISTS dependencies_by_type ON dependencies (sheet_id, dependency_type);
+CREATE INDEX IF NOT EXISTS dependencies_by_target ON dependencies (sheet_id, target_cell);
+CREATE INDEX IF NOT EXISTS tables_by_sheet ON tables (sheet_id);
+CREATE INDEX IF NOT EXISTS validations_by_sheet ON validations (sheet_id, address);
+"""
+
+# Detail queries: table, filter parameter -> column, order
+DETAIL_QUERIES = {
+    "cells": ("cells", {"context": "business_context", "type": "cell_type"}, "row_number, column_number"),
+    "formulas": ("formulas", {"category": "category", "section": "section"}, "rowid"),
+    "dependencies": ("dependencies", {"type": "dependency_type", "target": "target_cell"}, "calculation_order, rowid"),
+    "tables": ("tables", {}, "rowid"),
+    "validations": ("validations", {"type": "validation_type"}, "rowid")
+}
+JSON_COLUMNS = ("headers", "local_dependencies", "sheet_dependencies", "named_dependencies")
+DEFAULT_PAGE_ROWS = 100
+MAX_PAGE_ROWS = 1000
+# Rows per executemany call when loading a sheet
+STORE_BATCH_ROWS = 10000
+
+
+def _sql_value(value: Any) -> Any:
+    """Values SQLite stores as they are; anything else (dates, errors) is stored as text."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _row_column(address: str) -> Tuple[int, int]:
+    column, row = coordinate_from_string(address)
+    return row, column_index_from_string(column)
+
+
+def _json_list(values: Optional[List[Any]]) -> str:
+    return json.dumps(values or [], default=str)
+
+
+def _insert_batches(connection: sqlite3.Connection, sql: str, rows: Iterator[Tuple]) -> int:
+    """Insert rows with one executemany per STORE_BATCH_ROWS rows; returns the number inserted."""
+    inserted = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, STORE_BATCH_ROWS))
+        if not batch:
+            return inserted
+        connection.executemany(sql, batch)
+        inserted += len(batch)
+
+
+class AnalysisStore:
+    """
+    SQLite store of converted workbooks for the web app.
+
+    Each workbook is keyed by its output directory and loaded in one
+    transaction: workbooks, sheets, cells, formulas, dependencies, tables
+    and validations. The database runs in WAL mode so requests can read
+    while a conversion writes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for one operation; commits on success and rolls back on error."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def workbook_key(workbook_dir: str) -> str:
+        return os.path.abspath(str(workbook_dir))
+
+    def store_workbook(self, workbook_dir: str, workbook_summary: Dict[str, Any],
+                       sheets: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Replace the stored analysis of a workbook.
+
+        `sheets` holds (output file stem, sheet_data) pairs in workbook order,
+        as written to the sheet JSON files. Returns the number of rows stored.
+        """
+        estimates = workbook_summary.get("implementation_estimates", {})
+        stored = 0
+        with self._connect() as connection:
+            key = self.workbook_key(workbook_dir)
+            connection.execute("DELETE FROM workbooks WHERE workbook_dir = ?", (key,))
+            workbook_id = connection.execute(
+                "INSERT INTO workbooks (workbook_dir, name, sheet_count, formula_count, complexity_rating, "
+                "ui_components, business_rules, complexity_score, cross_sheet_references, converted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, Path(workbook_dir).name, len(sheets),
+                 sum(sheet.get("formula_count", 0) for sheet in workbook_summary.get("sheets", [])),
+                 workbook_summary.get("complexity_rating"), estimates.get("ui_components"),
+                 estimates.get("business_rules"), estimates.get("complexity_score"),
+                 workbook_summary.get("business_complexity", {}).get("cross_sheet_references"),
+                 datetime.now().isoformat(timespec='seconds'))
+            ).lastrowid
+            formula_counts = {sheet["name"]: sheet.get("formula_count") for sheet in workbook_summary.get("sheets", [])}
+            for position, (file_stem, sheet_data) in enumerate(sheets):
+                stored += self._store_sheet(connection, workbook_id, position, file_stem, sheet_data,
+                                            formula_counts.get(sheet_data["name"]))
+        return stored
+
+    def _store_sheet(self, connection: sqlite3.Connection, workbook_id: int, position: int, file_stem: str,
+                     sheet_data: Dict[str, Any], formula_count: Optional[int]) -> int:
+        requirements = sheet_data.get("software_requirements", {})
+        formulas = [(section, formula) for section, entries in sheet_data.get("formulas", {}).items()
+                    for formula in entries]
+        if formula_count is None:
+            formula_count = len(formulas) + sheet_data.get("repeated_structure", {}).get("repeated_formulas", 0)
+        sheet_id = connection.execute(
+            "INSERT INTO sheets (workbook_id, position, name, file_stem, dimensions, cell_count, formula_count, "
+            "repeated_formulas, table_count, dependency_count, validation_count, ui_components, business_rules) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (workbook_id, position, sheet_data["name"], file_stem, sheet_data.get("dimensions"),
+             len(sheet_data.get("cells", {})), formula_count,
+             sheet_data.get("repeated_structure", {}).get("repeated_formulas", 0),
+             len(sheet_data.get("tables", [])), len(sheet_data.get("data_dependencies", [])),
+             len(requirements.get("data_validation_rules", [])), len(requirements.get("ui_components", [])),
+             len(requirements.get("business_rules", [])))
+        ).lastrowid
+
+        cells = (
+            (sheet_id, *_row_column(address), address, _sql_value(cell.get("value")), cell.get("type"),
+             int(bool(cell.get("has_formula"))), _sql_value(cell.get("cached_value")),
+             int(bool(cell.get("has_validation"))), int(bool(cell.get("has_comment"))),
+             cell.get("business_context"), int(bool(cell.get("sampled"))))
+            for address, cell in sheet_data.get("cells", {}).items()
+        )
+        stored = 1 + _insert_batches(connection, "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     cells)
+
+        stored += _insert_batches(
+            connection, "INSERT INTO formulas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((sheet_id, formula["address"], formula.get("formula"), formula.get("category"), section,
+              _sql_value(formula.get("cached_value")), formula.get("complexity_score"),
+              formula.get("implementation_notes")) for section, formula in formulas)
+        )
+
+        stored += _insert_batches(
+            connection, "INSERT INTO dependencies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((sheet_id, dependency.get("calculation_order"), dependency["target_cell"], dependency.get("formula"),
+              dependency.get("dependency_type"), dependency.get("complexity_score"),
+              _json_list(dependency.get("local_dependencies")), _json_list(dependency.get("sheet_dependencies")),
+              _json_list(dependency.get("named_dependencies")))
+             for dependency in sheet_data.get("data_dependencies", []))
+        )
+
+        stored += _insert_batches(
+            connection, "INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((sheet_id, _sql_value(table.get("name")), table.get("range"), _json_list(table.get("headers")),
+              table.get("row_count"), table.get("business_context"), int(bool(table.get("is_input_table"))),
+              int(bool(table.get("is_calculation_table"))), int(bool(table.get("is_output_table"))))
+             for table in sheet_data.get("tables", []))
+        )
+
+        stored += _insert_batches(
+            connection, "INSERT INTO validations VALUES (?, ?, ?, ?, ?, ?)",
+            ((sheet_id, rule["cell"], rule.get("validation_type"), rule.get("formula"), rule.get("error_message"),
+              rule.get("input_message")) for rule in requirements.get("data_validation_rules", []))
+        )
+        return stored
+
+    def import_workbook_dir(self, workbook_dir: str) -> int:
+        """
+        Load a workbook from the sheet JSON files of an existing output directory.
+
+        Used for results that were not converted in this process (for example
+        ones reused from the result cache). Workbook totals are added up from
+        the sheets; cross-sheet references are counted over the formula cells
+        the sheet JSON keeps.
+        """
+        workbook_dir = Path(workbook_dir)
+        sheets = []
+        for json_file in sorted(workbook_dir.glob("*.json")):
+            if is_index_file(json_file.name):
+                continue
+            with json_file.open('r', encoding='utf-8') as f:
+                sheet_data = json.load(f)
+            if isinstance(sheet_data, dict) and "software_requirements" in sheet_data:
+                sheets.append((json_file.stem, sheet_data))
+
+        sheet_summaries = []
+        for _, sheet_data in sheets:
+            requirements = sheet_data["software_requirements"]
+            formula_count = sum(len(entries) for entries in sheet_data.get("formulas", {}).values()) + \
+                sheet_data.get("repeated_structure", {}).get("repeated_formulas", 0)
+            sheet_summaries.append({
+                "name": sheet_data["name"],
+                "formula_count": formula_count,
+                "ui_components": len(requirements.get("ui_components", [])),
+                "business_rules": len(requirements.get("business_rules", [])),
+                "cross_sheet_references": sum(1 for cell in sheet_data.get("cells", {}).values()
+                                              if cell.get("has_formula") and is_cross_sheet(str(cell.get("value"))))
+            })
+        total_formulas = sum(sheet["formula_count"] for sheet in sheet_summaries)
+        summary = {
+            "sheets": sheet_summaries,
+            "complexity_rating": complexity_rating(total_formulas),
+            "business_complexity": {
+                "cross_sheet_references": sum(sheet["cross_sheet_references"] for sheet in sheet_summaries)
+            },
+            "implementation_estimates": {
+                "ui_components": sum(sheet["ui_components"] for sheet in sheet_summaries),
+                "business_rules": sum(sheet["business_rules"] for sheet in sheet_summaries),
+                "complexity_score": total_formulas
+            }
+        }
+        return self.store_workbook(str(workbook_dir), summary, sheets)
+
+    def has_workbook(self, workbook_dir: str) -> bool:
+        with self._connect() as connection:
+            return connection.execute("SELECT 1 FROM workbooks WHERE workbook_dir = ?",
+                                      (self.workbook_key(workbook_dir),)).fetchone() is not None
+
+    def workbook_overview(self, workbook_dir: str) -> Optional[Dict[str, Any]]:
+        """Return a workbook's totals and per-sheet metrics, or None if it is not stored."""
+        with self._connect() as connection:
+            workbook = connection.execute("SELECT * FROM workbooks WHERE workbook_dir = ?",
+                                          (self.workbook_key(workbook_dir),)).fetchone()
+            if workbook is None:
+                return None
+            sheets = connection.execute(
+                "SELECT name, file_stem, dimensions, cell_count, formula_count, repeated_formulas, table_count, "
+                "dependency_count, validation_count, ui_components, business_rules "
+                "FROM sheets WHERE workbook_id = ? ORDER BY position", (workbook["id"],)
+            ).fetchall()
+        overview = dict(workbook)
+        overview.pop("id")
+        overview.pop("workbook_dir")
+        overview["sheets"] = [dict(sheet) for sheet in sheets]
+        return overview
+
+    def sheet_details(self, workbook_dir: str, sheet_name: str, kind: str, filters: Dict[str, str],
+                      limit: int = DEFAULT_PAGE_ROWS, offset: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Return one page of a sheet's cells, formulas, dependencies, tables or validations.
+
+        `filters` maps the kind's filter names (e.g. category for formulas) to
+        values; unknown filters are ignored. Returns None if the sheet is not
+        stored.
+        """
+        table, filter_columns, order = DETAIL_QUERIES[kind]
+        limit = max(1, min(limit, MAX_PAGE_ROWS))
+        with self._connect() as connection:
+            sheet = connection.execute(
+                "SELECT sheets.id FROM sheets JOIN workbooks ON workbooks.id = sheets.workbook_id "
+                "WHERE workbooks.workbook_dir = ? AND (sheets.name = ? OR sheets.file_stem = ?)",
+                (self.workbook_key(workbook_dir), sheet_name, sheet_name)
+            ).fetchone()
+            if sheet is None:
+                return None
+            where = ["sheet_id = ?"]
+            parameters: List[Any] = [sheet["id"]]
+            for name, column in filter_columns.items():
+                if filters.get(name):
+                    where.append(f"{column} = ?")
+                    parameters.append(filters[name])
+            condition = " AND ".join(where)
+            total = connection.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}", parameters).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT * FROM {table} WHERE {condition} ORDER BY {order} LIMIT ? OFFSET ?",
+                parameters + [limit, offset]
+            ).fetchall()
+
+        items = []
+        for row in rows:
+            item = dict(row)
+            item.pop("sheet_id")
+            for column in JSON_COLUMNS:
+                if column in item:
+                    item[column] = json.loads(item[column])
+            items.append(item)
+        return {"sheet": sheet_name, "kind": kind, "total": total, "offset": offset, "limit": limit, "items": items}
+
+
+def complexity_rating(total_formulas: int) -> str:
+    """Rate a workbook by its formula count, on the scale of the enhanced workbook summary."""
+    if total_formulas > 500:
+        return "Very High"
+    elif total_formulas > 200:
+        return "High"
+    elif total_formulas > 50:
+        return "Medium"
+    return "Low"
@@ -2,6 +2,7 @@ import os
 from flask import Flask, request, render_template, flash, redirect, url_for, send_file
 from werkzeug.utils import secure_filename
 from excel_to_llm_converter import ExcelToLLMConverter
+from workbook_loader import WORKBOOK_EXTENSIONS
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,7 +21,7 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_ROOT'], exist_ok=True)
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'xlsx'
+    return '.' in filename and '.' + filename.rsplit('.', 1)[1].lower() in WORKBOOK_EXTENSIONS
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
@@ -74,7 +75,7 @@ def upload_file():
                 flash(f'Error saving file: {str(e)}', 'error')
                 return redirect(request.url)
         else:
-            flash('Invalid file type. Please upload an Excel file (.xlsx)', 'error')
+            flash('Invalid file type. Please upload an Excel file (.xlsx, .xlsm or .xlsb)', 'error')
             return redirect(request.url)
             
     return render_template('upload.html')
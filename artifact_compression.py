@@ -0,0 +1,154 @@
+import gzip
+import os
+import shutil
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from markdown_index import is_index_file
+
+try:
+    import zstandard
+except ImportError:  # zstd sidecars are optional; gzip is always available
+    zstandard = None
+
+# Encodings in order of preference, mapped to their sidecar suffix
+SIDECAR_SUFFIXES = {
+    "zstd": ".zst",
+    "gzip": ".gz"
+}
+
+COMPRESSIBLE_EXTENSIONS = {'.md', '.json', '.txt', '.html', '.csv'}
+
+# Files smaller than this are not worth a sidecar
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+def available_encodings() -> List[str]:
+    """Return the content encodings that sidecars can be written for."""
+    return [encoding for encoding in SIDECAR_SUFFIXES if encoding != "zstd" or zstandard is not None]
+
+
+def sidecar_path(file_path: str, encoding: str) -> Path:
+    """Return the pre-compressed sidecar path for a file and encoding."""
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + SIDECAR_SUFFIXES[encoding])
+
+
+def is_compressed_sidecar(filename: str) -> bool:
+    """Check whether a file is a pre-compressed sidecar."""
+    return any(filename.endswith(suffix) for suffix in SIDECAR_SUFFIXES.values())
+
+
+def write_compressed_sidecars(file_path: str) -> List[str]:
+    """Write gzip (and zstd, if installed) copies of a file next to it."""
+    file_path = Path(file_path)
+    written = []
+
+    with file_path.open('rb') as src, gzip.open(sidecar_path(file_path, "gzip"), 'wb', compresslevel=GZIP_LEVEL) as dest:
+        shutil.copyfileobj(src, dest, STREAM_CHUNK_SIZE)
+    written.append(str(sidecar_path(file_path, "gzip")))
+
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        with file_path.open('rb') as src, sidecar_path(file_path, "zstd").open('wb') as dest:
+            compressor.copy_stream(src, dest)
+        written.append(str(sidecar_path(file_path, "zstd")))
+
+    return written
+
+
+def compress_output_directory(directory: str) -> int:
+    """Write compressed sidecars for every compressible output in a directory."""
+    count = 0
+    for file_path in Path(directory).iterdir():
+        if not file_path.is_file() or is_compressed_sidecar(file_path.name) or is_index_file(file_path.name):
+            continue
+        if file_path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        if file_path.stat().st_size < MIN_COMPRESS_SIZE:
+            continue
+        try:
+            write_compressed_sidecars(str(file_path))
+            count += 1
+        except OSError as e:
+            print(f"Warning: Could not compress {file_path}: {str(e)}")
+    return count
+
+
+def select_encoded_file(file_path: str, accepted_encodings: Iterable[str]) -> Tuple[str, Optional[str]]:
+    """
+    Pick the best pre-compressed sidecar the client accepts.
+
+    Sidecars older than the source file are ignored so a rewritten output is
+    never served stale. Returns the path to serve and its content encoding
+    (None for the original file).
+    """
+    accepted = set(accepted_encodings)
+    source_mtime = os.path.getmtime(file_path)
+    for encoding in SIDECAR_SUFFIXES:
+        if encoding not in accepted:
+            continue
+        candidate = sidecar_path(file_path, encoding)
+        if candidate.exists() and candidate.stat().st_mtime >= source_mtime:
+            return str(candidate), encoding
+    return file_path, None
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file object that collects zip output for streaming."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def collect_bundle_files(directory: str) -> List[Tuple[str, str]]:
+    """List (archive name, path) pairs for the outputs under a directory."""
+    directory = Path(directory)
+    files = []
+    for file_path in sorted(directory.rglob('*')):
+        if not file_path.is_file() or is_compressed_sidecar(file_path.name) or is_index_file(file_path.name):
+            continue
+        files.append((file_path.relative_to(directory).as_posix(), str(file_path)))
+    return files
+
+
+def stream_zip(files: Iterable[Tuple[str, str]], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Stream a zip archive of the given files without staging it on disk.
+
+    The archive is written to an unseekable buffer, so zipfile uses data
+    descriptors and each compressed block can be yielded as soon as it is
+    produced.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, path in files:
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, archive.open(zinfo, 'w') as dest:
+                for block in iter(lambda: src.read(chunk_size), b''):
+                    dest.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
@@ -0,0 +1 @@
+"""Synthetic workbook generation and conversion benchmarks."""
@@ -0,0 +1,257 @@
+"""
+Conversion benchmark harness.
+
+Usage:
+    python -m benchmarks.run_benchmarks --rows 5000 --columns 20 --sheets 4
+    python -m benchmarks.run_benchmarks --compare benchmark_results/previous.json
+    python -m benchmarks.run_benchmarks --with-llm --fake-latency 0.2 --fake-tokens-per-second 80
+"""
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, List
+
+from benchmarks.synthetic_workbook import default_spec, generate_workbook
+from combine_markdown import combine_markdown_files
+from enhanced_excel_converter import EnhancedExcelConverter
+from excel_to_llm_converter import ExcelToLLMConverter
+from llm_backends import FakeBackend
+from workbook_loader import load_workbook
+
+DEFAULT_RESULTS_DIR = Path("benchmark_results")
+
+# Per-sheet analyzers timed individually for each converter
+ENHANCED_SHEET_STAGES = [
+    "identify_tables",
+    "analyze_business_logic_patterns",
+    "extract_data_dependencies",
+    "identify_ui_components",
+    "extract_business_rules",
+    "extract_validation_rules",
+    "identify_calculation_sequences",
+]
+BASIC_SHEET_STAGES = [
+    "identify_tables",
+    "identify_key_sections",
+]
+
+
+class StageTimer:
+    """Times named stages and records their peak traced memory."""
+
+    def __init__(self, cell_count: int):
+        self.cell_count = cell_count
+        self.stages = {}
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_memory_mb": 0.0})
+        stage["seconds"] += elapsed
+        stage["calls"] += 1
+        stage["peak_memory_mb"] = max(stage["peak_memory_mb"], peak / (1024 * 1024))
+        return result
+
+    def report(self) -> Dict[str, Any]:
+        for stage in self.stages.values():
+            stage["seconds"] = round(stage["seconds"], 6)
+            stage["peak_memory_mb"] = round(stage["peak_memory_mb"], 3)
+            stage["cells_per_sec"] = round(self.cell_count / stage["seconds"], 1) if stage["seconds"] else None
+        return self.stages
+
+
+def benchmark_converter(name: str, converter, workbook_path: Path, output_dir: Path,
+                        cell_count: int, sheet_stages: List[str], with_llm: bool = False) -> Dict[str, Any]:
+    """Run every conversion stage for one converter and collect timings."""
+    timer = StageTimer(cell_count)
+    workbook_dir = output_dir / workbook_path.stem
+    workbook_dir.mkdir(parents=True, exist_ok=True)
+    total_start = time.perf_counter()
+
+    workbook = timer.run("load", load_workbook, workbook_path)
+
+    for worksheet in workbook.worksheets:
+        for stage in sheet_stages:
+            if hasattr(converter, stage):
+                timer.run(stage, getattr(converter, stage), worksheet)
+        timer.run("extract_named_ranges", converter.extract_named_ranges, workbook)
+
+    timer.run("generate_workbook_summary", converter.generate_workbook_summary, workbook)
+
+    for worksheet in workbook.worksheets:
+        sheet_data = timer.run("process_worksheet", converter.process_worksheet, worksheet, workbook)
+        safe_title = converter.sanitize_filename(worksheet.title) or "Sheet"
+        timer.run("markdown", converter.convert_to_markdown, sheet_data, workbook_dir / f"{safe_title}.md")
+
+        def write_json():
+            with (workbook_dir / f"{safe_title}.json").open('w', encoding='utf-8') as f:
+                json.dump(sheet_data, f, indent=2, default=str)
+        timer.run("json", write_json)
+
+    combined_file = timer.run("combine", combine_markdown_files, str(workbook_dir), "combined_benchmark.md")
+    with open(combined_file, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+
+    token_count = timer.run("tokenization", converter.llm_analyzer.count_tokens, markdown_content)
+    chunks = timer.run("chunking", converter.llm_analyzer.chunk_content, markdown_content, 30000)
+
+    # LLM stages run against the offline FakeBackend, so they measure pipeline overhead and
+    # the configured latency model rather than a real provider
+    if with_llm:
+        timer.run("llm_user_guide", converter.llm_analyzer.analyze_markdown, markdown_content)
+        if getattr(converter, "prd_generator", None):
+            timer.run("llm_prd", converter.prd_generator.generate_prd, markdown_content)
+
+    return {
+        "converter": name,
+        "total_seconds": round(time.perf_counter() - total_start, 6),
+        "markdown_bytes": len(markdown_content.encode('utf-8')),
+        "tokens": token_count,
+        "chunks": len(chunks),
+        "stages": timer.report()
+    }
+
+
+def run_benchmarks(spec: Dict[str, Any], converters: List[str], keep_output: bool = False,
+                   with_llm: bool = False, fake_llm_options: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Generate a synthetic workbook and benchmark the selected converters on it."""
+    work_dir = Path(tempfile.mkdtemp(prefix="excel_bench_"))
+    try:
+        workbook_path = work_dir / "synthetic_workbook.xlsx"
+        print(f"Generating synthetic workbook: {spec}")
+        workbook_stats = generate_workbook(str(workbook_path), spec)
+        print(f"Generated {workbook_stats['cells']} cells ({workbook_stats['formulas']} formulas)")
+
+        fake_llm_options = fake_llm_options or {}
+        results = []
+        tracemalloc.start()
+        try:
+            if "basic" in converters:
+                print("Benchmarking ExcelToLLMConverter...")
+                converter = ExcelToLLMConverter(str(workbook_path), str(work_dir / "basic"), api_key="benchmark",
+                                                llm_backend=FakeBackend(**fake_llm_options))
+                results.append(benchmark_converter("ExcelToLLMConverter", converter, workbook_path,
+                                                   work_dir / "basic", workbook_stats["cells"], BASIC_SHEET_STAGES,
+                                                   with_llm))
+            if "enhanced" in converters:
+                print("Benchmarking EnhancedExcelConverter...")
+                converter = EnhancedExcelConverter(str(workbook_path), str(work_dir / "enhanced"),
+                                                   api_key="benchmark", generate_prd=with_llm,
+                                                   llm_backend=FakeBackend(**fake_llm_options))
+                results.append(benchmark_converter("EnhancedExcelConverter", converter, workbook_path,
+                                                   work_dir / "enhanced", workbook_stats["cells"], ENHANCED_SHEET_STAGES,
+                                                   with_llm))
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "spec": spec,
+            "llm": {"with_llm": with_llm, "fake_backend": fake_llm_options},
+            "workbook": workbook_stats,
+            "results": results
+        }
+    finally:
+        if keep_output:
+            print(f"Benchmark outputs kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare_results(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """Print per-stage speedups of the current run against a previous results file."""
+    previous_by_converter = {r["converter"]: r for r in previous.get("results", [])}
+    for result in current["results"]:
+        baseline = previous_by_converter.get(result["converter"])
+        if not baseline:
+            continue
+        print(f"\n{result['converter']} vs {previous.get('timestamp', 'previous run')}:")
+        for stage, data in result["stages"].items():
+            before = baseline["stages"].get(stage)
+            if before and data["seconds"]:
+                print(f"  {stage:<35} {before['seconds']:>10.4f}s -> {data['seconds']:>10.4f}s "
+                      f"({before['seconds'] / data['seconds']:.2f}x)")
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for result in report["results"]:
+        print(f"\n{result['converter']}: {result['total_seconds']:.3f}s total, "
+              f"{result['tokens']} tokens, {result['chunks']} chunks")
+        for stage, data in result["stages"].items():
+            print(f"  {stage:<35} {data['seconds']:>10.4f}s  {data['cells_per_sec'] or 0:>14,.0f} cells/s  "
+                  f"{data['peak_memory_mb']:>9.2f} MB peak")
+
+
+def main():
+    defaults = default_spec()
+    parser = argparse.ArgumentParser(description="Benchmark Excel to LLM conversion on a synthetic workbook.")
+    parser.add_argument("--rows", type=int, default=defaults["rows"])
+    parser.add_argument("--columns", type=int, default=defaults["columns"])
+    parser.add_argument("--sheets", type=int, default=defaults["sheet_count"])
+    parser.add_argument("--formula-density", type=float, default=defaults["formula_density"])
+    parser.add_argument("--cross-sheet-ratio", type=float, default=defaults["cross_sheet_ratio"])
+    parser.add_argument("--validations", type=int, default=defaults["data_validations"])
+    parser.add_argument("--named-ranges", type=int, default=defaults["named_ranges"])
+    parser.add_argument("--no-styles", action="store_true")
+    parser.add_argument("--seed", type=int, default=defaults["seed"])
+    parser.add_argument("--converter", choices=["basic", "enhanced", "both"], default="both")
+    parser.add_argument("--output", help="Results JSON path (default: benchmark_results/benchmark_<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--keep-output", action="store_true", help="Keep the generated workbook and outputs")
+    parser.add_argument("--with-llm", action="store_true", help="Also time the LLM stages against the fake backend")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="Fake backend per-call latency (seconds)")
+    parser.add_argument("--fake-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--fake-output-tokens", type=int, default=512)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--fake-rate-limit-rpm", type=int, default=None)
+    args = parser.parse_args()
+
+    spec = {
+        "rows": args.rows,
+        "columns": args.columns,
+        "sheet_count": args.sheets,
+        "formula_density": args.formula_density,
+        "cross_sheet_ratio": args.cross_sheet_ratio,
+        "styles": not args.no_styles,
+        "data_validations": args.validations,
+        "named_ranges": args.named_ranges,
+        "seed": args.seed
+    }
+    converters = ["basic", "enhanced"] if args.converter == "both" else [args.converter]
+    fake_llm_options = {
+        "latency": args.fake_latency,
+        "tokens_per_second": args.fake_tokens_per_second,
+        "output_tokens": args.fake_output_tokens,
+        "error_rate": args.fake_error_rate,
+        "rate_limit_rpm": args.fake_rate_limit_rpm
+    }
+    report = run_benchmarks(spec, converters, keep_output=args.keep_output,
+                            with_llm=args.with_llm, fake_llm_options=fake_llm_options)
+    print_report(report)
+
+    output_path = Path(args.output) if args.output else \
+        DEFAULT_RESULTS_DIR / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open('w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import random
+from pathlib import Path
+from typing import Dict, Any
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.datavalidation import DataValidation
+
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+NUMBER_FORMATS = ["0.00", "0.0%", "$#,##0", "#,##0"]
+FORMULA_TEMPLATES = [
+    "={left}*1.05",
+    "=SUM({row_range})",
+    "=IF({left}>0,{left}*{above},0)",
+    "={above}+{left}",
+    "=AVERAGE({col_range})",
+    "=IFERROR({left}/{above},0)",
+]
+
+
+def default_spec() -> Dict[str, Any]:
+    """Return the default synthetic workbook specification."""
+    return {
+        "rows": 1000,
+        "columns": 10,
+        "sheet_count": 3,
+        "formula_density": 0.3,
+        "cross_sheet_ratio": 0.1,
+        "styles": True,
+        "data_validations": 20,
+        "named_ranges": 5,
+        "seed": 0
+    }
+
+
+def generate_workbook(output_path: str, spec: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Generate a synthetic workbook and return statistics about what was written.
+
+    Every sheet gets a header row, a text label column and a numeric grid.
+    A formula_density share of grid cells become formulas, and a
+    cross_sheet_ratio share of those reference the previous sheet.
+    """
+    spec = {**default_spec(), **(spec or {})}
+    rng = random.Random(spec["seed"])
+    rows, columns = spec["rows"], spec["columns"]
+    stats = {"cells": 0, "formulas": 0, "cross_sheet_formulas": 0, "validations": 0, "named_ranges": 0}
+
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    sheet_titles = [f"Sheet{i + 1}" for i in range(spec["sheet_count"])]
+
+    for sheet_index, title in enumerate(sheet_titles):
+        worksheet = workbook.create_sheet(title)
+
+        # Header row
+        worksheet.cell(row=1, column=1, value="Line Item")
+        for col in range(2, columns + 1):
+            worksheet.cell(row=1, column=col, value=f"Period {col - 1}")
+        if spec["styles"]:
+            for col in range(1, columns + 1):
+                worksheet.cell(row=1, column=col).font = HEADER_FONT
+                worksheet.cell(row=1, column=col).fill = HEADER_FILL
+        stats["cells"] += columns
+
+        for row in range(2, rows + 2):
+            worksheet.cell(row=row, column=1, value=f"Item {row - 1}")
+            stats["cells"] += 1
+            for col in range(2, columns + 1):
+                cell = worksheet.cell(row=row, column=col)
+                if row > 2 and col > 2 and rng.random() < spec["formula_density"]:
+                    if sheet_index > 0 and rng.random() < spec["cross_sheet_ratio"]:
+                        cell.value = f"='{sheet_titles[sheet_index - 1]}'!{get_column_letter(col)}{row}*1.1"
+                        stats["cross_sheet_formulas"] += 1
+                    else:
+                        template = rng.choice(FORMULA_TEMPLATES)
+                        cell.value = template.format(
+                            left=f"{get_column_letter(col - 1)}{row}",
+                            above=f"{get_column_letter(col)}{row - 1}",
+                            row_range=f"B{row}:{get_column_letter(col - 1)}{row}",
+                            col_range=f"{get_column_letter(col)}2:{get_column_letter(col)}{row - 1}"
+                        )
+                    stats["formulas"] += 1
+                else:
+                    cell.value = round(rng.uniform(-1000, 10000), 2)
+                if spec["styles"]:
+                    cell.number_format = NUMBER_FORMATS[col % len(NUMBER_FORMATS)]
+                stats["cells"] += 1
+
+        # Data validations on random grid cells
+        for _ in range(spec["data_validations"]):
+            target = f"{get_column_letter(rng.randint(2, columns))}{rng.randint(2, rows + 1)}"
+            validation = DataValidation(type="decimal", operator="between", formula1="0", formula2="100000",
+                                        error="Value out of range", prompt="Enter an amount")
+            worksheet.add_data_validation(validation)
+            validation.add(target)
+            stats["validations"] += 1
+
+    # Named ranges spread across sheets
+    for i in range(spec["named_ranges"]):
+        title = sheet_titles[i % len(sheet_titles)]
+        col = get_column_letter(rng.randint(2, columns))
+        row = rng.randint(2, rows + 1)
+        name = f"Input_{i + 1}"
+        workbook.defined_names[name] = DefinedName(name, attr_text=f"'{title}'!${col}${row}")
+        stats["named_ranges"] += 1
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    workbook.save(output_path)
+    stats["file_size"] = output_path.stat().st_size
+    return stats
@@ -0,0 +1,95 @@
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Any, Optional, Tuple
+
+from openpyxl.cell.cell import Cell
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.constants import SHEET_MAIN_NS
+
+CALC_CHAIN_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+MAIN = f"{{{SHEET_MAIN_NS}}}"
+
+
+def parse_calc_chain(xml: bytes) -> List[Tuple[int, int, int]]:
+    """
+    Parse a calcChain part into (sheet id, row, column) entries in calculation order.
+
+    An entry without an i attribute belongs to the same sheet as the one before it.
+    """
+    root = ET.fromstring(xml)
+    entries = []
+    sheet_id = 0
+    for cell in root.iter(f"{MAIN}c"):
+        if cell.get("i") is not None:
+            sheet_id = int(cell.get("i"))
+        row, column = coordinate_to_tuple(cell.get("r"))
+        entries.append((sheet_id, row, column))
+    return entries
+
+
+def read_calc_chain(filename: Any) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+    """
+    Read the workbook's calculation chain from the package.
+
+    Returns {sheet title: [(row, column), ...]} in the order Excel last
+    calculated the formulas, or None when the package has no calcChain part
+    (files written by openpyxl and most other tools), in which case formula
+    cells have to be found by scanning the sheets.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        names = set(archive.namelist())
+        workbook_part = get_dependents(archive, "_rels/.rels").find(OFFICE_DOCUMENT_REL)
+        workbook_path = next(workbook_part).target
+        workbook_rels = get_dependents(archive, get_rels_path(workbook_path))
+        chain_part = next((rel.target for rel in workbook_rels.find(CALC_CHAIN_REL) if rel.target in names), None)
+        if chain_part is None:
+            return None
+
+        workbook = ET.fromstring(archive.read(workbook_path))
+        titles = {int(sheet.get("sheetId")): sheet.get("name") for sheet in workbook.iter(f"{MAIN}sheet")}
+        chain = {title: [] for title in titles.values()}
+        for sheet_id, row, column in parse_calc_chain(archive.read(chain_part)):
+            title = titles.get(sheet_id)
+            if title is not None:
+                chain[title].append((row, column))
+    return chain
+
+
+def get_formula_cells(worksheet: Worksheet) -> List[Cell]:
+    """
+    Return the sheet's formula cells, cached on the worksheet.
+
+    With a calculation chain (see workbook_loader) the cells it lists are
+    fetched in calculation order, without visiting the other cells. A chain
+    left stale by another tool is detected when one of its entries is not a
+    formula cell or when it lists fewer formulas than the loader counted;
+    the stored cells are then scanned and the formulas returned in row order.
+    """
+    formula_cells = getattr(worksheet, 'formula_cells', None)
+    if formula_cells is None:
+        cells = worksheet._cells
+        chain = getattr(worksheet, 'calc_chain', None)
+        formula_cells = None
+        if chain is not None:
+            chained = [cells.get(key) for key in chain]
+            complete = all(cell is not None and cell.data_type == 'f' for cell in chained) and \
+                len(set(chain)) == len(chain)
+            formula_count = getattr(worksheet, 'formula_count', None)
+            if complete and (formula_count is None or formula_count == len(chained)):
+                formula_cells = chained
+        worksheet.formula_cells_in_calc_order = formula_cells is not None
+        if formula_cells is None:
+            formula_cells = sorted((cell for cell in cells.values() if cell.data_type == 'f'),
+                                   key=lambda cell: (cell.row, cell.column))
+        worksheet.formula_cells = formula_cells
+    return formula_cells
+
+
+def in_calculation_order(worksheet: Worksheet) -> bool:
+    """Whether get_formula_cells returns the sheet's formulas in calculation chain order."""
+    get_formula_cells(worksheet)
+    return worksheet.formula_cells_in_calc_order
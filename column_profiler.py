@@ -0,0 +1,201 @@
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.worksheet import Worksheet
+
+from region_detector import get_type_grid
+
+TIME_AXIS_KEYWORDS = ["year", "month", "quarter", "period", "date", "week", "day", "fy"]
+YEAR_RANGE = (1900, 2200)
+MAX_SAMPLE_VALUES = 3
+
+# pandas.api.types.infer_dtype results mapped to profile types
+INFERRED_TYPES = {
+    "integer": "number",
+    "floating": "number",
+    "mixed-integer-float": "number",
+    "decimal": "number",
+    "datetime": "date",
+    "datetime64": "date",
+    "date": "date",
+    "time": "time",
+    "boolean": "boolean",
+    "string": "text",
+    "empty": "empty",
+}
+
+_is_formula_text = np.frompyfunc(lambda value: isinstance(value, str) and value.startswith('='), 1, 1)
+
+
+def table_data_bounds(table: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """Return the data rows below a table's header rows, or None if it has none."""
+    min_row = table["start_row"] + table.get("header_rows", 1)
+    max_row = table["start_row"] + table.get("row_count", 1) - 1
+    if max_row < min_row:
+        return None
+    return {"min_row": min_row, "max_row": max_row, "min_col": table["start_col"], "max_col": table["end_col"]}
+
+
+def load_block(worksheet: Worksheet, min_row: int, max_row: int, min_col: int,
+               max_col: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Read a rectangular region into an object DataFrame in one pass.
+
+    Formula cells are replaced by their cached results when the workbook was
+    loaded through workbook_loader; the returned boolean array marks formulas.
+    """
+    rows = list(worksheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col,
+                                    max_col=max_col, values_only=True))
+    block = np.empty((len(rows), max_col - min_col + 1), dtype=object)
+    block[:] = rows
+    formulas = _is_formula_text(block).astype(bool)
+    block[formulas] = None
+
+    # Look up only the block's own formula cells rather than every cached value of the sheet
+    cached_values = getattr(worksheet, 'cached_values', {})
+    for row, column in np.argwhere(formulas):
+        block[row, column] = cached_values.get((int(row) + min_row, int(column) + min_col))
+    return pd.DataFrame(block, dtype=object), formulas
+
+
+def profile_column(name: str, values: pd.Series, formula_mask: np.ndarray) -> Dict[str, Any]:
+    """Compute dtype, nulls, range, cardinality and monotonicity for one column."""
+    count = len(values)
+    non_null = values[values.notna()]
+    inferred = pd.api.types.infer_dtype(non_null, skipna=True) if len(non_null) else "empty"
+    column_type = INFERRED_TYPES.get(inferred, "mixed")
+
+    profile = {
+        "name": name,
+        "type": column_type,
+        "rows": count,
+        "null_ratio": round(1 - len(non_null) / count, 4) if count else 1.0,
+        "formula_ratio": round(float(formula_mask.mean()), 4) if count else 0.0,
+        "distinct": int(non_null.nunique()) if len(non_null) else 0,
+        "min": None,
+        "max": None,
+        "monotonic": None,
+        "time_axis": False,
+        "samples": [str(v) for v in pd.unique(non_null)[:MAX_SAMPLE_VALUES]]
+    }
+
+    ordered = None
+    if column_type in ("number", "mixed"):
+        # Mixed columns are usually numbers with a stray label such as "Total"
+        ordered = pd.to_numeric(non_null, errors='coerce').dropna().astype(float)
+    elif column_type == "date":
+        ordered = pd.to_datetime(non_null, errors='coerce').dropna()
+    if ordered is not None and len(ordered):
+        profile["min"] = ordered.min()
+        profile["max"] = ordered.max()
+        if len(ordered) < 2 or ordered.nunique() < 2:
+            pass
+        elif ordered.is_monotonic_increasing:
+            profile["monotonic"] = "increasing"
+        elif ordered.is_monotonic_decreasing:
+            profile["monotonic"] = "decreasing"
+        profile["time_axis"] = is_time_axis(name, column_type, ordered, profile)
+        if column_type != "date":
+            profile["min"] = float(profile["min"])
+            profile["max"] = float(profile["max"])
+        else:
+            profile["min"] = profile["min"].isoformat()
+            profile["max"] = profile["max"].isoformat()
+    return profile
+
+
+def is_time_axis(name: str, column_type: str, ordered: pd.Series, profile: Dict[str, Any]) -> bool:
+    """A strictly increasing date, year or period-labelled column is treated as a time axis."""
+    if profile["monotonic"] != "increasing" or ordered.nunique() != len(ordered) or len(ordered) < 2:
+        return False
+    if column_type == "date":
+        return True
+    values = ordered.to_numpy()
+    whole = bool(np.all(np.mod(values, 1) == 0))
+    if whole and YEAR_RANGE[0] <= float(values[0]) and float(values[-1]) <= YEAR_RANGE[1]:
+        return True
+    header = str(name).lower()
+    return whole and any(keyword in header for keyword in TIME_AXIS_KEYWORDS)
+
+
+def profile_table(worksheet: Worksheet, table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Profile every column of a detected table's data rows."""
+    bounds = table_data_bounds(table)
+    if not bounds:
+        return []
+    frame, formulas = load_block(worksheet, **bounds)
+    headers = table.get("headers") or []
+    profiles = []
+    for offset in range(frame.shape[1]):
+        name = headers[offset] if offset < len(headers) else \
+            f"Column_{get_column_letter(bounds['min_col'] + offset)}"
+        profiles.append(profile_column(name, frame[offset], formulas[:, offset]))
+    return profiles
+
+
+def profile_tables(worksheet: Worksheet, tables: List[Dict[str, Any]]) -> None:
+    """Attach column profiles to each table and replace header cell types with column types."""
+    for table in tables:
+        bounds = table_data_bounds(table)
+        table["columns"] = profile_table(worksheet, table)
+        if bounds and table["columns"]:
+            table["data_range"] = (f"{get_column_letter(bounds['min_col'])}{bounds['min_row']}:"
+                                   f"{get_column_letter(bounds['max_col'])}{bounds['max_row']}")
+            table["types"] = [column["type"] for column in table["columns"]]
+    worksheet.profiled_tables = tables
+    worksheet.profiled_mask = build_profiled_mask(worksheet, tables)
+
+
+def build_profiled_mask(worksheet: Worksheet, tables: List[Dict[str, Any]]) -> np.ndarray:
+    """Build a mask over the type grid of the data cells of profiled tables."""
+    mask = np.zeros(get_type_grid(worksheet).shape, dtype=bool)
+    for table in tables:
+        bounds = table_data_bounds(table)
+        if bounds and table.get("columns"):
+            mask[bounds["min_row"] - 1:bounds["max_row"], bounds["min_col"] - 1:bounds["max_col"]] = True
+    return mask
+
+
+def get_profiled_mask(worksheet: Worksheet, tables: List[Dict[str, Any]]) -> np.ndarray:
+    """Return the profiled-cell mask of these tables, reusing the one profile_tables built for them."""
+    if getattr(worksheet, 'profiled_tables', None) is not tables:
+        worksheet.profiled_tables = tables
+        worksheet.profiled_mask = build_profiled_mask(worksheet, tables)
+    return worksheet.profiled_mask
+
+
+def is_profiled_cell(worksheet: Worksheet, tables: List[Dict[str, Any]], row: int, column: int) -> bool:
+    """Check whether a cell lies in the data rows of a profiled table."""
+    mask = get_profiled_mask(worksheet, tables)
+    return row <= mask.shape[0] and column <= mask.shape[1] and bool(mask[row - 1, column - 1])
+
+
+def format_column_profiles(columns: List[Dict[str, Any]]) -> str:
+    """Render column profiles as a compact markdown table."""
+    lines = [
+        "| Column | Type | Nulls | Distinct | Min | Max | Notes |",
+        "|--------|------|-------|----------|-----|-----|-------|"
+    ]
+    for column in columns:
+        notes = []
+        if column["time_axis"]:
+            notes.append("time axis")
+        elif column["monotonic"]:
+            notes.append(column["monotonic"])
+        if column["formula_ratio"]:
+            notes.append(f"{column['formula_ratio']:.0%} formulas")
+        if column["type"] in ("text", "mixed") and column["samples"]:
+            notes.append("e.g. " + ", ".join(column["samples"]))
+        cells = [
+            str(column["name"]),
+            column["type"],
+            f"{column['null_ratio']:.0%}",
+            str(column["distinct"]),
+            "" if column["min"] is None else str(column["min"]),
+            "" if column["max"] is None else str(column["max"]),
+            "; ".join(notes)
+        ]
+        lines.append("| " + " | ".join(cell.replace('|', '\\|') for cell in cells) + " |")
+    return "\n".join(lines) + "\n"
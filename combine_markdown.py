@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from markdown_index import write_section_index
 
 def combine_markdown_files(input_dir: str, output_filename: str = "combined_workbook.md") -> str:
     """
@@ -57,6 +58,9 @@ def combine_markdown_files(input_dir: str, output_filename: str = "combined_work
                     content = '\n'.join(content_lines[1:])
                 outfile.write(content.strip() + '\n')
     
+    # Index section offsets so large combined files can be previewed page by page
+    write_section_index(str(output_path))
+    
     return str(output_path)
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Any, Optional, Tuple
+
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.constants import COMMENTS_NS, SHEET_MAIN_NS, REL_NS
+
+THREADED_COMMENTS_REL = "http://schemas.microsoft.com/office/2017/10/relationships/threadedComment"
+PERSONS_REL = "http://schemas.microsoft.com/office/2017/10/relationships/person"
+THREADED_NS = "http://schemas.microsoft.com/office/spreadsheetml/2018/threadedcomments"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+MAIN = f"{{{SHEET_MAIN_NS}}}"
+THREADED = f"{{{THREADED_NS}}}"
+
+# A note is {"author": str or None, "text": str, "replies": [{"author", "text"}]}
+CellNotes = Dict[Tuple[int, int], Dict[str, Any]]
+
+
+def _rich_text(element: ET.Element) -> str:
+    """Concatenate the <t> runs of a comment's <text> element."""
+    return "".join(node.text or "" for node in element.iter(f"{MAIN}t"))
+
+
+def parse_legacy_comments(xml: bytes) -> CellNotes:
+    """Parse a comments part (notes in current Excel) into a coordinate-keyed map."""
+    root = ET.fromstring(xml)
+    authors = [author.text for author in root.iter(f"{MAIN}author")]
+    notes = {}
+    for comment in root.iter(f"{MAIN}comment"):
+        author_id = int(comment.get("authorId", -1))
+        text = comment.find(f"{MAIN}text")
+        notes[coordinate_to_tuple(comment.get("ref"))] = {
+            "author": authors[author_id] if 0 <= author_id < len(authors) else None,
+            "text": _rich_text(text).strip() if text is not None else "",
+            "replies": []
+        }
+    return notes
+
+
+def parse_threaded_comments(xml: bytes, persons: Dict[str, str]) -> CellNotes:
+    """Parse a threadedComments part, folding replies into the thread's first comment."""
+    root = ET.fromstring(xml)
+    notes = {}
+    threads = {}
+    for comment in root.iter(f"{THREADED}threadedComment"):
+        text = comment.findtext(f"{THREADED}text", "").strip()
+        author = persons.get(comment.get("personId"))
+        parent = comment.get("parentId")
+        if parent and parent in threads:
+            threads[parent]["replies"].append({"author": author, "text": text})
+            continue
+        note = {"author": author, "text": text, "replies": []}
+        threads[comment.get("id")] = note
+        notes[coordinate_to_tuple(comment.get("ref"))] = note
+    return notes
+
+
+def parse_persons(xml: bytes) -> Dict[str, str]:
+    root = ET.fromstring(xml)
+    return {person.get("id"): person.get("displayName") for person in root.iter(f"{THREADED}person")}
+
+
+def read_comments(filename: Any) -> Dict[str, CellNotes]:
+    """
+    Read every sheet's notes and threaded comments straight from the package.
+
+    Returns {sheet title: {(row, column): note}}. Threaded comments replace the
+    placeholder note Excel writes for them in the legacy comments part.
+    """
+    comments = {}
+    with zipfile.ZipFile(filename) as archive:
+        names = set(archive.namelist())
+        workbook_part = get_dependents(archive, "_rels/.rels").find(OFFICE_DOCUMENT_REL)
+        workbook_path = next(workbook_part).target
+        workbook_rels = get_dependents(archive, get_rels_path(workbook_path))
+
+        persons = {}
+        for rel in workbook_rels.find(PERSONS_REL):
+            if rel.target in names:
+                persons.update(parse_persons(archive.read(rel.target)))
+
+        workbook = ET.fromstring(archive.read(workbook_path))
+        for sheet in workbook.iter(f"{MAIN}sheet"):
+            rel = workbook_rels.get(sheet.get(f"{{{REL_NS}}}id"))
+            rels_path = get_rels_path(rel.target) if rel else None
+            if rels_path not in names:
+                continue
+            sheet_rels = get_dependents(archive, rels_path)
+            notes = {}
+            for part in sheet_rels.find(COMMENTS_NS):
+                if part.target in names:
+                    notes.update(parse_legacy_comments(archive.read(part.target)))
+            for part in sheet_rels.find(THREADED_COMMENTS_REL):
+                if part.target in names:
+                    notes.update(parse_threaded_comments(archive.read(part.target), persons))
+            if notes:
+                comments[sheet.get("name")] = notes
+    return comments
+
+
+def get_cell_notes(worksheet: Worksheet) -> CellNotes:
+    """
+    Return the sheet's notes keyed by (row, column).
+
+    Workbooks opened through workbook_loader carry the map read from the
+    package; otherwise it is collected once from the cells' comments.
+    """
+    notes = getattr(worksheet, 'cell_notes', None)
+    if notes is None:
+        notes = {
+            (cell.row, cell.column): {"author": cell.comment.author, "text": cell.comment.text, "replies": []}
+            for cell in worksheet._cells.values() if cell.comment
+        }
+        worksheet.cell_notes = notes
+    return notes
+
+
+def get_cell_note(worksheet: Worksheet, row: int, column: int) -> Optional[Dict[str, Any]]:
+    return get_cell_notes(worksheet).get((row, column))
+
+
+def format_note(note: Dict[str, Any]) -> str:
+    """Render a note and its replies on one line."""
+    parts = [f"{note['author']}: {note['text']}" if note["author"] else note["text"]]
+    for reply in note["replies"]:
+        parts.append(f"{reply['author']}: {reply['text']}" if reply["author"] else reply["text"])
+    return " / ".join(part.replace("\n", " ") for part in parts)
+
+
+def notes_summary(worksheet: Worksheet) -> List[Dict[str, Any]]:
+    """List a sheet's notes in row order for the markdown output."""
+    return [
+        {"cell": f"{get_column_letter(column)}{row}", "note": format_note(note)}
+        for (row, column), note in sorted(get_cell_notes(worksheet).items())
+    ]
@@ -1,10 +1,19 @@
 import os
-from flask import Flask, request, render_template, flash, redirect, url_for, send_file, jsonify
+from flask import Flask, request, render_template, flash, redirect, url_for, send_file, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from enhanced_excel_converter import EnhancedExcelConverter
+from workbook_loader import WORKBOOK_EXTENSIONS
 from dotenv import load_dotenv
 import json
 from pathlib import Path
+from markdown_index import load_section_index, read_section, list_sections, is_index_file
+from artifact_compression import select_encoded_file, is_compressed_sidecar, collect_bundle_files, stream_zip
+from result_cache import ResultCache, save_upload_with_hash
+from analysis_store import AnalysisStore, DETAIL_QUERIES, DEFAULT_PAGE_ROWS
+from pipeline_metrics import REGISTRY
+from streaming_output import follow_file, sse_event, is_streaming_marker, mark_report_current
+import mimetypes
 
 # Load environment variables
 load_dotenv()
@@ -13,17 +22,30 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this to a secure secret key
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 app.config['OUTPUT_ROOT'] = os.path.join(os.getcwd(), 'OUTPUT')
+app.config['RESULT_CACHE_ROOT'] = os.path.join(os.getcwd(), 'result_cache')
+app.config['ANALYSIS_STORE_PATH'] = os.path.join(os.getcwd(), 'analysis_store.db')
 app.config['GOOGLE_API_KEY'] = os.getenv('GOOGLE_API_KEY')
 
-if not app.config['GOOGLE_API_KEY']:
+app.config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')
+
+if not app.config['GOOGLE_API_KEY'] and app.config['LLM_BACKEND'] == 'gemini':
     raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
 # Ensure upload and output directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_ROOT'], exist_ok=True)
 
+result_cache = ResultCache(app.config['RESULT_CACHE_ROOT'])
+analysis_store = AnalysisStore(app.config['ANALYSIS_STORE_PATH'])
+
+# Documents that can be followed live while they are generated
+STREAM_DOCUMENTS = {
+    'user_guide': 'llm_analysis_report.md',
+    'prd': 'software_prd.md'
+}
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'xlsx'
+    return '.' in filename and '.' + filename.rsplit('.', 1)[1].lower() in WORKBOOK_EXTENSIONS
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
@@ -46,29 +68,53 @@ def upload_file():
         
         if file and allowed_file(file.filename):
             try:
-                # Save uploaded file
+                # Save uploaded file under its content hash
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filepath, content_hash = save_upload_with_hash(file, app.config['UPLOAD_FOLDER'], filename)
                 
                 # Process Excel file with enhanced converter
                 output_path = os.path.join(app.config['OUTPUT_ROOT'], output_directory)
                 os.makedirs(output_path, exist_ok=True)
+                workbook_dir = os.path.join(output_path, Path(filepath).stem)
+                conversion_options = {'generate_prd': generate_prd, 'llm_backend': app.config['LLM_BACKEND']}
                 
                 try:
-                    # Initialize enhanced converter
-                    converter = EnhancedExcelConverter(
-                        input_path=filepath,
-                        output_dir=output_path,
-                        api_key=app.config['GOOGLE_API_KEY'],
-                        generate_prd=generate_prd
-                    )
-                    converter.convert_all()
+                    cached_entry = result_cache.lookup(content_hash, conversion_options)
+                    if cached_entry:
+                        # Identical workbook already converted with the same options
+                        REGISTRY.inc("cache_hits")
+                        result_cache.materialize(cached_entry, workbook_dir)
+                        # The copied reports keep the cached run's times; followers of this upload must see them as new
+                        for report_name in STREAM_DOCUMENTS.values():
+                            mark_report_current(os.path.join(workbook_dir, report_name))
+                        try:
+                            # The same results are already stored unless the store was reset since
+                            if not analysis_store.has_workbook(workbook_dir):
+                                analysis_store.import_workbook_dir(workbook_dir)
+                        except Exception as e:
+                            print(f"Error storing cached analysis for {filename}: {str(e)}")
+                        print(f"Reused cached results for {filename} ({content_hash[:12]})")
+                    else:
+                        REGISTRY.inc("cache_misses")
+                        # Initialize enhanced converter
+                        converter = EnhancedExcelConverter(
+                            input_path=filepath,
+                            output_dir=output_path,
+                            api_key=app.config['GOOGLE_API_KEY'],
+                            generate_prd=generate_prd,
+                            analysis_store=analysis_store
+                        )
+                        converter.convert_all()
+                        
+                        if is_conversion_complete(workbook_dir, generate_prd):
+                            result_cache.store(content_hash, conversion_options, workbook_dir)
                     
                     # Get processing results for display
                     results = get_processing_results(output_path)
                     
                     success_message = 'File successfully processed!'
+                    if cached_entry:
+                        success_message = 'Identical workbook found, reused previous results!'
                     if generate_prd:
                         success_message += ' PRD document generated.'
                     
@@ -83,7 +129,7 @@ def upload_file():
                 flash(f'Error saving file: {str(e)}', 'error')
                 return redirect(request.url)
         else:
-            flash('Invalid file type. Please upload an Excel file (.xlsx)', 'error')
+            flash('Invalid file type. Please upload an Excel file (.xlsx, .xlsm or .xlsb)', 'error')
             return redirect(request.url)
             
     return render_template('enhanced_upload.html')
@@ -109,32 +155,84 @@ def get_analysis_api(output_dir):
     results = get_processing_results(output_path)
     return jsonify(results)
 
+@app.route('/api/workbook/<output_dir>/<workbook>')
+def get_workbook_api(output_dir, workbook):
+    """API endpoint for a workbook's totals and per-sheet metrics from the analysis store."""
+    workbook_path = safe_join(app.config['OUTPUT_ROOT'], output_dir, workbook)
+    overview = analysis_store.workbook_overview(workbook_path) if workbook_path else None
+    if overview is None:
+        return jsonify({'error': 'Workbook not found'}), 404
+    return jsonify(overview)
+
+@app.route('/api/workbook/<output_dir>/<workbook>/<sheet>/<kind>')
+def get_sheet_details_api(output_dir, workbook, sheet, kind):
+    """API endpoint for a page of a sheet's cells, formulas, dependencies, tables or validations."""
+    if kind not in DETAIL_QUERIES:
+        return jsonify({'error': f'Unknown detail type: {kind}'}), 404
+    workbook_path = safe_join(app.config['OUTPUT_ROOT'], output_dir, workbook)
+    limit = request.args.get('limit', DEFAULT_PAGE_ROWS, type=int)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    details = analysis_store.sheet_details(workbook_path, sheet, kind, request.args.to_dict(), limit, offset) \
+        if workbook_path else None
+    if details is None:
+        return jsonify({'error': 'Sheet not found'}), 404
+    return jsonify(details)
+
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    """Download generated files."""
+    """Download generated files (supports HTTP Range requests)."""
     try:
-        file_path = os.path.join(app.config['OUTPUT_ROOT'], filename)
-        if not os.path.exists(file_path):
+        file_path = resolve_output_file(filename)
+        if not file_path:
             flash('File not found', 'error')
             return redirect(url_for('upload_file'))
         
-        return send_file(file_path, as_attachment=True)
+        # Serve a pre-compressed sidecar when the client accepts its encoding
+        accepted = [encoding for encoding in ('zstd', 'gzip') if request.accept_encodings[encoding]]
+        serve_path, encoding = select_encoded_file(file_path, accepted)
+        response = send_file(serve_path,
+                             as_attachment=True,
+                             download_name=os.path.basename(file_path),
+                             mimetype=mimetypes.guess_type(file_path)[0] or 'application/octet-stream',
+                             conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
     except Exception as e:
         flash(f'Error downloading file: {str(e)}', 'error')
         return redirect(url_for('upload_file'))
 
+@app.route('/download_bundle/<path:dirname>')
+def download_bundle(dirname):
+    """Stream all outputs of a run or workbook directory as a zip archive."""
+    dir_path = safe_join(app.config['OUTPUT_ROOT'], dirname)
+    if not dir_path or not os.path.isdir(dir_path):
+        flash('Output directory not found', 'error')
+        return redirect(url_for('upload_file'))
+    
+    files = collect_bundle_files(dir_path)
+    archive_name = secure_filename(os.path.basename(os.path.normpath(dir_path))) or 'outputs'
+    return Response(stream_with_context(stream_zip(files)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{archive_name}.zip"'})
+
 @app.route('/preview/<path:filename>')
 def preview_file(filename):
-    """Preview markdown files in the browser."""
+    """Preview one section of a markdown or JSON file in the browser."""
     try:
-        file_path = os.path.join(app.config['OUTPUT_ROOT'], filename)
-        if not os.path.exists(file_path):
+        file_path = resolve_output_file(filename)
+        if not file_path:
             flash('File not found', 'error')
             return redirect(url_for('upload_file'))
         
-        # Read file content
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Only the requested section is read; the offset index avoids loading the whole file
+        index = load_section_index(file_path)
+        sections = list_sections(index)
+        section_number = request.args.get('section', 0, type=int)
+        if sections and not 0 <= section_number < len(sections):
+            section_number = 0
+        content = read_section(file_path, index, section_number) or ""
         
         # Determine file type for proper rendering
         file_ext = Path(filename).suffix.lower()
@@ -142,11 +240,70 @@ def preview_file(filename):
         return render_template('preview.html', 
                              content=content, 
                              filename=filename, 
-                             file_type=file_ext)
+                             file_type=file_ext,
+                             sections=sections,
+                             section_number=section_number)
     except Exception as e:
         flash(f'Error previewing file: {str(e)}', 'error')
         return redirect(url_for('upload_file'))
 
+@app.route('/api/preview/<path:filename>')
+def preview_file_api(filename):
+    """API endpoint returning the section index of a file, or a single section."""
+    file_path = resolve_output_file(filename)
+    if not file_path:
+        return jsonify({'error': 'File not found'}), 404
+    
+    index = load_section_index(file_path)
+    sections = list_sections(index)
+    section_number = request.args.get('section', type=int)
+    if section_number is None:
+        return jsonify({
+            'file': filename,
+            'size': index['size'],
+            'section_count': len(sections),
+            'sections': sections
+        })
+    
+    content = read_section(file_path, index, section_number)
+    if content is None:
+        return jsonify({'error': 'Section not found'}), 404
+    
+    return jsonify({
+        'file': filename,
+        'section': sections[section_number],
+        'section_count': len(sections),
+        'content': content
+    })
+
+@app.route('/api/stream/<output_dir>')
+def stream_document(output_dir):
+    """Server-sent events carrying a report's text as the LLM generates it."""
+    document = request.args.get('document', 'user_guide')
+    filename = secure_filename(request.args.get('file', ''))
+    if document not in STREAM_DOCUMENTS or not filename:
+        return jsonify({'error': 'Unknown document'}), 400
+    
+    file_path = safe_join(app.config['OUTPUT_ROOT'], output_dir, Path(filename).stem, STREAM_DOCUMENTS[document])
+    if not file_path:
+        return jsonify({'error': 'Invalid path'}), 400
+    
+    # Only follow a report written after the upload started, not one left from an earlier run
+    since = request.args.get('since', 0, type=float)
+    
+    def events():
+        for event in follow_file(file_path, since=since):
+            yield sse_event(event)
+        yield sse_event({'document': document}, event='done')
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint with pipeline stage timings and counters."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/compare/<output_dir>')
 def compare_documents(output_dir):
     """Compare generated documents (user guide vs PRD)."""
@@ -187,6 +344,21 @@ def compare_documents(output_dir):
                          prd=prd_content,
                          output_dir=output_dir)
 
+def is_conversion_complete(workbook_dir, generate_prd):
+    """Check that a workbook produced every document it was asked for."""
+    if not os.path.exists(os.path.join(workbook_dir, 'llm_analysis_report.md')):
+        return False
+    if generate_prd and not os.path.exists(os.path.join(workbook_dir, 'software_prd.md')):
+        return False
+    return True
+
+def resolve_output_file(filename):
+    """Resolve a path relative to the output root, rejecting traversal outside it."""
+    file_path = safe_join(app.config['OUTPUT_ROOT'], filename)
+    if not file_path or not os.path.isfile(file_path):
+        return None
+    return file_path
+
 def get_processing_results(output_path):
     """Extract processing results and metadata from output directory."""
     results = {
@@ -215,8 +387,11 @@ def get_processing_results(output_path):
         # List all files in output directory
         for root, dirs, files in os.walk(output_path):
             for file in files:
+                if is_index_file(file) or is_compressed_sidecar(file) or is_streaming_marker(file):
+                    continue
                 file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, output_path)
+                # Paths are relative to the output root, matching the download/preview routes
+                relative_path = os.path.relpath(file_path, app.config['OUTPUT_ROOT']).replace(os.sep, '/')
                 file_size = os.path.getsize(file_path)
                 
                 results['files'].append({
@@ -246,6 +421,21 @@ def analyze_workbook_directory(workbook_path, workbook_name):
     }
     
     try:
+        # Workbooks converted by this app are answered from the analysis store
+        overview = analysis_store.workbook_overview(workbook_path)
+        if overview:
+            workbook_data['has_enhanced_summary'] = os.path.exists(
+                os.path.join(workbook_path, 'enhanced_workbook_summary.md'))
+            workbook_data['complexity_rating'] = overview['complexity_rating']
+            workbook_data['implementation_estimates'] = {
+                'ui_components': overview['ui_components'],
+                'business_rules': overview['business_rules'],
+                'complexity_score': overview['complexity_score']
+            }
+            workbook_data['sheets'] = [f"{sheet['file_stem']}.md" for sheet in overview['sheets']]
+            workbook_data['sheet_count'] = len(workbook_data['sheets'])
+            return workbook_data
+
         # Read enhanced summary if available
         summary_path = os.path.join(workbook_path, 'enhanced_workbook_summary.md')
         if os.path.exists(summary_path):
@@ -260,6 +450,7 @@ def analyze_workbook_directory(workbook_path, workbook_name):
                                                          'workbook_summary.md',
                                                          'llm_analysis_report.md',
                                                          'software_prd.md',
+                                                         'vba_modules.md',
                                                          'combined_enhanced_workbook.md']]
         workbook_data['sheet_count'] = len(sheet_files)
         workbook_data['sheets'] = sheet_files
@@ -344,6 +535,8 @@ def get_file_type(filename):
         '.md': 'Markdown',
         '.json': 'JSON Data',
         '.xlsx': 'Excel Workbook',
+        '.xlsm': 'Excel Macro-Enabled Workbook',
+        '.xlsb': 'Excel Binary Workbook',
         '.pdf': 'PDF Document',
         '.html': 'HTML Document',
         '.txt': 'Text File'
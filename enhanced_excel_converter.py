@@ -1,25 +1,60 @@
 import pandas as pd
+import numpy as np
 import openpyxl
 from pathlib import Path
 import json
 import re
 from openpyxl.utils import get_column_letter, range_boundaries
 from openpyxl.worksheet.worksheet import Worksheet
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 from datetime import datetime
 from combine_markdown import combine_markdown_files
+from markdown_index import write_section_index, load_section_index
+from vba_extractor import code_modules, write_vba_markdown
+from workbook_loader import WORKBOOK_EXTENSIONS, load_workbook, get_cached_value
+from region_detector import detect_regions, get_type_grid, CELL_TEXT
+from keyword_matcher import get_keyword_matcher
+from label_index import get_label_index
+from validation_index import get_validation_index
+from comments_extractor import get_cell_note, get_cell_notes, format_note, notes_summary
+from named_ranges import get_named_range_index, label_names
+from calc_chain import get_formula_cells, in_calculation_order
+from formula_catalog import (FUNCTION_CATALOG, FORMULA_SECTION_KEYS, formula_functions, function_categories,
+                             is_cross_sheet, count_category)
+from column_profiler import profile_tables, format_column_profiles
+from sheet_sampler import get_sheet_sample, format_sampling
+from structure_compressor import get_repeated_structure, format_repeated_structure
+from artifact_compression import compress_output_directory
+from analysis_store import AnalysisStore
+from pipeline_metrics import JobMetrics, slowest_stages
 from llm_analyzer import LLMAnalyzer
 from prd_generator import PRDGenerator
+from llm_backends import LLMBackend, create_backend
 import os
 
 class EnhancedExcelConverter:
-    def __init__(self, input_path: str, output_dir: str, api_key: str, generate_prd: bool = True):
+    def __init__(self, input_path: str, output_dir: str, api_key: str, generate_prd: bool = True,
+                 llm_backend: Optional[LLMBackend] = None, stream_reports: bool = True,
+                 analysis_store: Optional[AnalysisStore] = None):
         self.input_path = Path(input_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.llm_analyzer = LLMAnalyzer(api_key)
-        self.prd_generator = PRDGenerator(api_key) if generate_prd else None
+        # One backend instance is shared by the user guide and PRD generators
+        self.llm_backend = llm_backend or create_backend(api_key)
+        self.llm_analyzer = LLMAnalyzer(api_key, backend=self.llm_backend)
+        self.prd_generator = PRDGenerator(
+            api_key,
+            backend=self.llm_backend,
+            synthesis_fan_in=int(os.getenv('PRD_SYNTHESIS_FAN_IN', '4'))
+        ) if generate_prd else None
         self.generate_prd = generate_prd
+        # Write the user guide and PRD to disk as tokens arrive instead of after the last call
+        self.stream_reports = stream_reports
+        # Sheet analyses are also loaded into this store so the web app can query them without the JSON files
+        self.analysis_store = analysis_store
+        self.metrics = JobMetrics(self.input_path.stem)
+        self.workbook_metrics = {}
+        self.keywords = get_keyword_matcher()
 
     def infer_cell_type(self, cell: openpyxl.cell.Cell) -> str:
         """Infer the type of data in a cell."""
@@ -54,93 +89,107 @@ class EnhancedExcelConverter:
             "data_flow_maps": []
         }
         
-        # Identify input sections (cells with data validation or specific styling)
-        for row in worksheet.iter_rows():
-            for cell in row:
-                # Check if cell has data_validation attribute and it's not None
-                if hasattr(cell, 'data_validation') and cell.data_validation and hasattr(cell.data_validation, 'type') and cell.data_validation.type:
-                    patterns["input_sections"].append({
-                        "cell": f"{get_column_letter(cell.column)}{cell.row}",
-                        "validation_type": cell.data_validation.type,
-                        "validation_formula": str(cell.data_validation.formula1) if hasattr(cell.data_validation, 'formula1') and cell.data_validation.formula1 else None,
-                        "value": cell.value,
-                        "comment": cell.comment.text if cell.comment else None
-                    })
+        # Identify input sections (validated ranges, one per range rather than per cell)
+        for entry in get_validation_index(worksheet).input_ranges():
+            validation = entry["rule"]
+            row, column = entry["first_input"]
+            # Read without worksheet.cell(), which would add empty cells
+            cell = worksheet._cells.get((row, column))
+            note = get_cell_note(worksheet, row, column)
+            patterns["input_sections"].append({
+                "cell": entry["address"],
+                "input_cells": entry["input_cells"],
+                "validation_type": validation.type,
+                "validation_formula": str(validation.formula1) if validation.formula1 else None,
+                "value": cell.value if cell is not None and entry["input_cells"] == 1 else None,
+                "comment": format_note(note) if note else None
+            })
         
         # Identify calculation engines (complex formula patterns)
         calculation_areas = []
-        for row in worksheet.iter_rows():
-            formula_density = sum(1 for cell in row if cell.data_type == 'f')
+        formula_rows = {}
+        structure = get_repeated_structure(worksheet)
+        for cell in get_formula_cells(worksheet):
+            if structure.is_repeated(cell.row, cell.column):
+                continue
+            formula_rows.setdefault(cell.row, []).append(cell)
+        for row_number in sorted(formula_rows):
+            row_cells = sorted(formula_rows[row_number], key=lambda cell: cell.column)
+            formula_density = len(row_cells)
             if formula_density > 3:  # High formula density indicates calculation area
                 calc_area = {
-                    "row": row[0].row,
+                    "row": row_number,
                     "formula_count": formula_density,
                     "formulas": []
                 }
-                for cell in row:
-                    if cell.data_type == 'f':
-                        calc_area["formulas"].append({
-                            "cell": f"{get_column_letter(cell.column)}{cell.row}",
-                            "formula": str(cell.value),
-                            "category": self.categorize_formula(str(cell.value))
-                        })
+                for cell in row_cells:
+                    calc_area["formulas"].append({
+                        "cell": f"{get_column_letter(cell.column)}{cell.row}",
+                        "formula": str(cell.value),
+                        "category": self.categorize_formula(str(cell.value))
+                    })
                 calculation_areas.append(calc_area)
         
         patterns["calculation_engines"] = calculation_areas
         
         # Identify output dashboards (formatted sections with charts/summaries)
-        dashboard_indicators = ["summary", "dashboard", "report", "total", "analysis"]
-        for row in worksheet.iter_rows():
-            for cell in row:
-                if cell.value and isinstance(cell.value, str):
-                    cell_text = cell.value.lower()
-                    if any(indicator in cell_text for indicator in dashboard_indicators):
-                        if cell.font and (cell.font.bold or cell.font.size > 12):
-                            patterns["output_dashboards"].append({
-                                "cell": f"{get_column_letter(cell.column)}{cell.row}",
-                                "title": cell.value,
-                                "area_start": f"{get_column_letter(cell.column)}{cell.row}"
-                            })
+        for row_idx, col_idx in np.argwhere(get_type_grid(worksheet) == CELL_TEXT) + 1:
+            cell = worksheet.cell(int(row_idx), int(col_idx))
+            if self.keywords.matches(cell.value, "dashboard", "dashboard"):
+                if cell.font and (cell.font.bold or cell.font.size > 12):
+                    patterns["output_dashboards"].append({
+                        "cell": f"{get_column_letter(cell.column)}{cell.row}",
+                        "title": cell.value,
+                        "area_start": f"{get_column_letter(cell.column)}{cell.row}"
+                    })
         
         return patterns
 
     def extract_data_dependencies(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
         """Extract data flow and dependencies for software architecture design."""
         dependencies = []
-        
-        for row in worksheet.iter_rows():
-            for cell in row:
-                if cell.data_type == 'f' and cell.value:
-                    formula = str(cell.value)
-                    # Extract cell references
-                    cell_refs = re.findall(r'[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?', formula)
-                    sheet_refs = re.findall(r"'?([^'!]+)'?![A-Za-z]+[0-9]+", formula)
-                    
-                    dependency = {
-                        "target_cell": f"{get_column_letter(cell.column)}{cell.row}",
-                        "formula": formula,
-                        "local_dependencies": cell_refs,
-                        "sheet_dependencies": sheet_refs,
-                        "dependency_type": self.classify_dependency_type(formula),
-                        "complexity_score": self.calculate_formula_complexity(formula)
-                    }
-                    dependencies.append(dependency)
+        named_ranges = get_named_range_index(worksheet.parent)
+        structure = get_repeated_structure(worksheet)
+        calc_ordered = in_calculation_order(worksheet)
+        
+        # Formula cells come in calculation order when the workbook has a complete calc chain;
+        # copies of a repeated row or column pattern depend on the same cells as its first instance
+        for cell in get_formula_cells(worksheet):
+            if cell.value and not structure.is_repeated(cell.row, cell.column):
+                formula = str(cell.value)
+                # Extract cell references
+                cell_refs = re.findall(r'[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?', formula)
+                sheet_refs = re.findall(r"'?([^'!]+)'?![A-Za-z]+[0-9]+", formula)
+                
+                dependency = {
+                    "target_cell": f"{get_column_letter(cell.column)}{cell.row}",
+                    "formula": formula,
+                    # Only known from the calc chain; row order says nothing about calculation order
+                    "calculation_order": len(dependencies) + 1 if calc_ordered else None,
+                    "local_dependencies": cell_refs,
+                    "sheet_dependencies": sheet_refs,
+                    "named_dependencies": [entry["name"] for entry in
+                                           named_ranges.referenced_names(formula, worksheet.title)],
+                    "dependency_type": self.classify_dependency_type(formula),
+                    "complexity_score": self.calculate_formula_complexity(formula)
+                }
+                dependencies.append(dependency)
         
         return dependencies
 
     def classify_dependency_type(self, formula: str) -> str:
         """Classify the type of dependency for architecture planning."""
-        formula_upper = formula.upper()
+        categories = function_categories(formula)
         
-        if '!' in formula:
+        if is_cross_sheet(formula):
             return "cross_sheet_reference"
-        elif any(func in formula_upper for func in ["VLOOKUP", "INDEX", "MATCH", "XLOOKUP"]):
+        elif "lookup" in categories:
             return "data_lookup"
-        elif any(func in formula_upper for func in ["SUM", "AVERAGE", "COUNT", "MAX", "MIN"]):
+        elif "aggregation" in categories:
             return "aggregation"
-        elif "IF(" in formula_upper:
+        elif "conditional" in categories:
             return "conditional_logic"
-        elif any(func in formula_upper for func in ["NPV", "IRR", "PMT", "PV", "FV"]):
+        elif "financial" in categories:
             return "financial_calculation"
         else:
             return "simple_calculation"
@@ -150,130 +199,78 @@ class EnhancedExcelConverter:
         score = 0
         score += formula.count('(')  # Function calls
         score += formula.count('!')  # Sheet references
-        score += formula.count('IF') * 2  # Conditional logic is more complex
+        score += count_category(formula, "conditional") * 2  # Conditional logic is more complex
         score += len(re.findall(r'[A-Za-z]+[0-9]+', formula))  # Cell references
         return score
 
     def identify_tables(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
         """Enhanced table identification with business context."""
         tables = []
-        current_table = None
-        
-        for row_idx, row in enumerate(worksheet.iter_rows(), 1):
-            # Look for potential header rows
-            header_candidates = [cell for cell in row if cell.font and cell.font.bold]
-            
-            if header_candidates and len(header_candidates) > 1:
-                # Found potential new table header
-                if current_table:
-                    current_table["row_count"] = row_idx - current_table["start_row"]
-                    tables.append(current_table)
-                
-                # Start new table
-                start_col = min(cell.column for cell in header_candidates)
-                end_col = max(cell.column for cell in header_candidates)
-                headers = []
-                types = []
-                business_context = self.infer_table_business_context(header_candidates)
-                
-                for cell in row[start_col-1:end_col]:
-                    headers.append(str(cell.value) if cell.value else f"Column_{get_column_letter(cell.column)}")
-                    types.append(self.infer_cell_type(cell))
-                
-                current_table = {
-                    "name": headers[0] if headers else f"Table_{len(tables)+1}",
-                    "range": f"{get_column_letter(start_col)}{row_idx}:{get_column_letter(end_col)}{row_idx}",
-                    "headers": headers,
-                    "types": types,
-                    "start_row": row_idx,
-                    "start_col": start_col,
-                    "end_col": end_col,
-                    "business_context": business_context,
-                    "is_input_table": self.is_input_table(headers),
-                    "is_calculation_table": self.is_calculation_table(headers),
-                    "is_output_table": self.is_output_table(headers)
-                }
-        
-        # Close last table if exists
-        if current_table:
-            current_table["row_count"] = worksheet.max_row - current_table["start_row"] + 1
-            tables.append(current_table)
-        
+        for region in detect_regions(worksheet):
+            headers = region["headers"]
+            tables.append({
+                "name": headers[0] if region["header_rows"] else f"Table_{len(tables)+1}",
+                "range": region["range"],
+                "headers": headers,
+                "types": list(region["types"]),
+                "start_row": region["min_row"],
+                "start_col": region["min_col"],
+                "end_col": region["max_col"],
+                "header_rows": region["header_rows"],
+                "row_count": region["max_row"] - region["min_row"] + 1,
+                "business_context": self.infer_table_business_context(headers),
+                "is_input_table": self.is_input_table(headers),
+                "is_calculation_table": self.is_calculation_table(headers),
+                "is_output_table": self.is_output_table(headers)
+            })
         return tables
 
-    def infer_table_business_context(self, header_cells: List) -> str:
+    def infer_table_business_context(self, headers: List[str]) -> str:
         """Infer business context from table headers."""
-        header_texts = [str(cell.value).lower() for cell in header_cells if cell.value]
-        
-        financial_keywords = ["revenue", "cost", "profit", "cash", "balance", "income", "expense"]
-        operational_keywords = ["volume", "units", "quantity", "capacity", "production"]
-        input_keywords = ["assumption", "input", "parameter", "rate", "factor"]
-        output_keywords = ["result", "output", "summary", "total", "forecast"]
-        
-        if any(keyword in ' '.join(header_texts) for keyword in financial_keywords):
-            return "financial"
-        elif any(keyword in ' '.join(header_texts) for keyword in operational_keywords):
-            return "operational"
-        elif any(keyword in ' '.join(header_texts) for keyword in input_keywords):
-            return "input_parameters"
-        elif any(keyword in ' '.join(header_texts) for keyword in output_keywords):
-            return "output_results"
-        else:
-            return "general"
+        header_text = ' '.join(str(header) for header in headers if header)
+        return self.keywords.first_category(header_text, "table_context")
 
     def is_input_table(self, headers: List[str]) -> bool:
         """Determine if this is an input table."""
-        input_indicators = ["input", "assumption", "parameter", "rate", "factor", "variable"]
-        header_text = ' '.join(str(h).lower() for h in headers)
-        return any(indicator in header_text for indicator in input_indicators)
+        return self.keywords.matches(' '.join(str(h) for h in headers), "table_role", "input")
 
     def is_calculation_table(self, headers: List[str]) -> bool:
         """Determine if this is a calculation table."""
-        calc_indicators = ["calculation", "calc", "formula", "computed", "derived"]
-        header_text = ' '.join(str(h).lower() for h in headers)
-        return any(indicator in header_text for indicator in calc_indicators)
+        return self.keywords.matches(' '.join(str(h) for h in headers), "table_role", "calculation")
 
     def is_output_table(self, headers: List[str]) -> bool:
         """Determine if this is an output table."""
-        output_indicators = ["output", "result", "summary", "total", "report", "dashboard"]
-        header_text = ' '.join(str(h).lower() for h in headers)
-        return any(indicator in header_text for indicator in output_indicators)
+        return self.keywords.matches(' '.join(str(h) for h in headers), "table_role", "output")
 
     def categorize_formula(self, formula: str) -> str:
         """Enhanced formula categorization."""
-        formula = formula.upper()
-        if '!' in formula:
+        categories = function_categories(formula)
+        if is_cross_sheet(formula):
             return "external_reference"
-        elif any(agg in formula for agg in ["SUM(", "AVERAGE(", "COUNT(", "MAX(", "MIN("]):
+        elif "aggregation" in categories:
             return "aggregation"
-        elif "IF(" in formula:
+        elif "conditional" in categories:
             return "conditional_logic"
-        elif any(fin in formula for fin in ["NPV(", "IRR(", "PMT(", "PV(", "FV("]):
+        elif "financial" in categories:
             return "financial_function"
-        elif any(lookup in formula for lookup in ["VLOOKUP(", "INDEX(", "MATCH(", "XLOOKUP("]):
+        elif "lookup" in categories:
             return "data_lookup"
         return "other"
 
-    def extract_named_ranges(self, workbook: openpyxl.Workbook) -> List[Dict[str, str]]:
-        """Extract named ranges with enhanced metadata."""
+    def extract_named_ranges(self, workbook: openpyxl.Workbook,
+                             worksheet: Optional[Worksheet] = None) -> List[Dict[str, str]]:
+        """Extract named ranges with enhanced metadata, for the workbook or one worksheet."""
         named_ranges = []
         try:
-            if hasattr(workbook, 'defined_names'):
-                for name, defn in workbook.defined_names.items():
-                    try:
-                        destinations = defn.destinations
-                        for worksheet, coordinate in destinations:
-                            named_ranges.append({
-                                "name": name,
-                                "range": f"{worksheet}!{coordinate}",
-                                "business_purpose": self.infer_named_range_purpose(name)
-                            })
-                    except AttributeError:
-                        named_ranges.append({
-                            "name": name,
-                            "range": str(defn.value),
-                            "business_purpose": self.infer_named_range_purpose(name)
-                        })
+            # Resolved once per workbook; each sheet lists only the names that point into it
+            index = get_named_range_index(workbook)
+            entries = index.for_sheet(worksheet.title) if worksheet is not None else index.entries
+            for entry in entries:
+                named_ranges.append({
+                    "name": entry["name"],
+                    "range": entry["range"],
+                    "business_purpose": self.infer_named_range_purpose(entry["name"])
+                })
         except Exception as e:
             print(f"Warning: Could not extract named ranges: {str(e)}")
         
@@ -281,28 +278,46 @@ class EnhancedExcelConverter:
 
     def infer_named_range_purpose(self, name: str) -> str:
         """Infer business purpose from named range name."""
-        name_lower = name.lower()
-        
-        if any(word in name_lower for word in ["input", "param", "assumption"]):
-            return "input_parameter"
-        elif any(word in name_lower for word in ["rate", "factor", "multiplier"]):
-            return "calculation_factor"
-        elif any(word in name_lower for word in ["output", "result", "total"]):
-            return "output_value"
-        elif any(word in name_lower for word in ["scenario", "case", "option"]):
-            return "scenario_control"
-        else:
-            return "general"
+        return self.keywords.first_category(name, "named_range_purpose")
 
     def process_worksheet(self, worksheet: Worksheet, workbook: openpyxl.Workbook) -> Dict[str, Any]:
         """Enhanced worksheet processing with PRD-focused analysis."""
+        metrics = self.metrics
+        with metrics.stage("identify_tables"):
+            tables = self.identify_tables(worksheet)
+        with metrics.stage("profile_columns"):
+            profile_tables(worksheet, tables)
+        with metrics.stage("sample_large_sheet"):
+            sample = get_sheet_sample(worksheet, tables)
+            sampling = sample.summary()
+        with metrics.stage("find_repeated_structure"):
+            structure = get_repeated_structure(worksheet)
+            repeated_structure = structure.summary()
+        with metrics.stage("extract_named_ranges"):
+            named_ranges = self.extract_named_ranges(workbook, worksheet)
+        with metrics.stage("analyze_business_logic_patterns"):
+            business_logic_patterns = self.analyze_business_logic_patterns(worksheet)
+        with metrics.stage("extract_data_dependencies"):
+            data_dependencies = self.extract_data_dependencies(worksheet)
+        with metrics.stage("identify_ui_components"):
+            ui_components = self.identify_ui_components(worksheet)
+        with metrics.stage("extract_business_rules"):
+            business_rules = self.extract_business_rules(worksheet)
+        with metrics.stage("extract_validation_rules"):
+            validation_rules = self.extract_validation_rules(worksheet)
+        with metrics.stage("identify_calculation_sequences"):
+            calculation_sequences = self.identify_calculation_sequences(worksheet)
+
         sheet_data = {
             "name": worksheet.title,
             "dimensions": f"{worksheet.dimensions}",
-            "tables": self.identify_tables(worksheet),
-            "named_ranges": self.extract_named_ranges(workbook),
-            "business_logic_patterns": self.analyze_business_logic_patterns(worksheet),
-            "data_dependencies": self.extract_data_dependencies(worksheet),
+            "tables": tables,
+            "sampling": sampling,
+            "repeated_structure": repeated_structure,
+            "notes": notes_summary(worksheet),
+            "named_ranges": named_ranges,
+            "business_logic_patterns": business_logic_patterns,
+            "data_dependencies": data_dependencies,
             "cells": {},
             "formulas": {
                 "external_references": [],
@@ -313,45 +328,56 @@ class EnhancedExcelConverter:
                 "other": []
             },
             "software_requirements": {
-                "ui_components": self.identify_ui_components(worksheet),
-                "business_rules": self.extract_business_rules(worksheet),
-                "data_validation_rules": self.extract_validation_rules(worksheet),
-                "calculation_sequences": self.identify_calculation_sequences(worksheet)
+                "ui_components": ui_components,
+                "business_rules": business_rules,
+                "data_validation_rules": validation_rules,
+                "calculation_sequences": calculation_sequences
             }
         }
 
-        # Process each cell with enhanced metadata
-        for row in worksheet.iter_rows():
-            for cell in row:
+        # Process each cell with enhanced metadata; on large sheets bulk data tables contribute only their sample rows
+        cells_visited = 0
+        formulas_parsed = 0
+        validations = get_validation_index(worksheet)
+        notes = get_cell_notes(worksheet)
+        with metrics.stage("cell_scan"):
+            for cell in sample.iter_cells():
                 cell_addr = f"{get_column_letter(cell.column)}{cell.row}"
+                cells_visited += 1
                 
                 # Basic cell data
                 cell_data = {
                     "value": cell.value,
                     "type": self.infer_cell_type(cell),
                     "has_formula": cell.data_type == 'f',
+                    "cached_value": get_cached_value(worksheet, cell.row, cell.column) if cell.data_type == 'f' else None,
                     "is_styled": bool(cell.font and (cell.font.bold or cell.font.italic)),
-                    "has_validation": bool(hasattr(cell, 'data_validation') and cell.data_validation and hasattr(cell.data_validation, 'type') and cell.data_validation.type),
-                    "has_comment": bool(cell.comment),
-                    "business_context": self.infer_cell_business_context(cell)
+                    "has_validation": validations.has_validation(cell.row, cell.column),
+                    "has_comment": (cell.row, cell.column) in notes,
+                    "business_context": self.infer_cell_business_context(cell),
+                    "sampled": sample.is_sampled_cell(cell.row, cell.column)
                 }
-                
-                # Add to appropriate formula category
-                if cell.data_type == 'f':
+            
+                # Add to appropriate formula category; formulas repeating a row or column pattern
+                # keep their cell data but are described once by the pattern
+                if cell.data_type == 'f' and not structure.is_repeated(cell.row, cell.column):
+                    formulas_parsed += 1
                     formula_metadata = self.extract_formula_metadata(cell)
-                    category = formula_metadata["category"]
-                    if category in sheet_data["formulas"]:
-                        sheet_data["formulas"][category].append(formula_metadata)
-                
+                    section = FORMULA_SECTION_KEYS.get(formula_metadata["category"])
+                    if section in sheet_data["formulas"]:
+                        sheet_data["formulas"][section].append(formula_metadata)
+            
                 sheet_data["cells"][cell_addr] = cell_data
 
+        metrics.increment("cells_visited", cells_visited)
+        metrics.increment("formulas_parsed", formulas_parsed)
         return sheet_data
 
     def infer_cell_business_context(self, cell) -> str:
         """Infer business context of individual cells."""
-        if cell.comment:
+        if get_cell_note(cell.parent, cell.row, cell.column):
             return "documented"
-        elif hasattr(cell, 'data_validation') and cell.data_validation and hasattr(cell.data_validation, 'type') and cell.data_validation.type:
+        elif get_validation_index(cell.parent).has_validation(cell.row, cell.column):
             return "user_input"
         elif cell.data_type == 'f':
             return "calculated"
@@ -363,20 +389,24 @@ class EnhancedExcelConverter:
     def identify_ui_components(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
         """Identify UI components needed for software implementation."""
         components = []
-        
-        # Input components (cells with data validation)
-        for row in worksheet.iter_rows():
-            for cell in row:
-                if hasattr(cell, 'data_validation') and cell.data_validation and hasattr(cell.data_validation, 'type') and cell.data_validation.type:
-                    component = {
-                        "type": "input_field",
-                        "location": f"{get_column_letter(cell.column)}{cell.row}",
-                        "input_type": cell.data_validation.type,
-                        "validation": str(cell.data_validation.formula1) if hasattr(cell.data_validation, 'formula1') and cell.data_validation.formula1 else None,
-                        "current_value": cell.value,
-                        "label": self.find_cell_label(worksheet, cell)
-                    }
-                    components.append(component)
+        named_ranges = get_named_range_index(worksheet.parent)
+        
+        # Input components (one per validated range, labelled by its first input cell)
+        for entry in get_validation_index(worksheet).input_ranges():
+            validation = entry["rule"]
+            row, column = entry["first_input"]
+            cell = worksheet._cells.get((row, column))
+            component = {
+                "type": "input_field",
+                "location": entry["address"],
+                "input_cells": entry["input_cells"],
+                "input_type": validation.type,
+                "validation": str(validation.formula1) if validation.formula1 else None,
+                "current_value": cell.value if cell is not None and entry["input_cells"] == 1 else None,
+                "label": self.find_cell_label(worksheet, row, column),
+                "named_range": label_names(named_ranges.names_at(worksheet.title, row, column))
+            }
+            components.append(component)
         
         # Output components (formatted display areas)
         for table in self.identify_tables(worksheet):
@@ -385,54 +415,44 @@ class EnhancedExcelConverter:
                     "type": "data_table",
                     "location": table["range"],
                     "headers": table["headers"],
-                    "business_context": table["business_context"]
+                    "business_context": table["business_context"],
+                    "named_range": label_names(named_ranges.names_overlapping(
+                        worksheet.title, table["start_row"], table["start_col"],
+                        table["start_row"] + table["row_count"] - 1, table["end_col"]))
                 }
                 components.append(component)
         
         return components
 
-    def find_cell_label(self, worksheet: Worksheet, target_cell) -> str:
+    def find_cell_label(self, worksheet: Worksheet, row: int, column: int) -> str:
         """Find the label for an input cell."""
-        # Check cells to the left and above
-        row, col = target_cell.row, target_cell.column
-        
-        # Check left
-        if col > 1:
-            left_cell = worksheet.cell(row, col - 1)
-            if left_cell.value and isinstance(left_cell.value, str):
-                return left_cell.value
-        
-        # Check above
-        if row > 1:
-            above_cell = worksheet.cell(row - 1, col)
-            if above_cell.value and isinstance(above_cell.value, str):
-                return above_cell.value
-        
-        return f"Cell_{get_column_letter(col)}{row}"
+        # Resolved from the sheet's label index rather than worksheet.cell(), which would add empty cells
+        label = get_label_index(worksheet).label(row, column)
+        return str(label) if label else f"Cell_{get_column_letter(column)}{row}"
 
     def extract_business_rules(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
         """Extract business rules from formulas and patterns."""
         rules = []
+        structure = get_repeated_structure(worksheet)
         
-        for row in worksheet.iter_rows():
-            for cell in row:
-                if cell.data_type == 'f' and cell.value:
-                    formula = str(cell.value)
-                    if "IF(" in formula.upper():
-                        rule = {
-                            "type": "conditional_rule",
-                            "location": f"{get_column_letter(cell.column)}{cell.row}",
-                            "formula": formula,
-                            "description": self.describe_conditional_logic(formula)
-                        }
-                        rules.append(rule)
+        for cell in get_formula_cells(worksheet):
+            if cell.value and not structure.is_repeated(cell.row, cell.column):
+                formula = str(cell.value)
+                if "conditional" in function_categories(formula):
+                    rule = {
+                        "type": "conditional_rule",
+                        "location": f"{get_column_letter(cell.column)}{cell.row}",
+                        "formula": formula,
+                        "description": self.describe_conditional_logic(formula)
+                    }
+                    rules.append(rule)
         
         return rules
 
     def describe_conditional_logic(self, formula: str) -> str:
         """Convert IF formula to business rule description."""
         # Simplified description generation
-        if "IF(" in formula.upper():
+        if "conditional" in function_categories(formula):
             return f"Conditional calculation based on: {formula}"
         return formula
 
@@ -440,17 +460,17 @@ class EnhancedExcelConverter:
         """Extract data validation rules for software implementation."""
         validation_rules = []
         
-        for row in worksheet.iter_rows():
-            for cell in row:
-                if hasattr(cell, 'data_validation') and cell.data_validation and hasattr(cell.data_validation, 'type') and cell.data_validation.type:
-                    rule = {
-                        "cell": f"{get_column_letter(cell.column)}{cell.row}",
-                        "validation_type": cell.data_validation.type,
-                        "formula": str(cell.data_validation.formula1) if hasattr(cell.data_validation, 'formula1') and cell.data_validation.formula1 else None,
-                        "error_message": cell.data_validation.error if hasattr(cell.data_validation, 'error') and cell.data_validation.error else None,
-                        "input_message": cell.data_validation.prompt if hasattr(cell.data_validation, 'prompt') and cell.data_validation.prompt else None
-                    }
-                    validation_rules.append(rule)
+        for entry in get_validation_index(worksheet).input_ranges():
+            validation = entry["rule"]
+            rule = {
+                "cell": entry["address"],
+                "input_cells": entry["input_cells"],
+                "validation_type": validation.type,
+                "formula": str(validation.formula1) if validation.formula1 else None,
+                "error_message": validation.error or None,
+                "input_message": validation.prompt or None
+            }
+            validation_rules.append(rule)
         
         return validation_rules
 
@@ -496,8 +516,10 @@ class EnhancedExcelConverter:
             "value": cell.value,
             "data_type": self.infer_cell_type(cell),
             "formula": None,
+            "cached_value": None,
             "category": None,
             "dependencies": [],
+            "named_references": [],
             "complexity_score": 0,
             "implementation_notes": ""
         }
@@ -506,8 +528,13 @@ class EnhancedExcelConverter:
             formula = str(cell.value)
             if formula.startswith('='):
                 metadata["formula"] = formula
+                metadata["cached_value"] = get_cached_value(cell.parent, cell.row, cell.column)
                 metadata["category"] = self.categorize_formula(formula)
                 metadata["dependencies"] = re.findall(r'[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?', formula)
+                metadata["named_references"] = [
+                    {"name": entry["name"], "range": entry["range"]}
+                    for entry in get_named_range_index(cell.parent.parent).referenced_names(formula, cell.parent.title)
+                ]
                 metadata["complexity_score"] = self.calculate_formula_complexity(formula)
                 metadata["implementation_notes"] = self.generate_implementation_notes(formula)
 
@@ -515,16 +542,16 @@ class EnhancedExcelConverter:
 
     def generate_implementation_notes(self, formula: str) -> str:
         """Generate implementation notes for formulas."""
-        formula_upper = formula.upper()
+        categories = function_categories(formula)
         notes = []
         
-        if "VLOOKUP(" in formula_upper:
+        if "lookup" in categories:
             notes.append("Requires database lookup functionality")
-        if "IF(" in formula_upper:
+        if "conditional" in categories:
             notes.append("Implement conditional logic with proper error handling")
-        if "SUM(" in formula_upper:
+        if "aggregation" in categories:
             notes.append("Use efficient aggregation queries")
-        if "!" in formula:
+        if is_cross_sheet(formula):
             notes.append("Requires cross-table/cross-module data access")
         
         return "; ".join(notes) if notes else "Standard calculation implementation"
@@ -550,6 +577,8 @@ class EnhancedExcelConverter:
                     f.write(f"- **{component['type']}** at {component['location']}\n")
                     if component.get('label'):
                         f.write(f"  - Label: {component['label']}\n")
+                    if component.get('named_range'):
+                        f.write(f"  - Named Range: {component['named_range']}\n")
                     if component.get('validation'):
                         f.write(f"  - Validation: {component['validation']}\n")
                     f.write("\n")
@@ -582,6 +611,22 @@ class EnhancedExcelConverter:
                     f.write(f"- Calculation Table: {table['is_calculation_table']}\n")
                     f.write(f"- Output Table: {table['is_output_table']}\n")
                     f.write("\n")
+                    if table.get("columns"):
+                        f.write(f"Column profile of {table['data_range']}:\n\n")
+                        f.write(format_column_profiles(table["columns"]))
+                        f.write("\n")
+
+            # Stratified samples of bulk data on large sheets
+            if sheet_data["sampling"]["blocks"]:
+                f.write(format_sampling(sheet_data["sampling"]))
+                f.write("\n")
+
+            # Notes and comments left by the workbook's authors
+            if sheet_data["notes"]:
+                f.write("## Notes and Comments\n\n")
+                for note in sheet_data["notes"]:
+                    f.write(f"- {note['cell']}: {note['note']}\n")
+                f.write("\n")
 
             # Data Dependencies
             if sheet_data["data_dependencies"]:
@@ -611,6 +656,11 @@ class EnhancedExcelConverter:
                         f.write(f" (Purpose: {named_range['business_purpose']})")
                     f.write("\n")
 
+            # Repeated row and column patterns, each listed once
+            if sheet_data["repeated_structure"]["repeated_formulas"]:
+                f.write("\n")
+                f.write(format_repeated_structure(sheet_data["repeated_structure"]))
+
             # Enhanced formulas section
             if any(sheet_data["formulas"].values()):
                 f.write("\n## Formulas by Category\n\n")
@@ -618,11 +668,17 @@ class EnhancedExcelConverter:
                     if formulas:
                         f.write(f"### {category.replace('_', ' ').title()}\n")
                         for formula in formulas[:10]:  # Limit for readability
-                            f.write(f"- {formula['address']}: `{formula['formula']}`\n")
+                            f.write(f"- {formula['address']}: `{formula['formula']}`")
+                            if formula.get('cached_value') is not None:
+                                f.write(f" = {formula['cached_value']}")
+                            f.write("\n")
                             if formula.get('implementation_notes'):
                                 f.write(f"  - Implementation: {formula['implementation_notes']}\n")
                             if formula['dependencies']:
                                 f.write(f"  - Dependencies: {', '.join(formula['dependencies'])}\n")
+                            if formula.get('named_references'):
+                                names = ', '.join(f"{ref['name']} ({ref['range']})" for ref in formula['named_references'])
+                                f.write(f"  - Named References: {names}\n")
                         if len(formulas) > 10:
                             f.write(f"  - ... and {len(formulas) - 10} more formulas\n")
                         f.write("\n")
@@ -645,7 +701,9 @@ class EnhancedExcelConverter:
                 "business_rules": 0,
                 "integrations_needed": 0,
                 "complexity_score": 0
-            }
+            },
+            "named_ranges": self.extract_named_ranges(workbook),
+            "vba_modules": list(code_modules(getattr(workbook, 'vba_modules', {})))
         }
 
         for worksheet in workbook.worksheets:
@@ -661,20 +719,19 @@ class EnhancedExcelConverter:
             }
 
             # Count formulas and patterns
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.data_type == 'f':
-                        sheet_summary["formula_count"] += 1
-                        formula = str(cell.value).upper()
-                        
-                        # Count cross-sheet references
-                        if '!' in formula:
-                            summary["business_complexity"]["cross_sheet_references"] += 1
-                        
-                        # Pattern analysis
-                        for pattern in ["SUM(", "IF(", "VLOOKUP(", "INDEX(", "MATCH(", "NPV(", "IRR("]:
-                            if pattern in formula:
-                                summary["formula_patterns"][pattern] = summary["formula_patterns"].get(pattern, 0) + 1
+            for cell in get_formula_cells(worksheet):
+                sheet_summary["formula_count"] += 1
+                formula = str(cell.value)
+                
+                # Count cross-sheet references
+                if is_cross_sheet(formula):
+                    summary["business_complexity"]["cross_sheet_references"] += 1
+                
+                # Pattern analysis: formulas using each catalogued function
+                for name in set(formula_functions(formula)):
+                    if name in FUNCTION_CATALOG:
+                        pattern = f"{name}("
+                        summary["formula_patterns"][pattern] = summary["formula_patterns"].get(pattern, 0) + 1
 
             # Update summary counts
             summary["implementation_estimates"]["ui_components"] += sheet_summary["ui_components"]
@@ -709,12 +766,18 @@ class EnhancedExcelConverter:
 
     def process_workbook(self, excel_file: Path) -> None:
         """Enhanced workbook processing with PRD generation."""
+        self.metrics = JobMetrics(excel_file.stem)
+        self.workbook_metrics[excel_file.stem] = self.metrics
+        metrics = self.metrics
         try:
             print(f"Processing {excel_file}...")
-            workbook = openpyxl.load_workbook(excel_file, data_only=False)
+            with metrics.stage("load"):
+                # Formulas and their cached results come from the same parse
+                workbook = load_workbook(excel_file)
 
             # Generate enhanced workbook summary
-            workbook_summary = self.generate_workbook_summary(workbook)
+            with metrics.stage("generate_workbook_summary"):
+                workbook_summary = self.generate_workbook_summary(workbook)
 
             # Create output directory for this workbook
             workbook_dir = self.output_dir / excel_file.stem
@@ -723,10 +786,17 @@ class EnhancedExcelConverter:
             # Save enhanced workbook summary
             self.save_enhanced_workbook_summary(workbook_summary, workbook_dir)
 
+            # Macro code is part of the business logic the PRD has to cover
+            vba_file = write_vba_markdown(getattr(workbook, 'vba_modules', {}), str(workbook_dir))
+            if vba_file:
+                print(f"Created enhanced markdown file: {vba_file}")
+
             # Process each worksheet
+            stored_sheets = []
             for worksheet in workbook.worksheets:
                 print(f"Processing worksheet: {worksheet.title}")
-                sheet_data = self.process_worksheet(worksheet, workbook)
+                with metrics.stage("process_worksheet"):
+                    sheet_data = self.process_worksheet(worksheet, workbook)
 
                 # Sanitize the worksheet title for filename
                 safe_title = self.sanitize_filename(worksheet.title)
@@ -735,14 +805,27 @@ class EnhancedExcelConverter:
 
                 # Save as enhanced markdown
                 md_file = workbook_dir / f"{safe_title}.md"
-                self.convert_to_markdown(sheet_data, md_file)
+                with metrics.stage("markdown"):
+                    self.convert_to_markdown(sheet_data, md_file)
+                    write_section_index(str(md_file))
                 print(f"Created enhanced markdown file: {md_file}")
 
                 # Save enhanced JSON metadata
                 json_file = workbook_dir / f"{safe_title}.json"
-                with json_file.open('w', encoding='utf-8') as f:
-                    json.dump(sheet_data, f, indent=2, default=str)
+                with metrics.stage("json"):
+                    with json_file.open('w', encoding='utf-8') as f:
+                        json.dump(sheet_data, f, indent=2, default=str)
+                    write_section_index(str(json_file))
                 print(f"Created enhanced JSON file: {json_file}")
+                stored_sheets.append((safe_title, sheet_data))
+
+            if self.analysis_store:
+                try:
+                    with metrics.stage("analysis_store"):
+                        rows = self.analysis_store.store_workbook(str(workbook_dir), workbook_summary, stored_sheets)
+                    print(f"Stored {rows} analysis rows in {self.analysis_store.db_path}")
+                except Exception as e:
+                    print(f"Error storing analysis for {excel_file}: {str(e)}")
 
         except Exception as e:
             print(f"Error processing {excel_file}: {str(e)}")
@@ -778,19 +861,62 @@ class EnhancedExcelConverter:
                 for pattern, count in workbook_summary["formula_patterns"].items():
                     f.write(f"- {pattern}: {count} occurrences\n")
 
+            if workbook_summary["named_ranges"]:
+                f.write("\n## Named Ranges\n")
+                for named_range in workbook_summary["named_ranges"]:
+                    f.write(f"- {named_range['name']}: {named_range['range']}")
+                    if named_range.get('business_purpose'):
+                        f.write(f" (Purpose: {named_range['business_purpose']})")
+                    f.write("\n")
+
+            if workbook_summary["vba_modules"]:
+                f.write("\n## VBA Modules\n")
+                for module in workbook_summary["vba_modules"]:
+                    f.write(f"- {module}\n")
+
+    def build_shared_context(self, workbook_dir: Path, combined_file: str) -> str:
+        """Build the workbook summary and sheet digest used as a shared prompt prefix."""
+        parts = []
+        summary_path = workbook_dir / "enhanced_workbook_summary.md"
+        if summary_path.exists():
+            parts.append(summary_path.read_text(encoding='utf-8').strip())
+
+        # Digest of the combined markdown's worksheets and their sections
+        worksheets = []
+        for section in load_section_index(combined_file).get("sections", []):
+            if section["level"] == 1 and section["title"].startswith("Worksheet"):
+                worksheets.append({"title": section["title"], "size": 0, "sections": []})
+            elif worksheets:
+                if section["level"] == 2:
+                    worksheets[-1]["sections"].append(section["title"])
+            else:
+                continue
+            worksheets[-1]["size"] += section["size"]
+        if worksheets:
+            digest = ["# Sheet Digest", ""]
+            for worksheet in worksheets:
+                digest.append(f"- {worksheet['title']} ({max(1, worksheet['size'] // 1024)} KB)")
+                digest.extend(f"  - {title}" for title in worksheet["sections"])
+            parts.append("\n".join(digest))
+
+        return "\n\n".join(parts)
+
     def convert_all(self):
         """Enhanced conversion with PRD generation."""
         if self.input_path.is_file():
             self.process_workbook(self.input_path)
         else:
-            for excel_file in self.input_path.glob("*.xlsx"):
-                self.process_workbook(excel_file)
+            for excel_file in sorted(self.input_path.iterdir()):
+                if excel_file.suffix.lower() in WORKBOOK_EXTENSIONS:
+                    self.process_workbook(excel_file)
         
         # After processing all Excel files, generate combined analysis and PRD
         for workbook_dir in self.output_dir.iterdir():
             if workbook_dir.is_dir():
+                metrics = self.workbook_metrics.get(workbook_dir.name) or JobMetrics(workbook_dir.name)
                 print(f"\nCombining markdown files for {workbook_dir.name}...")
-                combined_file = combine_markdown_files(str(workbook_dir), "combined_enhanced_workbook.md")
+                with metrics.stage("combine"):
+                    combined_file = combine_markdown_files(str(workbook_dir), "combined_enhanced_workbook.md")
                 
                 if combined_file and os.path.exists(combined_file):
                     print(f"Successfully created combined markdown file: {combined_file}")
@@ -800,12 +926,22 @@ class EnhancedExcelConverter:
                             markdown_content = f.read()
                         print(f"Successfully read markdown content, length: {len(markdown_content)}")
                         
+                        # Workbook summary and sheet digest shared by every prompt of both generators
+                        shared_context = self.build_shared_context(workbook_dir, combined_file)
+                        
                         # Generate user guide with LLM analyzer
                         print("Analyzing with Gemini LLM for user guide...")
-                        analysis_report = self.llm_analyzer.analyze_markdown(markdown_content)
+                        with metrics.stage("llm_user_guide"):
+                            if self.stream_reports:
+                                report_path = self.llm_analyzer.stream_report(markdown_content, str(workbook_dir),
+                                                                              metrics, shared_context)
+                            else:
+                                analysis_report = self.llm_analyzer.analyze_markdown(markdown_content, metrics=metrics,
+                                                                                     shared_context=shared_context)
+                                report_path = self.llm_analyzer.save_report(analysis_report, str(workbook_dir)) \
+                                    if analysis_report else None
                         
-                        if analysis_report:
-                            report_path = self.llm_analyzer.save_report(analysis_report, str(workbook_dir))
+                        if report_path:
                             print(f"User guide analysis saved to: {report_path}")
                         
                         # Generate PRD if enabled
@@ -816,10 +952,18 @@ class EnhancedExcelConverter:
                             summary_path = workbook_dir / "enhanced_workbook_summary.md"
                             metadata = self.prd_generator.extract_spreadsheet_metadata(str(summary_path))
                             
-                            prd_content = self.prd_generator.generate_prd(markdown_content, metadata)
+                            with metrics.stage("llm_prd"):
+                                if self.stream_reports:
+                                    prd_path = self.prd_generator.stream_prd(markdown_content, str(workbook_dir), metadata,
+                                                                             metrics, shared_context)
+                                else:
+                                    prd_content = self.prd_generator.generate_prd(markdown_content, metadata,
+                                                                                  metrics=metrics,
+                                                                                  shared_context=shared_context)
+                                    prd_path = self.prd_generator.save_prd(prd_content, str(workbook_dir)) \
+                                        if prd_content else None
                             
-                            if prd_content:
-                                prd_path = self.prd_generator.save_prd(prd_content, str(workbook_dir))
+                            if prd_path:
                                 print(f"PRD document saved to: {prd_path}")
                             else:
                                 print("Error: PRD generation failed")
@@ -827,6 +971,17 @@ class EnhancedExcelConverter:
                     except Exception as e:
                         print(f"Error in analysis: {str(e)}")
 
+                # Pre-compress outputs so downloads can be served with Content-Encoding
+                with metrics.stage("compress"):
+                    compressed_count = compress_output_directory(str(workbook_dir))
+                print(f"Wrote compressed copies of {compressed_count} output files")
+
+                # Write the per-job timing report
+                metrics.increment("jobs")
+                report_path = metrics.write_report(str(workbook_dir))
+                slowest = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest_stages(metrics.report(), 3))
+                print(f"Timing report saved to: {report_path} (slowest stages: {slowest})")
+
 # Example usage
 if __name__ == "__main__":
     converter = EnhancedExcelConverter(
@@ -1,14 +1,31 @@
 import pandas as pd
+import numpy as np
 import openpyxl
 from pathlib import Path
 import json
 import re
 from openpyxl.utils import get_column_letter, range_boundaries
 from openpyxl.worksheet.worksheet import Worksheet
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 from datetime import datetime
 from combine_markdown import combine_markdown_files
+from markdown_index import write_section_index
+from vba_extractor import code_modules, write_vba_markdown
+from workbook_loader import WORKBOOK_EXTENSIONS, load_workbook, get_cached_value
+from region_detector import detect_regions, get_type_grid, CELL_TEXT
+from keyword_matcher import get_keyword_matcher
+from comments_extractor import notes_summary
+from named_ranges import get_named_range_index
+from calc_chain import get_formula_cells
+from formula_catalog import (FUNCTION_CATALOG, FORMULA_SECTION_KEYS, formula_functions, function_categories,
+                             is_cross_sheet)
+from column_profiler import profile_tables, is_profiled_cell, format_column_profiles
+from sheet_sampler import get_sheet_sample, format_sampling
+from structure_compressor import get_repeated_structure, format_repeated_structure
+from artifact_compression import compress_output_directory
+from pipeline_metrics import JobMetrics, slowest_stages
 from llm_analyzer import LLMAnalyzer  # Import LLMAnalyzer
+from llm_backends import LLMBackend
 import os
 
 # Define the root directory
@@ -19,11 +36,14 @@ INPUT_DIR = Path(ROOT_DIR) / "INPUT"
 OUTPUT_DIR = Path(ROOT_DIR) / "OUTPUT"
 
 class ExcelToLLMConverter:
-    def __init__(self, input_path: str, output_dir: str, api_key: str):
+    def __init__(self, input_path: str, output_dir: str, api_key: str, llm_backend: Optional[LLMBackend] = None):
         self.input_path = Path(input_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.llm_analyzer = LLMAnalyzer(api_key)  # Initialize LLMAnalyzer
+        self.llm_analyzer = LLMAnalyzer(api_key, backend=llm_backend)  # Initialize LLMAnalyzer
+        self.metrics = JobMetrics(self.input_path.stem)
+        self.workbook_metrics = {}
+        self.keywords = get_keyword_matcher()
 
     def infer_cell_type(self, cell: openpyxl.cell.Cell) -> str:
         """Infer the type of data in a cell."""
@@ -48,67 +68,36 @@ class ExcelToLLMConverter:
         return str(cell.data_type)
 
     def identify_tables(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
-        """Identify tables within the worksheet."""
+        """Identify tables within the worksheet from its connected data regions."""
         tables = []
-        current_table = None
-        
-        for row_idx, row in enumerate(worksheet.iter_rows(), 1):
-            # Look for potential header rows (cells with different styling)
-            header_candidates = [cell for cell in row if cell.font.bold or (cell.fill and cell.fill.start_color)]
-            
-            if header_candidates and len(header_candidates) > 1:
-                # Found potential new table header
-                if current_table:
-                    current_table["row_count"] = row_idx - current_table["start_row"]
-                    tables.append(current_table)
-                
-                # Start new table
-                start_col = min(cell.column for cell in header_candidates)
-                end_col = max(cell.column for cell in header_candidates)
-                headers = []
-                types = []
-                
-                for cell in row[start_col-1:end_col]:
-                    headers.append(str(cell.value) if cell.value else f"Column_{get_column_letter(cell.column)}")
-                    types.append(self.infer_cell_type(cell))
-                
-                current_table = {
-                    "name": headers[0] if headers else f"Table_{len(tables)+1}",
-                    "range": f"{get_column_letter(start_col)}{row_idx}:{get_column_letter(end_col)}{row_idx}",
-                    "headers": headers,
-                    "types": types,
-                    "start_row": row_idx,
-                    "start_col": start_col,
-                    "end_col": end_col
-                }
-        
-        # Close last table if exists
-        if current_table:
-            current_table["row_count"] = worksheet.max_row - current_table["start_row"] + 1
-            tables.append(current_table)
-        
+        for region in detect_regions(worksheet):
+            headers = region["headers"]
+            tables.append({
+                "name": headers[0] if region["header_rows"] else f"Table_{len(tables)+1}",
+                "range": region["range"],
+                "headers": headers,
+                "types": list(region["types"]),
+                "start_row": region["min_row"],
+                "start_col": region["min_col"],
+                "end_col": region["max_col"],
+                "header_rows": region["header_rows"],
+                "row_count": region["max_row"] - region["min_row"] + 1
+            })
         return tables
 
-    def extract_named_ranges(self, workbook: openpyxl.Workbook) -> List[Dict[str, str]]:
-        """Extract named ranges from the workbook."""
+    def extract_named_ranges(self, workbook: openpyxl.Workbook,
+                             worksheet: Optional[Worksheet] = None) -> List[Dict[str, str]]:
+        """Extract the workbook's named ranges, or only those on one worksheet."""
         named_ranges = []
         try:
-            # Handle newer versions of openpyxl
-            if hasattr(workbook, 'defined_names'):
-                for name, defn in workbook.defined_names.items():
-                    try:
-                        destinations = defn.destinations
-                        for worksheet, coordinate in destinations:
-                            named_ranges.append({
-                                "name": name,
-                                "range": f"{worksheet}!{coordinate}"
-                            })
-                    except AttributeError:
-                        # If destinations not available, try to get the value directly
-                        named_ranges.append({
-                            "name": name,
-                            "range": str(defn.value)
-                        })
+            # Resolved once per workbook; each sheet lists only the names that point into it
+            index = get_named_range_index(workbook)
+            entries = index.for_sheet(worksheet.title) if worksheet is not None else index.entries
+            for entry in entries:
+                named_ranges.append({
+                    "name": entry["name"],
+                    "range": entry["range"]
+                })
         except Exception as e:
             print(f"Warning: Could not extract named ranges: {str(e)}")
         
@@ -117,29 +106,21 @@ class ExcelToLLMConverter:
     def identify_key_sections(self, worksheet: Worksheet) -> List[Dict[str, Any]]:
         """Identify key sections like P&L, Balance Sheet, etc."""
         key_sections = []
-        section_keywords = {
-            "P&L Statement": ["profit", "loss", "p&l", "income statement"],
-            "Balance Sheet": ["balance sheet", "assets", "liabilities"],
-            "Cash Flow": ["cash flow", "operating activities", "financing activities"]
-        }
-        
         current_section = None
-        for row_idx, row in enumerate(worksheet.iter_rows(), 1):
-            for cell in row:
-                if cell.value and isinstance(cell.value, str):
-                    cell_value = cell.value.lower()
-                    for section_name, keywords in section_keywords.items():
-                        if any(keyword in cell_value for keyword in keywords):
-                            if current_section:
-                                current_section["end_row"] = row_idx - 1
-                                key_sections.append(current_section)
-                            
-                            current_section = {
-                                "name": section_name,
-                                "start_row": row_idx,
-                                "range": f"{get_column_letter(cell.column)}{row_idx}"
-                            }
-                            break
+        # Only text cells can name a section; each is matched against every section's keywords at once
+        for row_idx, col_idx in np.argwhere(get_type_grid(worksheet) == CELL_TEXT) + 1:
+            row_idx, col_idx = int(row_idx), int(col_idx)
+            section_name = self.keywords.first_category(worksheet.cell(row_idx, col_idx).value, "key_section", None)
+            if section_name:
+                if current_section:
+                    current_section["end_row"] = row_idx - 1
+                    key_sections.append(current_section)
+
+                current_section = {
+                    "name": section_name,
+                    "start_row": row_idx,
+                    "range": f"{get_column_letter(col_idx)}{row_idx}"
+                }
         
         if current_section:
             current_section["end_row"] = worksheet.max_row
@@ -149,12 +130,12 @@ class ExcelToLLMConverter:
 
     def categorize_formula(self, formula: str) -> str:
         """Categorize formula type."""
-        formula = formula.upper()
-        if '!' in formula:
+        categories = function_categories(formula)
+        if is_cross_sheet(formula):
             return "external_reference"
-        elif any(agg in formula for agg in ["SUM(", "AVERAGE(", "COUNT(", "MAX(", "MIN("]):
+        elif "aggregation" in categories:
             return "aggregation"
-        elif "IF(" in formula:
+        elif "conditional" in categories:
             return "conditional_logic"
         return "other"
 
@@ -165,16 +146,23 @@ class ExcelToLLMConverter:
             "value": cell.value,
             "data_type": self.infer_cell_type(cell),
             "formula": None,
+            "cached_value": None,
             "category": None,
-            "dependencies": []
+            "dependencies": [],
+            "named_references": []
         }
 
         if cell.data_type == 'f':
             formula = str(cell.value)
             if formula.startswith('='):
                 metadata["formula"] = formula
+                metadata["cached_value"] = get_cached_value(cell.parent, cell.row, cell.column)
                 metadata["category"] = self.categorize_formula(formula)
                 metadata["dependencies"] = re.findall(r'[A-Za-z]+[0-9]+(?::[A-Za-z]+[0-9]+)?', formula)
+                metadata["named_references"] = [
+                    {"name": entry["name"], "range": entry["range"]}
+                    for entry in get_named_range_index(cell.parent.parent).referenced_names(formula, cell.parent.title)
+                ]
 
         return metadata
 
@@ -184,7 +172,7 @@ class ExcelToLLMConverter:
             "name": worksheet.title,
             "dimensions": f"{worksheet.dimensions}",
             "tables": self.identify_tables(worksheet),
-            "named_ranges": self.extract_named_ranges(workbook),
+            "named_ranges": self.extract_named_ranges(workbook, worksheet),
             "key_sections": self.identify_key_sections(worksheet),
             "cells": {},
             "formulas": {
@@ -193,43 +181,70 @@ class ExcelToLLMConverter:
                 "conditional_logic": [],
                 "other": []
             },
-            "data_relationships": []
+            "data_relationships": [],
+            "notes": notes_summary(worksheet)
         }
-
-        # Process each cell
-        for row in worksheet.iter_rows():
-            for cell in row:
-                try:
-                    if cell.value is not None:
-                        metadata = self.extract_formula_metadata(cell)
-                        cell_address = metadata["address"]
-
-                        # Store basic cell data
-                        sheet_data["cells"][cell_address] = {
-                            "value": str(cell.value),
-                            "type": metadata["data_type"]
+        profile_tables(worksheet, sheet_data["tables"])
+        sample = get_sheet_sample(worksheet, sheet_data["tables"])
+        sheet_data["sampling"] = sample.summary()
+        structure = get_repeated_structure(worksheet)
+        sheet_data["repeated_structure"] = structure.summary()
+
+        # Process each cell; on large sheets bulk data tables contribute only their sample rows
+        cells_visited = 0
+        formulas_parsed = 0
+        for cell in sample.iter_cells():
+            try:
+                if cell.value is not None:
+                    cells_visited += 1
+                    metadata = self.extract_formula_metadata(cell)
+                    cell_address = metadata["address"]
+                    # Formulas repeating a row or column pattern keep their values but are described once by the pattern
+                    repeated = structure.is_repeated(cell.row, cell.column)
+
+                    # Store basic cell data
+                    sheet_data["cells"][cell_address] = {
+                        "value": str(cell.value),
+                        "type": metadata["data_type"],
+                        "cached_value": metadata["cached_value"],
+                        # Plain values inside profiled tables are summarized per column
+                        "profiled": not metadata["formula"] and
+                                    is_profiled_cell(worksheet, sheet_data["tables"], cell.row, cell.column),
+                        "sampled": sample.is_sampled_cell(cell.row, cell.column),
+                        "repeated": repeated
+                    }
+
+                    # Store formula information if present
+                    if metadata["formula"] and not repeated:
+                        formulas_parsed += 1
+                        formula_data = {
+                            "address": cell_address,
+                            "formula": metadata["formula"],
+                            "cached_value": metadata["cached_value"],
+                            "dependencies": metadata["dependencies"],
+                            "named_references": metadata["named_references"]
                         }
+                        sheet_data["formulas"][FORMULA_SECTION_KEYS[metadata["category"]]].append(formula_data)
+
+                        # Record data relationships
+                        for dep in metadata["dependencies"]:
+                            sheet_data["data_relationships"].append({
+                                "source": dep,
+                                "target": cell_address,
+                                "type": "formula_dependency"
+                            })
+                        for reference in metadata["named_references"]:
+                            sheet_data["data_relationships"].append({
+                                "source": f"{reference['name']} ({reference['range']})",
+                                "target": cell_address,
+                                "type": "named_range_dependency"
+                            })
+            except Exception as e:
+                print(f"Error processing cell {get_column_letter(cell.column)}{cell.row}: {str(e)}")
+                continue
 
-                        # Store formula information if present
-                        if metadata["formula"]:
-                            formula_data = {
-                                "address": cell_address,
-                                "formula": metadata["formula"],
-                                "dependencies": metadata["dependencies"]
-                            }
-                            sheet_data["formulas"][metadata["category"]].append(formula_data)
-
-                            # Record data relationships
-                            for dep in metadata["dependencies"]:
-                                sheet_data["data_relationships"].append({
-                                    "source": dep,
-                                    "target": cell_address,
-                                    "type": "formula_dependency"
-                                })
-                except Exception as e:
-                    print(f"Error processing cell {get_column_letter(cell.column)}{cell.row}: {str(e)}")
-                    continue
-
+        self.metrics.increment("cells_visited", cells_visited)
+        self.metrics.increment("formulas_parsed", formulas_parsed)
         return sheet_data
 
     def sanitize_filename(self, filename: str) -> str:
@@ -257,6 +272,22 @@ class ExcelToLLMConverter:
                     f.write(f"- Headers: {', '.join(table['headers'])}\n")
                     f.write(f"- Types: {', '.join(table['types'])}\n")
                     f.write("\n")
+                    if table.get("columns"):
+                        f.write(f"Column profile of {table['data_range']}:\n\n")
+                        f.write(format_column_profiles(table["columns"]))
+                        f.write("\n")
+
+            # Stratified samples of bulk data on large sheets
+            if sheet_data["sampling"]["blocks"]:
+                f.write(format_sampling(sheet_data["sampling"]))
+                f.write("\n")
+
+            # Write notes and comments section
+            if sheet_data["notes"]:
+                f.write("## Notes and Comments\n\n")
+                for note in sheet_data["notes"]:
+                    f.write(f"- {note['cell']}: {note['note']}\n")
+                f.write("\n")
 
             # Write named ranges section
             if sheet_data["named_ranges"]:
@@ -270,13 +301,29 @@ class ExcelToLLMConverter:
                 for section in sheet_data["key_sections"]:
                     f.write(f"- {section['name']}: {section['range']}\n")
 
+            # Write repeated row and column patterns
+            if sheet_data["repeated_structure"]["repeated_formulas"]:
+                f.write("\n")
+                f.write(format_repeated_structure(sheet_data["repeated_structure"]))
+
             # Write cell values section
             f.write("\n## Cell Values\n\n")
+            profiled_count = sum(1 for cell_data in sheet_data["cells"].values() if cell_data.get('profiled'))
+            if profiled_count:
+                f.write(f"{profiled_count} table values are summarized in the column profiles above.\n\n")
+            repeated_count = sum(1 for cell_data in sheet_data["cells"].values() if cell_data.get('repeated'))
+            if repeated_count:
+                f.write(f"{repeated_count} formula cells are described by the repeated structure above.\n\n")
             f.write("| Cell | Value | Type |\n")
             f.write("|------|--------|------|\n")
             for addr, cell_data in sheet_data["cells"].items():
+                if cell_data.get('profiled') or cell_data.get('repeated'):
+                    continue
                 # Escape pipe characters in cell values
                 safe_value = str(cell_data['value']).replace('|', '\\|')
+                if cell_data.get('cached_value') is not None:
+                    # Formula text and Excel's last calculated result side by side
+                    safe_value += " = " + str(cell_data['cached_value']).replace('|', '\\|')
                 f.write(f"| {addr} | {safe_value} | {cell_data['type']} |\n")
 
             # Write formulas section
@@ -284,11 +331,17 @@ class ExcelToLLMConverter:
                 f.write("\n## Formulas\n\n")
                 for category, formulas in sheet_data["formulas"].items():
                     if formulas:
-                        f.write(f"### {category.capitalize()}\n")
+                        f.write(f"### {category.replace('_', ' ').title()}\n")
                         for formula in formulas:
-                            f.write(f"- {formula['address']}: `{formula['formula']}`\n")
+                            f.write(f"- {formula['address']}: `{formula['formula']}`")
+                            if formula.get('cached_value') is not None:
+                                f.write(f" = {formula['cached_value']}")
+                            f.write("\n")
                             if formula['dependencies']:
                                 f.write(f"- Dependencies: {', '.join(formula['dependencies'])}\n")
+                            if formula.get('named_references'):
+                                names = ', '.join(f"{ref['name']} ({ref['range']})" for ref in formula['named_references'])
+                                f.write(f"- Named References: {names}\n")
                             f.write("\n")
 
             # Write data relationships section
@@ -303,7 +356,9 @@ class ExcelToLLMConverter:
             "sheet_count": len(workbook.worksheets),
             "sheets": [],
             "formula_patterns": {},
-            "most_formulas": {"sheet": None, "count": 0}
+            "most_formulas": {"sheet": None, "count": 0},
+            "named_ranges": self.extract_named_ranges(workbook),
+            "vba_modules": list(code_modules(getattr(workbook, 'vba_modules', {})))
         }
 
         for worksheet in workbook.worksheets:
@@ -315,14 +370,12 @@ class ExcelToLLMConverter:
             }
 
             # Count formulas and patterns
-            for row in worksheet.iter_rows():
-                for cell in row:
-                    if cell.data_type == 'f':
-                        sheet_summary["formula_count"] += 1
-                        formula = str(cell.value).upper()
-                        for pattern in ["SUM(", "IF(", "VLOOKUP(", "INDEX(", "MATCH("]:
-                            if pattern in formula:
-                                summary["formula_patterns"][pattern] = summary["formula_patterns"].get(pattern, 0) + 1
+            for cell in get_formula_cells(worksheet):
+                sheet_summary["formula_count"] += 1
+                for name in set(formula_functions(str(cell.value))):
+                    if name in FUNCTION_CATALOG:
+                        pattern = f"{name}("
+                        summary["formula_patterns"][pattern] = summary["formula_patterns"].get(pattern, 0) + 1
 
             summary["sheets"].append(sheet_summary)
             if sheet_summary["formula_count"] > summary["most_formulas"]["count"]:
@@ -340,12 +393,18 @@ class ExcelToLLMConverter:
 
     def process_workbook(self, excel_file: Path) -> None:
         """Process an entire workbook and generate output files."""
+        self.metrics = JobMetrics(excel_file.stem)
+        self.workbook_metrics[excel_file.stem] = self.metrics
+        metrics = self.metrics
         try:
             print(f"Processing {excel_file}...")
-            workbook = openpyxl.load_workbook(excel_file, data_only=False)
+            with metrics.stage("load"):
+                # Formulas and their cached results come from the same parse
+                workbook = load_workbook(excel_file)
 
             # Generate workbook summary
-            workbook_summary = self.generate_workbook_summary(workbook)
+            with metrics.stage("generate_workbook_summary"):
+                workbook_summary = self.generate_workbook_summary(workbook)
 
             # Create output directory for this workbook
             workbook_dir = self.output_dir / excel_file.stem
@@ -373,10 +432,25 @@ class ExcelToLLMConverter:
                     for pattern, count in workbook_summary["formula_patterns"].items():
                         f.write(f"- {pattern}: {count} occurrences\n")
 
+                if workbook_summary["named_ranges"]:
+                    f.write("\n## Named Ranges\n")
+                    for named_range in workbook_summary["named_ranges"]:
+                        f.write(f"- {named_range['name']}: {named_range['range']}\n")
+
+                if workbook_summary["vba_modules"]:
+                    f.write("\n## VBA Modules\n")
+                    for module in workbook_summary["vba_modules"]:
+                        f.write(f"- {module}\n")
+
+            vba_file = write_vba_markdown(getattr(workbook, 'vba_modules', {}), str(workbook_dir))
+            if vba_file:
+                print(f"Created markdown file: {vba_file}")
+
             # Process each worksheet
             for worksheet in workbook.worksheets:
                 print(f"Processing worksheet: {worksheet.title}")
-                sheet_data = self.process_worksheet(worksheet, workbook)
+                with metrics.stage("process_worksheet"):
+                    sheet_data = self.process_worksheet(worksheet, workbook)
 
                 # Sanitize the worksheet title for filename
                 safe_title = self.sanitize_filename(worksheet.title)
@@ -385,13 +459,17 @@ class ExcelToLLMConverter:
 
                 # Save as markdown
                 md_file = workbook_dir / f"{safe_title}.md"
-                self.convert_to_markdown(sheet_data, md_file)
+                with metrics.stage("markdown"):
+                    self.convert_to_markdown(sheet_data, md_file)
+                    write_section_index(str(md_file))
                 print(f"Created markdown file: {md_file}")
 
                 # Save raw data as JSON for potential other uses
                 json_file = workbook_dir / f"{safe_title}.json"
-                with json_file.open('w', encoding='utf-8') as f:
-                    json.dump(sheet_data, f, indent=2)
+                with metrics.stage("json"):
+                    with json_file.open('w', encoding='utf-8') as f:
+                        json.dump(sheet_data, f, indent=2, default=str)
+                    write_section_index(str(json_file))
                 print(f"Created JSON file: {json_file}")
 
         except Exception as e:
@@ -402,14 +480,17 @@ class ExcelToLLMConverter:
         if self.input_path.is_file():
             self.process_workbook(self.input_path)
         else:
-            for excel_file in self.input_path.glob("*.xlsx"):
-                self.process_workbook(excel_file)
+            for excel_file in sorted(self.input_path.iterdir()):
+                if excel_file.suffix.lower() in WORKBOOK_EXTENSIONS:
+                    self.process_workbook(excel_file)
         
         # After processing all Excel files, combine the markdown files for each workbook directory
         for workbook_dir in self.output_dir.iterdir():
             if workbook_dir.is_dir():  # Process each workbook directory
+                metrics = self.workbook_metrics.get(workbook_dir.name) or JobMetrics(workbook_dir.name)
                 print(f"\nCombining markdown files for {workbook_dir.name}...")
-                combined_file = combine_markdown_files(str(workbook_dir))
+                with metrics.stage("combine"):
+                    combined_file = combine_markdown_files(str(workbook_dir))
                 
                 # Read the combined markdown content
                 if combined_file and os.path.exists(combined_file):
@@ -421,7 +502,8 @@ class ExcelToLLMConverter:
                         
                         # Analyze with LLM
                         print("Analyzing with Gemini LLM...")
-                        analysis_report = self.llm_analyzer.analyze_markdown(markdown_content)
+                        with metrics.stage("llm_user_guide"):
+                            analysis_report = self.llm_analyzer.analyze_markdown(markdown_content, metrics=metrics)
                         
                         if analysis_report:
                             # Save the analysis report
@@ -432,6 +514,17 @@ class ExcelToLLMConverter:
                     except Exception as e:
                         print(f"Error in LLM analysis: {str(e)}")
 
+                # Pre-compress outputs so downloads can be served with Content-Encoding
+                with metrics.stage("compress"):
+                    compressed_count = compress_output_directory(str(workbook_dir))
+                print(f"Wrote compressed copies of {compressed_count} output files")
+
+                # Write the per-job timing report
+                metrics.increment("jobs")
+                report_path = metrics.write_report(str(workbook_dir))
+                slowest = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest_stages(metrics.report(), 3))
+                print(f"Timing report saved to: {report_path} (slowest stages: {slowest})")
+
 # Example usage
 if __name__ == "__main__":
     converter = ExcelToLLMConverter(
@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, FrozenSet, Tuple
+
+# Excel function name -> category. Classifiers look functions up here instead of
+# substring-matching the formula, so SUMIF is an aggregation rather than an IF
+# and IFERROR is error handling rather than a conditional rule.
+FUNCTION_CATEGORIES: Dict[str, List[str]] = {
+    "aggregation": [
+        "SUM", "SUMIF", "SUMIFS", "SUMPRODUCT", "AVERAGE", "AVERAGEA", "AVERAGEIF", "AVERAGEIFS",
+        "COUNT", "COUNTA", "COUNTBLANK", "COUNTIF", "COUNTIFS", "MAX", "MAXA", "MAXIFS",
+        "MIN", "MINA", "MINIFS", "SUBTOTAL", "AGGREGATE", "PRODUCT",
+    ],
+    "conditional": ["IF", "IFS", "SWITCH"],
+    "error_handling": ["IFERROR", "IFNA", "ERROR.TYPE"],
+    "logical": ["AND", "OR", "NOT", "XOR", "TRUE", "FALSE"],
+    "lookup": [
+        "VLOOKUP", "HLOOKUP", "XLOOKUP", "LOOKUP", "INDEX", "MATCH", "XMATCH", "OFFSET",
+        "INDIRECT", "CHOOSE",
+    ],
+    "reference": ["ROW", "ROWS", "COLUMN", "COLUMNS", "ADDRESS", "TRANSPOSE", "HYPERLINK"],
+    "financial": [
+        "NPV", "XNPV", "IRR", "XIRR", "MIRR", "PMT", "IPMT", "PPMT", "CUMIPMT", "CUMPRINC",
+        "PV", "FV", "NPER", "RATE", "EFFECT", "NOMINAL", "SLN", "SYD", "DB", "DDB", "VDB",
+    ],
+    "math": [
+        "ROUND", "ROUNDUP", "ROUNDDOWN", "MROUND", "CEILING", "CEILING.MATH", "FLOOR", "FLOOR.MATH",
+        "INT", "TRUNC", "ABS", "SIGN", "MOD", "POWER", "SQRT", "EXP", "LN", "LOG", "LOG10",
+        "RAND", "RANDBETWEEN", "PI",
+    ],
+    "statistical": [
+        "MEDIAN", "MODE", "MODE.SNGL", "STDEV", "STDEV.S", "STDEV.P", "VAR", "VAR.S", "VAR.P",
+        "PERCENTILE", "PERCENTILE.INC", "QUARTILE", "RANK", "RANK.EQ", "LARGE", "SMALL",
+        "CORREL", "SLOPE", "INTERCEPT", "FORECAST", "FORECAST.LINEAR", "TREND", "GROWTH",
+    ],
+    "text": [
+        "CONCATENATE", "CONCAT", "TEXTJOIN", "LEFT", "RIGHT", "MID", "LEN", "FIND", "SEARCH",
+        "SUBSTITUTE", "REPLACE", "TRIM", "UPPER", "LOWER", "PROPER", "TEXT", "VALUE", "REPT",
+    ],
+    "date": [
+        "DATE", "DATEVALUE", "TODAY", "NOW", "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND",
+        "WEEKDAY", "WEEKNUM", "EDATE", "EOMONTH", "DATEDIF", "YEARFRAC", "NETWORKDAYS", "WORKDAY", "DAYS",
+    ],
+    "information": ["ISBLANK", "ISERROR", "ISERR", "ISNA", "ISNUMBER", "ISTEXT", "ISLOGICAL", "N", "NA"],
+    "dynamic_array": ["FILTER", "SORT", "SORTBY", "UNIQUE", "SEQUENCE", "LET", "LAMBDA"],
+}
+
+FUNCTION_CATALOG: Dict[str, str] = {
+    name: category for category, names in FUNCTION_CATEGORIES.items() for name in names
+}
+
+# Formula categories -> the plural keys the converters group formulas under in sheet_data
+FORMULA_SECTION_KEYS: Dict[str, str] = {
+    "external_reference": "external_references",
+    "aggregation": "aggregations",
+    "conditional_logic": "conditional_logic",
+    "financial_function": "financial_functions",
+    "data_lookup": "data_lookups",
+    "other": "other",
+}
+
+FUNCTION_CALL_PATTERN = re.compile(r"(?<![A-Za-z0-9_.$])([A-Za-z_][A-Za-z0-9_.]*)\s*\(")
+# String literals and quoted sheet names may contain parentheses and "!"
+QUOTED_PATTERN = re.compile(r'"[^"]*"|\'[^\']*\'')
+# Prefixes Excel stores on functions newer than the original file format
+FUTURE_FUNCTION_PREFIXES = ("_XLFN._XLWS.", "_XLFN.", "_XLWS.")
+
+
+@lru_cache(maxsize=65536)
+def parse_formula(formula: str) -> Tuple[Tuple[str, ...], bool]:
+    """
+    Return the function names called by a formula, in order, and whether it references another sheet.
+
+    Parsed once per distinct formula text; every classifier reads the result.
+    """
+    unquoted = QUOTED_PATTERN.sub(lambda found: found.group(0)[0] * 2, formula)
+    names = []
+    for found in FUNCTION_CALL_PATTERN.finditer(unquoted):
+        name = found.group(1).upper()
+        for prefix in FUTURE_FUNCTION_PREFIXES:
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+                break
+        names.append(name)
+    return tuple(names), '!' in unquoted
+
+
+def formula_functions(formula: str) -> Tuple[str, ...]:
+    return parse_formula(formula)[0]
+
+
+def is_cross_sheet(formula: str) -> bool:
+    return parse_formula(formula)[1]
+
+
+def function_categories(formula: str) -> FrozenSet[str]:
+    """Return the catalog categories of every function a formula calls."""
+    return _categories_of(formula_functions(formula))
+
+
+@lru_cache(maxsize=4096)
+def _categories_of(names: Tuple[str, ...]) -> FrozenSet[str]:
+    return frozenset(FUNCTION_CATALOG[name] for name in names if name in FUNCTION_CATALOG)
+
+
+def count_category(formula: str, category: str) -> int:
+    """Count calls to functions of one category, e.g. nested IFs."""
+    return sum(1 for name in formula_functions(formula) if FUNCTION_CATALOG.get(name) == category)
@@ -0,0 +1,88 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, FrozenSet, Optional, Tuple
+
+# group -> category -> keywords, in priority order: when a text matches several
+# categories of a group, the first one listed wins
+KEYWORD_REGISTRY: Dict[str, Dict[str, List[str]]] = {
+    "key_section": {
+        "P&L Statement": ["profit", "loss", "p&l", "income statement"],
+        "Balance Sheet": ["balance sheet", "assets", "liabilities"],
+        "Cash Flow": ["cash flow", "operating activities", "financing activities"],
+    },
+    "dashboard": {
+        "dashboard": ["summary", "dashboard", "report", "total", "analysis"],
+    },
+    "table_context": {
+        "financial": ["revenue", "cost", "profit", "cash", "balance", "income", "expense"],
+        "operational": ["volume", "units", "quantity", "capacity", "production"],
+        "input_parameters": ["assumption", "input", "parameter", "rate", "factor"],
+        "output_results": ["result", "output", "summary", "total", "forecast"],
+    },
+    "table_role": {
+        "input": ["input", "assumption", "parameter", "rate", "factor", "variable"],
+        "calculation": ["calculation", "calc", "formula", "computed", "derived"],
+        "output": ["output", "result", "summary", "total", "report", "dashboard"],
+    },
+    "named_range_purpose": {
+        "input_parameter": ["input", "param", "assumption"],
+        "calculation_factor": ["rate", "factor", "multiplier"],
+        "output_value": ["output", "result", "total"],
+        "scenario_control": ["scenario", "case", "option"],
+    },
+}
+
+MATCH_CACHE_SIZE = 65536
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive substring matcher for every keyword in a registry at once.
+
+    All keywords are compiled into a single alternation tried at each position
+    of the text, longest keyword first. Any shorter keyword starting at the
+    same position is a prefix of the longest one, so the categories of those
+    prefixes are folded in ahead of time and one scan finds every keyword
+    occurrence, however many keywords and categories are registered.
+    """
+
+    def __init__(self, registry: Dict[str, Dict[str, List[str]]]):
+        self.registry = registry
+        owners: Dict[str, set] = {}
+        for group, categories in registry.items():
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    owners.setdefault(keyword.lower(), set()).add((group, category))
+
+        keywords = sorted(owners, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in keywords) + "))")
+        self._labels = {
+            keyword: frozenset().union(*(owners[prefix] for prefix in owners if keyword.startswith(prefix)))
+            for keyword in keywords
+        }
+        self.match = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    def _match(self, text: str) -> FrozenSet[Tuple[str, str]]:
+        """Return every (group, category) pair whose keywords occur in the text."""
+        labels = set()
+        for found in self._pattern.finditer(text.lower()):
+            labels.update(self._labels[found.group(1)])
+        return frozenset(labels)
+
+    def categories(self, text: str, group: str) -> List[str]:
+        """Return the matching categories of one group in priority order."""
+        labels = self.match(text)
+        return [category for category in self.registry[group] if (group, category) in labels]
+
+    def first_category(self, text: str, group: str, default: Optional[str] = "general") -> Optional[str]:
+        matched = self.categories(text, group)
+        return matched[0] if matched else default
+
+    def matches(self, text: str, group: str, category: str) -> bool:
+        return (group, category) in self.match(text)
+
+
+@lru_cache(maxsize=None)
+def get_keyword_matcher() -> KeywordMatcher:
+    """Return the matcher for the built-in keyword registry."""
+    return KeywordMatcher(KEYWORD_REGISTRY)
@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from openpyxl.worksheet.worksheet import Worksheet
+
+from region_detector import CELL_TEXT, detect_regions, get_type_grid
+
+
+class LabelIndex:
+    """
+    Resolves the caption of a cell without probing its neighbours.
+
+    Built from the sheet's cached type grid: for every cell the index holds the
+    nearest text cell to its left in the same row and above it in the same
+    column, with merged label cells spread over their whole range. Lookups are
+    array reads and never create cells on the worksheet.
+    """
+
+    def __init__(self, worksheet: Worksheet):
+        self.worksheet = worksheet
+        grid = get_type_grid(worksheet)
+        text = grid == CELL_TEXT
+
+        # Cells covered by a merged range resolve to its top-left anchor
+        self.anchors: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        for merged in worksheet.merged_cells.ranges:
+            anchor = (merged.min_row, merged.min_col)
+            for row in range(merged.min_row, merged.max_row + 1):
+                for column in range(merged.min_col, merged.max_col + 1):
+                    self.anchors[(row, column)] = anchor
+            if merged.min_row <= grid.shape[0] and merged.min_col <= grid.shape[1] \
+                    and text[merged.min_row - 1, merged.min_col - 1]:
+                text[merged.min_row - 1:merged.max_row, merged.min_col - 1:merged.max_col] = True
+
+        # 1-based row/column of the nearest text cell at or before each position, 0 if none
+        rows = np.arange(1, grid.shape[0] + 1, dtype=np.int32)[:, None]
+        columns = np.arange(1, grid.shape[1] + 1, dtype=np.int32)[None, :]
+        self.left = np.maximum.accumulate(np.where(text, columns, 0), axis=1)
+        self.above = np.maximum.accumulate(np.where(text, rows, 0), axis=0)
+
+        # Column headers of detected tables, keyed by the table's data cells
+        self.regions = detect_regions(worksheet)
+
+    def text_at(self, row: int, column: int) -> str:
+        row, column = self.anchors.get((row, column), (row, column))
+        return self.worksheet.cell(row, column).value
+
+    def left_label(self, row: int, column: int) -> Optional[str]:
+        """Nearest text cell left of the given cell in the same row."""
+        if column < 2 or row > self.left.shape[0]:
+            return None
+        label_column = self.left[row - 1, min(column, self.left.shape[1] + 1) - 2]
+        return self.text_at(row, int(label_column)) if label_column else None
+
+    def above_label(self, row: int, column: int) -> Optional[str]:
+        """Nearest text cell above the given cell in the same column."""
+        if row < 2 or column > self.above.shape[1]:
+            return None
+        label_row = self.above[min(row, self.above.shape[0] + 1) - 2, column - 1]
+        return self.text_at(int(label_row), column) if label_row else None
+
+    def header_label(self, row: int, column: int) -> Optional[str]:
+        """Column header of the detected table whose data rows contain the cell."""
+        for region in self.regions:
+            if region["header_rows"] and region["min_row"] + region["header_rows"] <= row <= region["max_row"] \
+                    and region["min_col"] <= column <= region["max_col"]:
+                return region["headers"][column - region["min_col"]]
+        return None
+
+    def label(self, row: int, column: int) -> Optional[str]:
+        """
+        Caption for a cell: its row label to the left, else its table column
+        header, else the nearest text above it. Merged targets are labelled from
+        their top-left corner.
+        """
+        row, column = self.anchors.get((row, column), (row, column))
+        return self.left_label(row, column) or self.header_label(row, column) or self.above_label(row, column)
+
+
+def get_label_index(worksheet: Worksheet) -> LabelIndex:
+    """Return the worksheet's label index, building it on first use."""
+    index = getattr(worksheet, 'label_index', None)
+    if index is None:
+        index = LabelIndex(worksheet)
+        worksheet.label_index = index
+    return index
@@ -1,13 +1,29 @@
 import os
-import google.generativeai as genai
-from typing import Optional
+from typing import Optional, Dict, Any
 import tiktoken
 from pathlib import Path
+import time
+from markdown_index import write_section_index
+from pipeline_metrics import JobMetrics
+from streaming_output import StreamingReport
+from llm_backends import LLMBackend, LLMResponse, PromptPrefix, create_backend
+from request_governor import RequestGovernor, get_default_governor
+from token_budget import apply_token_budget, get_token_budget
+
+REPORT_FILENAME = "llm_analysis_report.md"
+REPORT_HEADER = "# Excel Workbook Analysis Report\n\n"
+SECTION_SEPARATOR = "\n\n## Analysis of Next Section\n\n"
+MAX_CHUNK_TOKENS = 500000
 
 class LLMAnalyzer:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')  # Updated to gemini-2.5-pro-preview-03-25
+    def __init__(self, api_key: str, backend: Optional[LLMBackend] = None,
+                 governor: Optional[RequestGovernor] = None, token_budget: Optional[int] = None):
+        # Gemini by default; any LLMBackend (e.g. the offline FakeBackend) can be injected
+        self.backend = backend or create_backend(api_key)
+        # Shared across analyzers so every LLM call in the process draws on one quota
+        self.governor = governor or get_default_governor()
+        # Content above this many tokens is trimmed to its most informative sections; 0 sends everything
+        self.token_budget = get_token_budget() if token_budget is None else token_budget
         self.system_prompt = """You are an advanced analytical assistant tasked with creating a user guide for an Excel spreadsheet based on its Markdown representation. Your goal is to help a first-time user understand how to use this spreadsheet effectively. Produce a detailed, practical guide that includes:
 
 1. EXECUTIVE SUMMARY: A brief overview of what this spreadsheet does and its primary purpose (2-3 sentences).
@@ -74,79 +90,162 @@ Use clear, non-technical language suitable for business users who may not be Exc
         
         return chunks
 
-    def analyze_markdown(self, markdown_content: str) -> Optional[str]:
+    def _generate_content(self, prompt: str, generation_config: Dict[str, Any], metrics: JobMetrics,
+                          prefix: Optional[PromptPrefix] = None, report: Optional[StreamingReport] = None,
+                          lead: str = "") -> LLMResponse:
+        """
+        Call the LLM backend through the request governor and record timing and token usage.
+
+        With a report, the response is streamed into it as it arrives, preceded by
+        `lead` once the first text shows up; failed attempts are rolled back.
+        """
+        if prefix:
+            generation_config = dict(generation_config, **prefix.generation_options())
+        metrics.increment("llm_requests", generator="user_guide")
+        estimated_tokens = self.count_tokens(prompt)
+
+        if report:
+            mark = report.mark()
+
+            def call() -> LLMResponse:
+                report.rollback(mark)
+                pending_lead = [lead]
+
+                def on_text(text: str) -> None:
+                    if text and pending_lead:
+                        report.write(pending_lead.pop())
+                    report.write(text)
+
+                return self.backend.generate_stream(prompt, on_text, **generation_config)
+        else:
+            def call() -> LLMResponse:
+                return self.backend.generate(prompt, **generation_config)
+
+        start = time.perf_counter()
+        try:
+            response = self.governor.call(
+                call,
+                estimated_tokens=estimated_tokens,
+                metrics=metrics,
+                label="user_guide"
+            )
+        except Exception:
+            metrics.increment("llm_errors", generator="user_guide")
+            if report:
+                report.rollback(mark)
+            raise
+        finally:
+            metrics.observe("llm_request_duration_seconds", time.perf_counter() - start, generator="user_guide")
+        
+        prompt_tokens = response.prompt_tokens or estimated_tokens
+        completion_tokens = response.completion_tokens or 0
+        metrics.increment("llm_tokens_sent", prompt_tokens, generator="user_guide")
+        metrics.increment("llm_tokens_received", completion_tokens, generator="user_guide")
+        if response.cached_tokens:
+            metrics.increment("llm_cached_tokens", response.cached_tokens, generator="user_guide")
+        return response
+
+    def analyze_markdown(self, markdown_content: str, metrics: Optional[JobMetrics] = None,
+                         shared_context: Optional[str] = None,
+                         report: Optional[StreamingReport] = None) -> Optional[str]:
         """
         Analyze the markdown content using Google's Gemini 2.5 Pro Preview model.
         Sends the entire content in one go as Gemini can handle larger contexts.
+        With a report, chunk analyses are streamed into it instead of being
+        collected, and the report path is returned.
         """
+        metrics = metrics or JobMetrics("user_guide")
         try:
             # Check if content is too large and chunk if necessary
             content_tokens = self.count_tokens(markdown_content)
             print(f"Total content tokens: {content_tokens}")
             
-            # Always use chunking for large documents to be safe
+            # Keep the most informative sections within the token budget so one call usually suffices
+            markdown_content, content_tokens = apply_token_budget(markdown_content, content_tokens, self.token_budget,
+                                                                  self.count_tokens, metrics, "user_guide")
+            
+            # Chunk only what does not fit in one call
             print("Chunking content for analysis...")
-            chunks = self.chunk_content(markdown_content, max_tokens=500000)  # Much more conservative limit
+            chunks = [markdown_content] if content_tokens <= MAX_CHUNK_TOKENS else \
+                self.chunk_content(markdown_content, max_tokens=MAX_CHUNK_TOKENS)
             print(f"Split content into {len(chunks)} chunks")
+            metrics.increment("llm_chunks", len(chunks), generator="user_guide")
             
-            # Process each chunk and combine results
-            all_analyses = []
-            for i, chunk in enumerate(chunks):
-                chunk_tokens = self.count_tokens(chunk)
-                print(f"Processing chunk {i+1}/{len(chunks)}, tokens: {chunk_tokens}")
+            # With several chunks the system prompt and workbook context are cached once when the backend supports it
+            with PromptPrefix(self.backend, self.system_prompt, shared_context, cache=len(chunks) > 1) as prefix:
+                # Process each chunk and combine results
+                all_analyses = []
+                analysis_count = 0
+                for i, chunk in enumerate(chunks):
+                    chunk_tokens = self.count_tokens(chunk)
+                    print(f"Processing chunk {i+1}/{len(chunks)}, tokens: {chunk_tokens}")
                 
-                # Combine system prompt with chunk
-                chunk_prompt = f"{self.system_prompt}\n\nAnalyze this portion ({i+1}/{len(chunks)}) of the Excel spreadsheet content:\n\n{chunk}"
+                    # Prefix the chunk with the system prompt unless it is cached
+                    chunk_prompt = prefix.render(f"Analyze this portion ({i+1}/{len(chunks)}) of the Excel spreadsheet content:\n\n{chunk}")
                 
-                # Generate analysis for this chunk
-                try:
-                    response = self.model.generate_content(
-                        contents=chunk_prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.7,
-                            top_p=0.8,
-                            top_k=40,
-                            max_output_tokens=8192,
+                    # Generate analysis for this chunk
+                    try:
+                        response = self._generate_content(
+                            chunk_prompt,
+                            dict(
+                                temperature=0.7,
+                                top_p=0.8,
+                                top_k=40,
+                                max_output_tokens=8192,
+                            ),
+                            metrics,
+                            prefix,
+                            report,
+                            SECTION_SEPARATOR if analysis_count else ""
                         )
-                    )
                     
-                    if response.text:
-                        all_analyses.append(response.text)
-                        print(f"Successfully analyzed chunk {i+1}")
-                    else:
-                        print(f"Error: Empty response from Gemini for chunk {i+1}")
-                except Exception as chunk_error:
-                    print(f"Error processing chunk {i+1}: {str(chunk_error)}")
-                    # Try with an even smaller chunk if possible
-                    if chunk_tokens > 200000:
-                        print(f"Attempting to split chunk {i+1} further...")
-                        subchunks = self.chunk_content(chunk, max_tokens=200000)
-                        print(f"Split chunk {i+1} into {len(subchunks)} subchunks")
+                        if response.text:
+                            if not report:
+                                all_analyses.append(response.text)
+                            analysis_count += 1
+                            print(f"Successfully analyzed chunk {i+1}")
+                        else:
+                            print(f"Error: Empty response from Gemini for chunk {i+1}")
+                    except Exception as chunk_error:
+                        print(f"Error processing chunk {i+1}: {str(chunk_error)}")
+                        # Try with an even smaller chunk if possible
+                        if chunk_tokens > 200000:
+                            print(f"Attempting to split chunk {i+1} further...")
+                            subchunks = self.chunk_content(chunk, max_tokens=200000)
+                            print(f"Split chunk {i+1} into {len(subchunks)} subchunks")
                         
-                        for j, subchunk in enumerate(subchunks):
-                            try:
-                                subchunk_prompt = f"{self.system_prompt}\n\nAnalyze this portion ({i+1}.{j+1}) of the Excel spreadsheet content:\n\n{subchunk}"
-                                subresponse = self.model.generate_content(
-                                    contents=subchunk_prompt,
-                                    generation_config=genai.types.GenerationConfig(
-                                        temperature=0.7,
-                                        top_p=0.8,
-                                        top_k=40,
-                                        max_output_tokens=8192,
+                            for j, subchunk in enumerate(subchunks):
+                                try:
+                                    subchunk_prompt = prefix.render(f"Analyze this portion ({i+1}.{j+1}) of the Excel spreadsheet content:\n\n{subchunk}")
+                                    subresponse = self._generate_content(
+                                        subchunk_prompt,
+                                        dict(
+                                            temperature=0.7,
+                                            top_p=0.8,
+                                            top_k=40,
+                                            max_output_tokens=8192,
+                                        ),
+                                        metrics,
+                                        prefix,
+                                        report,
+                                        SECTION_SEPARATOR if analysis_count else ""
                                     )
-                                )
                                 
-                                if subresponse.text:
-                                    all_analyses.append(subresponse.text)
-                                    print(f"Successfully analyzed subchunk {i+1}.{j+1}")
-                                else:
-                                    print(f"Error: Empty response from Gemini for subchunk {i+1}.{j+1}")
-                            except Exception as subchunk_error:
-                                print(f"Error processing subchunk {i+1}.{j+1}: {str(subchunk_error)}")
+                                    if subresponse.text:
+                                        if not report:
+                                            all_analyses.append(subresponse.text)
+                                        analysis_count += 1
+                                        print(f"Successfully analyzed subchunk {i+1}.{j+1}")
+                                    else:
+                                        print(f"Error: Empty response from Gemini for subchunk {i+1}.{j+1}")
+                                except Exception as subchunk_error:
+                                    print(f"Error processing subchunk {i+1}.{j+1}: {str(subchunk_error)}")
             
             # Combine all analyses
-            if all_analyses:
-                combined_analysis = "\n\n## Analysis of Next Section\n\n".join(all_analyses)
+            if analysis_count:
+                if report:
+                    return report.path
+                combined_analysis = SECTION_SEPARATOR.join(all_analyses)
                 return combined_analysis
             else:
                 print("Error: No successful analyses from any chunks")
@@ -156,15 +255,26 @@ Use clear, non-technical language suitable for business users who may not be Exc
             print(f"Error in LLM analysis: {str(e)}")
             return None
             
+    def stream_report(self, markdown_content: str, workbook_dir: str, metrics: Optional[JobMetrics] = None,
+                      shared_context: Optional[str] = None) -> Optional[str]:
+        """Analyze the markdown, writing the report to disk as the response streams in."""
+        report_path = Path(workbook_dir) / REPORT_FILENAME
+        try:
+            with StreamingReport(str(report_path), REPORT_HEADER) as report:
+                return self.analyze_markdown(markdown_content, metrics, shared_context, report=report)
+        except Exception as e:
+            print(f"Error streaming report: {str(e)}")
+            return None
+
     def save_report(self, report: str, workbook_dir: str) -> str:
         """Save the analysis report to a file."""
         try:
-            report_filename = "llm_analysis_report.md"
-            report_path = Path(workbook_dir) / report_filename
+            report_path = Path(workbook_dir) / REPORT_FILENAME
             
             with open(report_path, 'w', encoding='utf-8') as f:
-                f.write("# Excel Workbook Analysis Report\n\n")
+                f.write(REPORT_HEADER)
                 f.write(report)
+            write_section_index(str(report_path))
                 
             return str(report_path)
         except Exception as e:
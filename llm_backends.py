@@ -0,0 +1,364 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from datetime import timedelta
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional, Any, Callable
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.5-pro-preview-03-25'
+DEFAULT_CACHE_TTL_SECONDS = 3600
+
+FAKE_VOCABULARY = [
+    "input", "output", "calculation", "sheet", "formula", "revenue", "cost", "scenario",
+    "assumption", "validation", "dashboard", "summary", "workflow", "user", "model", "table",
+    "reference", "dependency", "total", "forecast", "period", "rate", "driver", "report",
+]
+
+
+class LLMBackendError(Exception):
+    """Raised when an LLM backend call fails."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is not None and (self.status_code == 429 or self.status_code >= 500)
+
+
+class RateLimitError(LLMBackendError):
+    """The provider rejected the call because a quota was exceeded (HTTP 429)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=429, retry_after=retry_after)
+
+
+class ServerError(LLMBackendError):
+    """The provider failed with a 5xx error."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message, status_code=status_code)
+
+
+class LLMResponse:
+    """Text and token usage returned by a backend."""
+
+    def __init__(self, text: str, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+                 cached_tokens: Optional[int] = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+
+class CachedContext:
+    """Handle to a prompt prefix cached on the provider side."""
+
+    def __init__(self, name: str, handle: Any = None, model: Any = None, prefix_tokens: Optional[int] = None):
+        self.name = name
+        self.handle = handle
+        self.model = model
+        self.prefix_tokens = prefix_tokens
+
+
+class LLMBackend(ABC):
+    """Interface shared by every LLM provider used by the analyzers."""
+
+    name = "base"
+
+    @abstractmethod
+    def generate(self, prompt: str, temperature: float = 0.7, top_p: float = 0.8, top_k: int = 40,
+                 max_output_tokens: int = 8192, cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        """Generate a completion for the prompt."""
+
+    def generate_stream(self, prompt: str, on_text: Callable[[str], None], temperature: float = 0.7,
+                        top_p: float = 0.8, top_k: int = 40, max_output_tokens: int = 8192,
+                        cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        """Generate text, passing each piece to on_text as it arrives."""
+        response = self.generate(prompt, temperature=temperature, top_p=top_p, top_k=top_k,
+                                 max_output_tokens=max_output_tokens, cached_context=cached_context)
+        on_text(response.text)
+        return response
+
+    def create_context_cache(self, system_instruction: str, contents: str,
+                             ttl_seconds: int = DEFAULT_CACHE_TTL_SECONDS) -> Optional[CachedContext]:
+        """Cache a prompt prefix with the provider; None when caching is unsupported."""
+        return None
+
+    def delete_context_cache(self, context: CachedContext) -> None:
+        pass
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-generativeai SDK."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_GEMINI_MODEL):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        self._genai = genai
+        self._google_exceptions = google_exceptions
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str, temperature: float = 0.7, top_p: float = 0.8, top_k: int = 40,
+                 max_output_tokens: int = 8192, cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        model = cached_context.model if cached_context else self.model
+        try:
+            response = model.generate_content(
+                contents=prompt,
+                generation_config=self._generation_config(temperature, top_p, top_k, max_output_tokens)
+            )
+        except self._google_exceptions.GoogleAPICallError as e:
+            raise self._translate_error(e) from e
+
+        try:
+            text = response.text
+        except ValueError:
+            # Blocked or empty candidates have no text
+            text = ""
+
+        return self._response(text, response)
+
+    def generate_stream(self, prompt: str, on_text: Callable[[str], None], temperature: float = 0.7,
+                        top_p: float = 0.8, top_k: int = 40, max_output_tokens: int = 8192,
+                        cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        model = cached_context.model if cached_context else self.model
+        pieces = []
+        try:
+            response = model.generate_content(
+                contents=prompt,
+                generation_config=self._generation_config(temperature, top_p, top_k, max_output_tokens),
+                stream=True
+            )
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                pieces.append(text)
+                on_text(text)
+        except self._google_exceptions.GoogleAPICallError as e:
+            raise self._translate_error(e) from e
+
+        return self._response("".join(pieces), response)
+
+    def _generation_config(self, temperature: float, top_p: float, top_k: int, max_output_tokens: int):
+        return self._genai.types.GenerationConfig(
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            max_output_tokens=max_output_tokens,
+        )
+
+    def _translate_error(self, error: Exception) -> LLMBackendError:
+        code = getattr(error, 'code', None)
+        if code == 429:
+            return RateLimitError(str(error))
+        if code is not None and code >= 500:
+            return ServerError(str(error), status_code=code)
+        return LLMBackendError(str(error), status_code=code)
+
+    def _response(self, text: str, response: Any) -> LLMResponse:
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(
+            text,
+            prompt_tokens=getattr(usage, 'prompt_token_count', None),
+            completion_tokens=getattr(usage, 'candidates_token_count', None),
+            cached_tokens=getattr(usage, 'cached_content_token_count', None)
+        )
+
+    def create_context_cache(self, system_instruction: str, contents: str,
+                             ttl_seconds: int = DEFAULT_CACHE_TTL_SECONDS) -> Optional[CachedContext]:
+        try:
+            from google.generativeai import caching
+
+            cache = caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=system_instruction,
+                contents=[contents],
+                ttl=timedelta(seconds=ttl_seconds)
+            )
+        except Exception as e:
+            # Older SDKs, unsupported models and prefixes below the provider minimum all land here
+            print(f"Context caching unavailable, sending full prompts: {str(e)}")
+            return None
+
+        usage = getattr(cache, 'usage_metadata', None)
+        return CachedContext(
+            cache.name,
+            handle=cache,
+            model=self._genai.GenerativeModel.from_cached_content(cached_content=cache),
+            prefix_tokens=getattr(usage, 'total_token_count', None)
+        )
+
+    def delete_context_cache(self, context: CachedContext) -> None:
+        try:
+            context.handle.delete()
+        except Exception as e:
+            print(f"Error deleting context cache {context.name}: {str(e)}")
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process stand-in for load testing and offline benchmarks.
+
+    Latency is a fixed per-call overhead plus completion_tokens / tokens_per_second.
+    error_rate injects 5xx failures and rate_limit_rpm returns 429s once more than
+    that many calls start within a rolling minute. Responses depend only on the
+    prompt and seed, so repeated runs produce identical output.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.05, tokens_per_second: float = 2000.0, output_tokens: int = 512,
+                 error_rate: float = 0.0, rate_limit_rpm: Optional[int] = None, seed: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self.seed = seed
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._call_times = deque()
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, text: str) -> int:
+        """Cheap token estimate (about four characters per token)."""
+        return max(1, len(text) // 4)
+
+    def _check_rate_limit(self) -> None:
+        if not self.rate_limit_rpm:
+            return
+        now = time.monotonic()
+        while self._call_times and now - self._call_times[0] >= 60:
+            self._call_times.popleft()
+        if len(self._call_times) >= self.rate_limit_rpm:
+            retry_after = 60 - (now - self._call_times[0])
+            raise RateLimitError(f"Fake backend quota of {self.rate_limit_rpm} requests/minute exceeded",
+                                 retry_after=retry_after)
+        self._call_times.append(now)
+
+    def generate(self, prompt: str, temperature: float = 0.7, top_p: float = 0.8, top_k: int = 40,
+                 max_output_tokens: int = 8192, cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        completion_tokens = self._start_call(max_output_tokens)
+        time.sleep(self.latency + completion_tokens / self.tokens_per_second)
+        return LLMResponse(
+            self._render_text(prompt, completion_tokens),
+            prompt_tokens=self.estimate_tokens(prompt),
+            completion_tokens=completion_tokens
+        )
+
+    def generate_stream(self, prompt: str, on_text: Callable[[str], None], temperature: float = 0.7,
+                        top_p: float = 0.8, top_k: int = 40, max_output_tokens: int = 8192,
+                        cached_context: Optional[CachedContext] = None) -> LLMResponse:
+        completion_tokens = self._start_call(max_output_tokens)
+        text = self._render_text(prompt, completion_tokens)
+        lines = text.splitlines(keepends=True)
+
+        # First token after the fixed latency, the rest paced at tokens_per_second
+        time.sleep(self.latency)
+        for line in lines:
+            time.sleep(completion_tokens / self.tokens_per_second / len(lines))
+            on_text(line)
+        return LLMResponse(text, prompt_tokens=self.estimate_tokens(prompt), completion_tokens=completion_tokens)
+
+    def _start_call(self, max_output_tokens: int) -> int:
+        """Count the call, apply the rate limit and injected errors; returns the completion size."""
+        with self._lock:
+            self.calls += 1
+            self._check_rate_limit()
+            fail = self._rng.random() < self.error_rate
+
+        if fail:
+            time.sleep(self.latency)
+            raise ServerError("Fake backend injected server error", status_code=503)
+
+        return min(self.output_tokens, max_output_tokens)
+
+    def _render_text(self, prompt: str, completion_tokens: int) -> str:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        rng = random.Random(digest)
+        lines = [f"## Generated Section {digest.hex()[:8]}", ""]
+        words = 0
+        while words < completion_tokens:
+            sentence = [rng.choice(FAKE_VOCABULARY) for _ in range(12)]
+            lines.append(f"- {' '.join(sentence).capitalize()}.")
+            words += len(sentence) + 2
+        return "\n".join(lines)
+
+
+class PromptPrefix:
+    """
+    System prompt and shared workbook context reused by every chunk of one generator's job.
+
+    When caching is requested and the backend supports it, the prefix is
+    uploaded once and each request only carries its own body. Otherwise each
+    prompt starts with the system prompt alone: the shared context repeats the
+    workbook summary that the content already holds, so sending it inline
+    would only add tokens. Caching only pays off when the prefix is sent more
+    than once, so callers pass cache=False for single requests.
+    """
+
+    def __init__(self, backend: LLMBackend, system_prompt: str, shared_context: Optional[str] = None,
+                 cache: bool = True):
+        self.backend = backend
+        self.system_prompt = system_prompt
+        self.shared_context = shared_context or ""
+        self.cache = cache
+        self.cached_context = None
+
+    def __enter__(self) -> "PromptPrefix":
+        if self.cache and self.shared_context:
+            self.cached_context = self.backend.create_context_cache(self.system_prompt, self.shared_context)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.cached_context:
+            self.backend.delete_context_cache(self.cached_context)
+            self.cached_context = None
+
+    def render(self, body: str) -> str:
+        """Build the prompt text for one request."""
+        if self.cached_context:
+            return body
+        return f"{self.system_prompt}\n\n{body}"
+
+    def generation_options(self) -> dict:
+        """Extra generate() arguments for requests that use this prefix."""
+        return {"cached_context": self.cached_context} if self.cached_context else {}
+
+
+def create_backend(api_key: Optional[str] = None, backend: Optional[str] = None) -> LLMBackend:
+    """
+    Create the configured LLM backend.
+
+    The backend name comes from the argument or the LLM_BACKEND environment
+    variable ("gemini" by default, or "fake"). The fake backend reads its
+    behavior from FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND,
+    FAKE_LLM_OUTPUT_TOKENS, FAKE_LLM_ERROR_RATE, FAKE_LLM_RATE_LIMIT_RPM and
+    FAKE_LLM_SEED.
+    """
+    backend = (backend or os.getenv('LLM_BACKEND', 'gemini')).lower()
+    if backend == 'gemini':
+        return GeminiBackend(api_key, model_name=os.getenv('GEMINI_MODEL', DEFAULT_GEMINI_MODEL))
+    if backend == 'fake':
+        rate_limit = os.getenv('FAKE_LLM_RATE_LIMIT_RPM')
+        return FakeBackend(
+            latency=float(os.getenv('FAKE_LLM_LATENCY', '0.05')),
+            tokens_per_second=float(os.getenv('FAKE_LLM_TOKENS_PER_SECOND', '2000')),
+            output_tokens=int(os.getenv('FAKE_LLM_OUTPUT_TOKENS', '512')),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+            rate_limit_rpm=int(rate_limit) if rate_limit else None,
+            seed=int(os.getenv('FAKE_LLM_SEED', '0'))
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
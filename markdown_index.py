@@ -0,0 +1,149 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+# Sidecar suffix for section indexes (e.g. "Sheet1.md" -> "Sheet1.md.index.json")
+INDEX_SUFFIX = ".index.json"
+
+# Sections larger than this are split into continuation pages
+DEFAULT_PAGE_SIZE = 64 * 1024
+
+HEADING_PATTERN = re.compile(rb'^(#{1,3})\s+(.*?)\s*$')
+
+
+def index_path_for(file_path: str) -> Path:
+    """Return the sidecar path that holds the section index for a file."""
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + INDEX_SUFFIX)
+
+
+def build_section_index(file_path: str, page_size: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Build a byte-offset index of the sections in a file.
+
+    Markdown files are split at level 1-3 headings. Other files (JSON, text) are
+    split into pages of roughly page_size bytes. In both cases sections never
+    exceed page_size by more than one line and always end on a line boundary,
+    so any single section can be read with one seek and one read.
+    """
+    file_path = Path(file_path)
+    is_markdown = file_path.suffix.lower() == '.md'
+    sections = []
+    current = None
+    offset = 0
+
+    def close_section(end: int) -> None:
+        if current is not None and end > current["start"]:
+            current["end"] = end
+            sections.append(current)
+
+    with file_path.open('rb') as f:
+        for line in f:
+            heading = HEADING_PATTERN.match(line) if is_markdown else None
+            if heading:
+                close_section(offset)
+                current = {
+                    "title": heading.group(2).decode('utf-8', errors='replace'),
+                    "level": len(heading.group(1)),
+                    "start": offset
+                }
+            elif current is None:
+                current = {
+                    "title": "(preamble)" if is_markdown else "Page 1",
+                    "level": 0,
+                    "start": offset
+                }
+            elif offset - current["start"] >= page_size:
+                # Split oversized sections (e.g. huge cell tables) into pages
+                close_section(offset)
+                part = current.get("part", 1) + 1
+                base_title = current.get("base_title", current["title"])
+                current = {
+                    "title": f"{base_title} (part {part})" if is_markdown else f"Page {len(sections) + 1}",
+                    "base_title": base_title,
+                    "part": part,
+                    "level": current["level"],
+                    "start": offset
+                }
+            offset += len(line)
+
+    close_section(offset)
+
+    for number, section in enumerate(sections):
+        section["number"] = number
+        section["size"] = section["end"] - section["start"]
+        section.pop("base_title", None)
+        section.pop("part", None)
+
+    stat = file_path.stat()
+    return {
+        "file": file_path.name,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "page_size": page_size,
+        "sections": sections
+    }
+
+
+def write_section_index(file_path: str, page_size: int = DEFAULT_PAGE_SIZE) -> str:
+    """Build the section index for a file and save it next to the file."""
+    index = build_section_index(file_path, page_size)
+    index_file = index_path_for(file_path)
+    with index_file.open('w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return str(index_file)
+
+
+def load_section_index(file_path: str) -> Dict[str, Any]:
+    """
+    Load the section index for a file, rebuilding it if it is missing or stale.
+    """
+    index_file = index_path_for(file_path)
+    if index_file.exists():
+        try:
+            with index_file.open('r', encoding='utf-8') as f:
+                index = json.load(f)
+            stat = os.stat(file_path)
+            if index.get("size") == stat.st_size and index.get("mtime") == stat.st_mtime:
+                return index
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read section index {index_file}: {str(e)}")
+
+    write_section_index(file_path)
+    with index_file.open('r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_section(file_path: str, index: Dict[str, Any], section_number: int) -> Optional[str]:
+    """Read a single section of a file using its byte offsets."""
+    sections = index.get("sections", [])
+    if section_number < 0 or section_number >= len(sections):
+        return None
+
+    section = sections[section_number]
+    with open(file_path, 'rb') as f:
+        f.seek(section["start"])
+        data = f.read(section["end"] - section["start"])
+    return data.decode('utf-8', errors='replace')
+
+
+def list_sections(index: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the section table of contents without internal fields."""
+    return [
+        {
+            "number": section["number"],
+            "title": section["title"],
+            "level": section["level"],
+            "start": section["start"],
+            "end": section["end"],
+            "size": section["size"]
+        }
+        for section in index.get("sections", [])
+    ]
+
+
+def is_index_file(filename: str) -> bool:
+    """Check whether a file is a section index sidecar."""
+    return filename.endswith(INDEX_SUFFIX)
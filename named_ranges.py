@@ -0,0 +1,140 @@
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import openpyxl
+from openpyxl.utils import range_boundaries
+
+from formula_catalog import QUOTED_PATTERN
+
+# Open ends of whole-row and whole-column references such as $1:$1 or $A:$A
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+RESERVED_PREFIX = "_xlnm."
+
+NAME_PATTERN = re.compile(r"(?<![A-Za-z0-9_.$\\])([A-Za-z_\\][A-Za-z0-9_.\\]*)(?![A-Za-z0-9_.\\]*\s*[(!])")
+
+
+class NamedRangeIndex:
+    """
+    Defined names of a workbook, resolved once into sheet rectangles.
+
+    Workbook-scoped and sheet-scoped names are collected together; every
+    destination of a range name becomes one entry with its bounds, and names
+    holding constants or formulas are kept without bounds. Per sheet the bounds
+    are stacked into an array so the names covering a cell are found with one
+    vectorized comparison.
+    """
+
+    def __init__(self, workbook: openpyxl.Workbook):
+        self.entries: List[Dict[str, Any]] = []
+        for name, definition in workbook.defined_names.items():
+            self._add(name, definition, None)
+        for worksheet in workbook.worksheets:
+            for name, definition in worksheet.defined_names.items():
+                self._add(name, definition, worksheet.title)
+
+        self.by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in self.entries:
+            self.by_name.setdefault(entry["name"].upper(), []).append(entry)
+
+        # Sheet title -> (bounds array of min_row, min_col, max_row, max_col; matching entries)
+        self.sheets: Dict[str, Tuple[np.ndarray, List[Dict[str, Any]]]] = {}
+        for entry in self.entries:
+            # Print areas and titles are listed but do not label cells
+            if entry["sheet"] is None or entry["name"].startswith(RESERVED_PREFIX):
+                continue
+            self.sheets.setdefault(entry["sheet"], (None, []))[1].append(entry)
+        for title, (_, entries) in self.sheets.items():
+            bounds = np.array([entry["bounds"] for entry in entries], dtype=np.int64)
+            self.sheets[title] = (bounds, entries)
+
+        self._references: Dict[Tuple[str, Optional[str]], List[Dict[str, Any]]] = {}
+
+    def _add(self, name: str, definition: Any, scope: Optional[str]) -> None:
+        destinations = []
+        try:
+            destinations = list(definition.destinations)
+        except Exception as e:
+            print(f"Warning: Could not resolve named range {name}: {str(e)}")
+
+        if not destinations:
+            self.entries.append({"name": name, "scope": scope, "range": str(definition.value),
+                                 "sheet": None, "bounds": None})
+            return
+
+        for sheet, coordinate in destinations:
+            try:
+                min_col, min_row, max_col, max_row = range_boundaries(coordinate.replace('$', ''))
+            except ValueError:
+                continue
+            self.entries.append({
+                "name": name,
+                "scope": scope,
+                "range": f"{sheet}!{coordinate}",
+                "sheet": sheet,
+                "bounds": (min_row or 1, min_col or 1, max_row or MAX_ROW, max_col or MAX_COLUMN)
+            })
+
+    def for_sheet(self, title: str) -> List[Dict[str, Any]]:
+        """Names whose destination lies on the given sheet."""
+        return [entry for entry in self.entries if entry["sheet"] == title]
+
+    def names_overlapping(self, title: str, min_row: int, min_col: int, max_row: int,
+                          max_col: int) -> List[Dict[str, Any]]:
+        """Names on a sheet whose rectangle intersects the given one, smallest first."""
+        bounds, entries = self.sheets.get(title, (None, []))
+        if not entries:
+            return []
+        found = np.nonzero((bounds[:, 0] <= max_row) & (bounds[:, 1] <= max_col)
+                           & (bounds[:, 2] >= min_row) & (bounds[:, 3] >= min_col))[0]
+        areas = (bounds[found, 2] - bounds[found, 0] + 1) * (bounds[found, 3] - bounds[found, 1] + 1)
+        return [entries[i] for i in found[np.argsort(areas, kind="stable")]]
+
+    def names_at(self, title: str, row: int, column: int) -> List[Dict[str, Any]]:
+        """Names on a sheet covering a cell, smallest first."""
+        return self.names_overlapping(title, row, column, row, column)
+
+    def resolve(self, name: str, scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return the entries of a name, preferring a definition scoped to the
+        given sheet over the workbook-level one, as Excel does.
+        """
+        entries = self.by_name.get(name.upper(), [])
+        local = [entry for entry in entries if scope is not None and entry["scope"] == scope]
+        return local or [entry for entry in entries if entry["scope"] is None]
+
+    def referenced_names(self, formula: str, scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resolve the defined names a formula refers to, in order of first use."""
+        key = (formula, scope)
+        references = self._references.get(key)
+        if references is None:
+            references = []
+            if self.by_name:
+                unquoted = QUOTED_PATTERN.sub(lambda found: found.group(0)[0] * 2, formula)
+                seen = set()
+                for found in NAME_PATTERN.finditer(unquoted):
+                    name = found.group(1).upper()
+                    if name in self.by_name and name not in seen:
+                        seen.add(name)
+                        references.extend(self.resolve(name, scope))
+            self._references[key] = references
+        return references
+
+
+def get_named_range_index(workbook: openpyxl.Workbook) -> NamedRangeIndex:
+    """Return the workbook's named range index, building it on first use."""
+    index = getattr(workbook, 'named_range_index', None)
+    if index is None:
+        index = NamedRangeIndex(workbook)
+        workbook.named_range_index = index
+    return index
+
+
+def label_names(entries: List[Dict[str, Any]]) -> Optional[str]:
+    """Join entry names for a label, or None when there are none."""
+    names = []
+    for entry in entries:
+        if entry["name"] not in names:
+            names.append(entry["name"])
+    return ", ".join(names) if names else None
@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+METRIC_PREFIX = "excel_to_llm_"
+TIMING_REPORT_FILENAME = "timing_report.json"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Help text for the metrics exposed on /metrics
+METRIC_HELP = {
+    "cells_visited": "Worksheet cells visited by the converters",
+    "formulas_parsed": "Formulas parsed and categorized",
+    "llm_requests": "LLM generate_content calls",
+    "llm_errors": "LLM generate_content calls that failed",
+    "llm_retries": "LLM calls retried after a 429 or 5xx response",
+    "llm_rate_limited": "LLM calls rejected with a 429 response",
+    "llm_tokens_sent": "Prompt tokens sent to the LLM",
+    "llm_tokens_received": "Completion tokens received from the LLM",
+    "llm_cached_tokens": "Prompt tokens served from a provider context cache",
+    "llm_chunks": "Content chunks sent for LLM analysis",
+    "llm_budget_trimmed_tokens": "Content tokens left out to fit the LLM token budget",
+    "cache_hits": "Conversions served from the result cache",
+    "cache_misses": "Conversions that ran the full pipeline",
+    "jobs": "Conversion jobs finished",
+    "stage_duration_seconds": "Duration of pipeline stages",
+    "llm_request_duration_seconds": "Duration of individual LLM calls",
+}
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key: Tuple[Tuple[str, str], ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(label_key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._histograms[key] = histogram
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        seen = set()
+        for (name, label_key), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(label_key)} {value}")
+
+        for (name, label_key), histogram in histograms:
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{metric}_bucket{_format_labels(label_key, {'le': repr(bound)})} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(label_key, {'le': '+Inf'})} {histogram['count']}")
+            lines.append(f"{metric}_sum{_format_labels(label_key)} {histogram['sum']}")
+            lines.append(f"{metric}_count{_format_labels(label_key)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry scraped by the /metrics endpoint
+REGISTRY = MetricsRegistry()
+
+
+class JobMetrics:
+    """Stage timings, counters and histograms recorded for a single conversion job."""
+
+    def __init__(self, job_name: str, registry: MetricsRegistry = REGISTRY):
+        self.job_name = job_name
+        self.registry = registry
+        self.started = datetime.now()
+        self.stages = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage; repeated stages accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "max_seconds": 0.0})
+                stage["seconds"] += elapsed
+                stage["calls"] += 1
+                stage["max_seconds"] = max(stage["max_seconds"], elapsed)
+            self.registry.observe("stage_duration_seconds", elapsed, stage=name)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        self.registry.inc(name, amount, **labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            values = self.histograms.setdefault(name, [])
+            values.append(value)
+        self.registry.observe(name, value, **labels)
+
+    def report(self) -> Dict[str, Any]:
+        """Summarize the job as a JSON-serializable dict."""
+        with self._lock:
+            histograms = {}
+            for name, values in self.histograms.items():
+                ordered = sorted(values)
+                histograms[name] = {
+                    "count": len(ordered),
+                    "sum": round(sum(ordered), 6),
+                    "min": round(ordered[0], 6),
+                    "p50": round(ordered[len(ordered) // 2], 6),
+                    "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6),
+                    "max": round(ordered[-1], 6)
+                }
+            stages = {
+                name: {
+                    "seconds": round(stage["seconds"], 6),
+                    "calls": stage["calls"],
+                    "max_seconds": round(stage["max_seconds"], 6)
+                }
+                for name, stage in self.stages.items()
+            }
+            return {
+                "job": self.job_name,
+                "started": self.started.isoformat(timespec='seconds'),
+                "finished": datetime.now().isoformat(timespec='seconds'),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "histograms": histograms
+            }
+
+    def write_report(self, directory: str) -> str:
+        """Write the job report as timing_report.json into an output directory."""
+        report_path = Path(directory) / TIMING_REPORT_FILENAME
+        with report_path.open('w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        return str(report_path)
+
+
+def slowest_stages(report: Dict[str, Any], limit: int = 5) -> List[Tuple[str, float]]:
+    """Return the slowest stages from a job report."""
+    stages = sorted(report.get("stages", {}).items(), key=lambda item: item[1]["seconds"], reverse=True)
+    return [(name, stage["seconds"]) for name, stage in stages[:limit]]
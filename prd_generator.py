@@ -1,15 +1,46 @@
 import os
-import google.generativeai as genai
 from typing import Optional, Dict, List, Any
 import tiktoken
 from pathlib import Path
+import time
 import json
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from markdown_index import write_section_index
+from pipeline_metrics import JobMetrics
+from streaming_output import StreamingReport
+from llm_backends import LLMBackend, LLMResponse, PromptPrefix, create_backend
+from request_governor import RequestGovernor, get_default_governor
+from token_budget import apply_token_budget, get_token_budget
+
+MAX_OUTPUT_TOKENS = 8192
+MAX_CHUNK_TOKENS = 400000
+# Most tokens one call can return (Gemini 2.5 Pro allows 65,536); synthesis budgets are planned against it
+DEFAULT_MODEL_OUTPUT_TOKENS = 65536
+# Intermediate merges keep roughly this share of their input, within these bounds
+SYNTHESIS_RETENTION = 0.6
+MIN_SYNTHESIS_OUTPUT_TOKENS = 2048
+
+SECTION_BREAK = f"\n\n{'=' * 40} SECTION BREAK {'=' * 40}\n\n"
 
 class PRDGenerator:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro-preview-03-25')
+    def __init__(self, api_key: str, backend: Optional[LLMBackend] = None,
+                 governor: Optional[RequestGovernor] = None, synthesis_fan_in: int = 4,
+                 synthesis_workers: int = 4, token_budget: Optional[int] = None,
+                 output_token_limit: Optional[int] = None):
+        # Gemini by default; any LLMBackend (e.g. the offline FakeBackend) can be injected
+        self.backend = backend or create_backend(api_key)
+        # Shared across analyzers so every LLM call in the process draws on one quota
+        self.governor = governor or get_default_governor()
+        # Partial PRDs are merged in groups of synthesis_fan_in, one tree level at a time;
+        # a fan-in of 0 merges everything in a single synthesis call
+        self.synthesis_fan_in = synthesis_fan_in
+        self.synthesis_workers = synthesis_workers
+        # The model's output limit from LLM_MAX_OUTPUT_TOKENS; a synthesis call never asks for more
+        self.output_token_limit = output_token_limit or \
+            int(os.getenv('LLM_MAX_OUTPUT_TOKENS', str(DEFAULT_MODEL_OUTPUT_TOKENS)))
+        # Content above this many tokens is trimmed to its most informative sections; 0 sends everything
+        self.token_budget = get_token_budget() if token_budget is None else token_budget
         self.system_prompt = """You are an expert software architect and product manager tasked with creating a comprehensive Product Requirements Document (PRD) for recreating Excel spreadsheet functionality in a software application. Based on the detailed Excel analysis provided, create an extremely detailed PRD that would guide an AI-driven IDE (like Cursor) to build a functionally equivalent software tool.
 
 Your PRD should include the following sections:
@@ -210,15 +241,79 @@ Format with clear headers, bullet points, code examples where applicable, and nu
         
         return chunks
 
-    def generate_prd(self, markdown_content: str, spreadsheet_metadata: Dict[str, Any] = None) -> Optional[str]:
+    def _generate_content(self, prompt: str, generation_config: Dict[str, Any], metrics: JobMetrics,
+                          prefix: Optional[PromptPrefix] = None, report: Optional[StreamingReport] = None,
+                          lead: str = "") -> LLMResponse:
+        """
+        Call the LLM backend through the request governor and record timing and token usage.
+
+        With a report, the response is streamed into it as it arrives, preceded by
+        `lead` once the first text shows up; failed attempts are rolled back.
+        """
+        if prefix:
+            generation_config = dict(generation_config, **prefix.generation_options())
+        metrics.increment("llm_requests", generator="prd")
+        estimated_tokens = self.count_tokens(prompt)
+
+        if report:
+            mark = report.mark()
+
+            def call() -> LLMResponse:
+                report.rollback(mark)
+                pending_lead = [lead]
+
+                def on_text(text: str) -> None:
+                    if text and pending_lead:
+                        report.write(pending_lead.pop())
+                    report.write(text)
+
+                return self.backend.generate_stream(prompt, on_text, **generation_config)
+        else:
+            def call() -> LLMResponse:
+                return self.backend.generate(prompt, **generation_config)
+
+        start = time.perf_counter()
+        try:
+            response = self.governor.call(
+                call,
+                estimated_tokens=estimated_tokens,
+                metrics=metrics,
+                label="prd"
+            )
+        except Exception:
+            metrics.increment("llm_errors", generator="prd")
+            if report:
+                report.rollback(mark)
+            raise
+        finally:
+            metrics.observe("llm_request_duration_seconds", time.perf_counter() - start, generator="prd")
+        
+        prompt_tokens = response.prompt_tokens or estimated_tokens
+        completion_tokens = response.completion_tokens or 0
+        metrics.increment("llm_tokens_sent", prompt_tokens, generator="prd")
+        metrics.increment("llm_tokens_received", completion_tokens, generator="prd")
+        if response.cached_tokens:
+            metrics.increment("llm_cached_tokens", response.cached_tokens, generator="prd")
+        return response
+
+    def generate_prd(self, markdown_content: str, spreadsheet_metadata: Dict[str, Any] = None,
+                     metrics: Optional[JobMetrics] = None, shared_context: Optional[str] = None,
+                     report: Optional[StreamingReport] = None) -> Optional[str]:
         """
         Generate a comprehensive PRD based on the Excel analysis and metadata.
+        With a report, the final document is streamed into it and the report
+        path is returned.
         """
+        metrics = metrics or JobMetrics("prd")
         try:
             # Check content size and chunk if necessary
             content_tokens = self.count_tokens(markdown_content)
             print(f"Total content tokens: {content_tokens}")
             
+            # Keep the most informative sections within the token budget so no synthesis pass is needed
+            markdown_content, content_tokens = apply_token_budget(markdown_content, content_tokens, self.token_budget,
+                                                                  self.count_tokens, metrics, "prd")
+            
             # Prepare enhanced prompt with metadata if available
             enhanced_prompt = self.system_prompt
             
@@ -231,49 +326,113 @@ Format with clear headers, bullet points, code examples where applicable, and nu
             
             # Process in chunks for large documents
             print("Chunking content for PRD generation...")
-            chunks = self.chunk_content(markdown_content, max_tokens=400000)
+            chunks = [markdown_content] if content_tokens <= MAX_CHUNK_TOKENS else \
+                self.chunk_content(markdown_content, max_tokens=MAX_CHUNK_TOKENS)
             print(f"Split content into {len(chunks)} chunks")
+            metrics.increment("llm_chunks", len(chunks), generator="prd")
             
-            # Process each chunk and combine results
-            all_analyses = []
-            for i, chunk in enumerate(chunks):
-                chunk_tokens = self.count_tokens(chunk)
-                print(f"Processing chunk {i+1}/{len(chunks)}, tokens: {chunk_tokens}")
+            # With several chunks the system prompt, metadata and workbook context are cached once when the backend supports it
+            with PromptPrefix(self.backend, enhanced_prompt, shared_context, cache=len(chunks) > 1) as prefix:
+                # Process each chunk and combine results
+                all_analyses = []
+                for i, chunk in enumerate(chunks):
+                    chunk_tokens = self.count_tokens(chunk)
+                    print(f"Processing chunk {i+1}/{len(chunks)}, tokens: {chunk_tokens}")
                 
-                # Create chunk-specific prompt
-                chunk_prompt = f"{enhanced_prompt}\n\nAnalyze this portion ({i+1}/{len(chunks)}) of the Excel spreadsheet for PRD generation:\n\n{chunk}"
+                    # Create chunk-specific prompt
+                    chunk_prompt = prefix.render(f"Analyze this portion ({i+1}/{len(chunks)}) of the Excel spreadsheet for PRD generation:\n\n{chunk}")
                 
-                # Add context for multi-chunk processing
-                if len(chunks) > 1:
-                    chunk_prompt += f"\n\nNOTE: This is chunk {i+1} of {len(chunks)}. Focus on the functional requirements and technical specifications for the components described in this chunk. Ensure your PRD section integrates well with other potential chunks."
+                    # Add context for multi-chunk processing
+                    if len(chunks) > 1:
+                        chunk_prompt += f"\n\nNOTE: This is chunk {i+1} of {len(chunks)}. Focus on the functional requirements and technical specifications for the components described in this chunk. Ensure your PRD section integrates well with other potential chunks."
                 
-                try:
-                    response = self.model.generate_content(
-                        contents=chunk_prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.3,  # Lower temperature for more structured output
-                            top_p=0.9,
-                            top_k=40,
-                            max_output_tokens=8192,
+                    try:
+                        response = self._generate_content(
+                            chunk_prompt,
+                            dict(
+                                temperature=0.3,  # Lower temperature for more structured output
+                                top_p=0.9,
+                                top_k=40,
+                                max_output_tokens=8192,
+                            ),
+                            metrics,
+                            prefix,
+                            # A single chunk is the final PRD, so it can stream straight to the report
+                            report if len(chunks) == 1 else None
                         )
-                    )
                     
-                    if response.text:
-                        all_analyses.append(response.text)
-                        print(f"Successfully generated PRD section {i+1}")
-                    else:
-                        print(f"Error: Empty response from Gemini for chunk {i+1}")
+                        if response.text:
+                            all_analyses.append(response.text)
+                            print(f"Successfully generated PRD section {i+1}")
+                        else:
+                            print(f"Error: Empty response from Gemini for chunk {i+1}")
                         
-                except Exception as chunk_error:
-                    print(f"Error processing chunk {i+1}: {str(chunk_error)}")
-                    continue
+                    except Exception as chunk_error:
+                        print(f"Error processing chunk {i+1}: {str(chunk_error)}")
+                        continue
             
             # Combine all PRD sections
             if all_analyses:
-                # If multiple chunks, create a synthesis prompt
-                if len(all_analyses) > 1:
-                    print("Synthesizing multi-chunk PRD...")
-                    synthesis_prompt = f"""You are tasked with creating a final, cohesive Product Requirements Document by synthesizing the following {len(all_analyses)} partial PRD sections. These sections were generated from different parts of a complex Excel spreadsheet analysis.
+                if report and len(chunks) == 1:
+                    return report.path
+                return self.synthesize_sections(all_analyses, metrics, report)
+            else:
+                print("Error: No successful PRD generation from any chunks")
+                return None
+                
+        except Exception as e:
+            print(f"Error in PRD generation: {str(e)}")
+            return None
+
+    def plan_synthesis_level(self, section_tokens: List[int], final: bool) -> List[Dict[str, Any]]:
+        """
+        Group sections for one level of the synthesis tree and budget each merge.
+
+        Budgets are bounded by the model's output limit rather than the per-chunk
+        MAX_OUTPUT_TOKENS. The last level may return as much as its input;
+        intermediate merges get a share of their input so the next level's
+        prompt stays bounded.
+        """
+        fan_in = self.synthesis_fan_in if self.synthesis_fan_in and self.synthesis_fan_in > 1 else len(section_tokens)
+        groups = []
+        for start in range(0, len(section_tokens), fan_in):
+            indexes = list(range(start, min(start + fan_in, len(section_tokens))))
+            input_tokens = sum(section_tokens[i] for i in indexes)
+            if final:
+                budget = max(MAX_OUTPUT_TOKENS, input_tokens)
+            else:
+                budget = max(MIN_SYNTHESIS_OUTPUT_TOKENS, int(input_tokens * SYNTHESIS_RETENTION))
+            groups.append({"sections": indexes, "input_tokens": input_tokens,
+                           "max_output_tokens": min(self.output_token_limit, budget)})
+        return groups
+
+    def plan_final_parts(self, section_tokens: List[int]) -> List[Dict[str, Any]]:
+        """
+        Group the last level's sections when together they exceed one call's output.
+
+        Consecutive sections are packed into parts whose input fits the output
+        limit; each part is merged on its own and the parts are concatenated,
+        so no requirement is squeezed out to fit a single call.
+        """
+        groups = []
+        for index, tokens in enumerate(section_tokens):
+            if groups and groups[-1]["input_tokens"] + tokens <= self.output_token_limit:
+                groups[-1]["sections"].append(index)
+                groups[-1]["input_tokens"] += tokens
+            else:
+                groups.append({"sections": [index], "input_tokens": tokens})
+        for group in groups:
+            group["max_output_tokens"] = min(self.output_token_limit, max(MAX_OUTPUT_TOKENS, group["input_tokens"]))
+        return groups
+
+    def build_synthesis_prompt(self, sections: List[str], final: bool) -> str:
+        """Build the prompt that merges a group of partial PRD sections."""
+        if final:
+            intro = f"""You are tasked with creating a final, cohesive Product Requirements Document by synthesizing the following {len(sections)} partial PRD sections. These sections were generated from different parts of a complex Excel spreadsheet analysis."""
+        else:
+            intro = f"""You are tasked with merging the following {len(sections)} partial PRD sections into one partial PRD. These sections were generated from different parts of a complex Excel spreadsheet analysis, and your output will later be merged with other partial PRDs, so keep every requirement, data field and formula description rather than summarizing them away."""
+
+        return f"""{intro}
 
 Your task:
 1. Merge overlapping sections intelligently
@@ -286,45 +445,96 @@ Your task:
 Here are the partial PRD sections to synthesize:
 
 {"=" * 80}
-""" + f"\n\n{'=' * 40} SECTION BREAK {'=' * 40}\n\n".join(all_analyses)
-
-                    try:
-                        synthesis_response = self.model.generate_content(
-                            contents=synthesis_prompt,
-                            generation_config=genai.types.GenerationConfig(
-                                temperature=0.2,
-                                top_p=0.9,
-                                top_k=40,
-                                max_output_tokens=8192,
-                            )
-                        )
-                        
-                        if synthesis_response.text:
-                            return synthesis_response.text
-                        else:
-                            print("Synthesis failed, returning combined sections")
-                            return "\n\n# PRD SECTION BREAK\n\n".join(all_analyses)
-                            
-                    except Exception as synthesis_error:
-                        print(f"Error in synthesis: {str(synthesis_error)}")
-                        return "\n\n# PRD SECTION BREAK\n\n".join(all_analyses)
-                else:
-                    return all_analyses[0]
-            else:
-                print("Error: No successful PRD generation from any chunks")
-                return None
-                
-        except Exception as e:
-            print(f"Error in PRD generation: {str(e)}")
-            return None
-
-    def save_prd(self, prd_content: str, workbook_dir: str, filename: str = "software_prd.md") -> str:
-        """Save the PRD to a file with proper formatting and metadata."""
+""" + SECTION_BREAK.join(sections)
+
+    def _merge_group(self, sections: List[str], max_output_tokens: int, final: bool, metrics: JobMetrics,
+                     report: Optional[StreamingReport] = None) -> str:
+        """Merge one group of sections, falling back to concatenation if the call fails."""
+        if len(sections) == 1:
+            if report:
+                report.write(sections[0])
+            return sections[0]
         try:
-            prd_path = Path(workbook_dir) / filename
-            
-            # Add header with metadata
-            header = f"""# Product Requirements Document
+            response = self._generate_content(
+                self.build_synthesis_prompt(sections, final),
+                dict(
+                    temperature=0.2,
+                    top_p=0.9,
+                    top_k=40,
+                    max_output_tokens=max_output_tokens,
+                ),
+                metrics,
+                report=report
+            )
+            if response.text:
+                return response.text
+            print("Synthesis failed, returning combined sections")
+        except Exception as synthesis_error:
+            print(f"Error in synthesis: {str(synthesis_error)}")
+        combined = "\n\n# PRD SECTION BREAK\n\n".join(sections)
+        if report:
+            report.write(combined)
+        return combined
+
+    def synthesize_sections(self, sections: List[str], metrics: Optional[JobMetrics] = None,
+                            report: Optional[StreamingReport] = None) -> str:
+        """
+        Reduce partial PRD sections to one document with a tree of merges.
+
+        Each level merges groups of synthesis_fan_in sections in parallel, so the
+        number of serial LLM calls grows with log(sections) and no single prompt
+        has to hold every section. If the last level's sections exceed what one
+        call can return, they are merged in parts that are concatenated instead.
+        With a report, the final merge is streamed into it and the report path
+        is returned.
+        """
+        metrics = metrics or JobMetrics("prd")
+        if len(sections) == 1:
+            if report:
+                report.write(sections[0])
+                return report.path
+            return sections[0]
+
+        level = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.synthesis_workers)) as executor:
+            while len(sections) > 1:
+                level += 1
+                section_tokens = [self.count_tokens(section) for section in sections]
+                final = not self.synthesis_fan_in or self.synthesis_fan_in <= 1 or len(sections) <= self.synthesis_fan_in
+                if final and sum(section_tokens) > self.output_token_limit:
+                    groups = self.plan_final_parts(section_tokens)
+                    print(f"Synthesizing multi-chunk PRD, level {level}: {len(sections)} sections into "
+                          f"{len(groups)} concatenated parts (output budget "
+                          f"{', '.join(str(g['max_output_tokens']) for g in groups)})")
+                    with metrics.stage(f"prd_synthesis_level_{level}"):
+                        futures = [
+                            executor.submit(self._merge_group, [sections[i] for i in group["sections"]],
+                                            group["max_output_tokens"], False, metrics)
+                            for group in groups
+                        ]
+                        parts = [future.result() for future in futures]
+                    if report:
+                        for part in parts:
+                            report.write(part + "\n\n")
+                        return report.path
+                    return "\n\n".join(parts)
+                groups = self.plan_synthesis_level(section_tokens, final)
+                print(f"Synthesizing multi-chunk PRD, level {level}: {len(sections)} sections into {len(groups)} "
+                      f"(output budget {', '.join(str(g['max_output_tokens']) for g in groups)})")
+
+                with metrics.stage(f"prd_synthesis_level_{level}"):
+                    futures = [
+                        executor.submit(self._merge_group, [sections[i] for i in group["sections"]],
+                                        group["max_output_tokens"], final, metrics, report if final else None)
+                        for group in groups
+                    ]
+                    sections = [future.result() for future in futures]
+
+        return report.path if report else sections[0]
+
+    def prd_header(self) -> str:
+        """Header written at the top of every PRD file."""
+        return f"""# Product Requirements Document
 ## Software Implementation of Excel Spreadsheet
 
 **Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
@@ -334,10 +544,28 @@ Here are the partial PRD sections to synthesize:
 ---
 
 """
+
+    def stream_prd(self, markdown_content: str, workbook_dir: str, spreadsheet_metadata: Dict[str, Any] = None,
+                   metrics: Optional[JobMetrics] = None, shared_context: Optional[str] = None,
+                   filename: str = "software_prd.md") -> Optional[str]:
+        """Generate the PRD, writing it to disk as the final response streams in."""
+        prd_path = Path(workbook_dir) / filename
+        try:
+            with StreamingReport(str(prd_path), self.prd_header()) as report:
+                return self.generate_prd(markdown_content, spreadsheet_metadata, metrics, shared_context, report=report)
+        except Exception as e:
+            print(f"Error streaming PRD: {str(e)}")
+            return None
+
+    def save_prd(self, prd_content: str, workbook_dir: str, filename: str = "software_prd.md") -> str:
+        """Save the PRD to a file with proper formatting and metadata."""
+        try:
+            prd_path = Path(workbook_dir) / filename
             
             with open(prd_path, 'w', encoding='utf-8') as f:
-                f.write(header)
+                f.write(self.prd_header())
                 f.write(prd_content)
+            write_section_index(str(prd_path))
                 
             return str(prd_path)
         except Exception as e:
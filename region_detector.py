@@ -0,0 +1,200 @@
+from datetime import date, datetime, time
+from typing import Dict, List, Any
+
+import numpy as np
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+from openpyxl.worksheet.worksheet import Worksheet
+
+# Cell kinds stored in the per-sheet type grid
+CELL_EMPTY = 0
+CELL_TEXT = 1
+CELL_NUMBER = 2
+CELL_DATE = 3
+CELL_BOOLEAN = 4
+CELL_FORMULA = 5
+KIND_NAMES = ["empty", "text", "numeric", "date", "boolean", "formula"]
+
+MIN_TABLE_ROWS = 2
+MIN_TABLE_COLUMNS = 2
+MAX_HEADER_ROWS = 3
+
+
+def cell_kind(value: Any) -> int:
+    """Classify a cell value for the type grid."""
+    if value is None:
+        return CELL_EMPTY
+    if isinstance(value, bool):
+        return CELL_BOOLEAN
+    if isinstance(value, (int, float)):
+        return CELL_NUMBER
+    if isinstance(value, (datetime, date, time)):
+        return CELL_DATE
+    if isinstance(value, (ArrayFormula, DataTableFormula)):
+        return CELL_FORMULA
+    if isinstance(value, str):
+        if not value.strip():
+            return CELL_EMPTY
+        return CELL_FORMULA if value.startswith('=') else CELL_TEXT
+    return CELL_TEXT
+
+
+def get_type_grid(worksheet: Worksheet) -> np.ndarray:
+    """
+    Return the sheet's cell kinds as a (rows, columns) int8 array.
+
+    Built from the worksheet's stored cells in one pass and cached on the
+    worksheet; grid[r, c] describes cell (r + 1, c + 1). Unlike iter_rows this
+    does not materialize empty cells in the sheet's bounding box.
+    """
+    grid = getattr(worksheet, 'type_grid', None)
+    if grid is None:
+        grid = np.zeros((worksheet.max_row, worksheet.max_column), dtype=np.int8)
+        cells = worksheet._cells
+        if cells:
+            coordinates = np.array(list(cells.keys()), dtype=np.int64)
+            kinds = np.fromiter((cell_kind(cell.value) for cell in cells.values()), dtype=np.int8,
+                                count=len(cells))
+            grid[coordinates[:, 0] - 1, coordinates[:, 1] - 1] = kinds
+        worksheet.type_grid = grid
+    return grid
+
+
+def label_blocks(occupied: np.ndarray) -> List[Dict[str, int]]:
+    """
+    Find the bounding boxes of 4-connected occupied blocks.
+
+    Each row is split into runs of occupied cells in one vectorized pass and
+    runs that overlap a run in the row above are merged with union-find, so
+    the Python work scales with the number of runs rather than cells.
+    """
+    padded = np.zeros((occupied.shape[0], occupied.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = occupied
+    edge_rows, edge_cols = np.nonzero(np.diff(padded, axis=1))
+    # Edges come in (start, end) pairs per row; end is exclusive
+    run_rows, starts, ends = edge_rows[0::2], edge_cols[0::2], edge_cols[1::2]
+
+    parent = list(range(len(starts)))
+
+    def find(label: int) -> int:
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    previous = []
+    current = []
+    current_row = -1
+    for label, (row, start, end) in enumerate(zip(run_rows.tolist(), starts.tolist(), ends.tolist())):
+        if row != current_row:
+            previous = current if row == current_row + 1 else []
+            current = []
+            current_row = row
+            cursor = 0
+        while cursor < len(previous) and previous[cursor][1] <= start:
+            cursor += 1
+        above = cursor
+        while above < len(previous) and previous[above][0] < end:
+            root, other = find(label), find(previous[above][2])
+            if root != other:
+                parent[max(root, other)] = min(root, other)
+            above += 1
+        current.append((start, end, label))
+
+    boxes = {}
+    for label, (row, start, end) in enumerate(zip(run_rows.tolist(), starts.tolist(), ends.tolist())):
+        root = find(label)
+        box = boxes.get(root)
+        if box is None:
+            boxes[root] = {"min_row": row, "max_row": row, "min_col": start, "max_col": end - 1,
+                           "cells": end - start}
+        else:
+            box["min_row"] = min(box["min_row"], row)
+            box["max_row"] = max(box["max_row"], row)
+            box["min_col"] = min(box["min_col"], start)
+            box["max_col"] = max(box["max_col"], end - 1)
+            box["cells"] += end - start
+    return sorted(boxes.values(), key=lambda box: (box["min_row"], box["min_col"]))
+
+
+def count_header_rows(block: np.ndarray, bold_first_row: bool) -> int:
+    """Count leading text-only rows that sit above rows holding numbers, dates or formulas."""
+    occupied = block != CELL_EMPTY
+    text_only = np.all((block == CELL_TEXT) | ~occupied, axis=1) & occupied.any(axis=1)
+    if text_only.all():
+        # A block of labels only has a header if it is styled as one
+        return 1 if bold_first_row else 0
+    header_rows = 0
+    while header_rows < min(MAX_HEADER_ROWS, block.shape[0] - 1) and text_only[header_rows]:
+        header_rows += 1
+    return header_rows
+
+
+def is_bold_row(worksheet: Worksheet, row: int, min_col: int, max_col: int) -> bool:
+    """Check whether most occupied cells of a row are bold."""
+    cells = [cell for cell in next(worksheet.iter_rows(min_row=row, max_row=row, min_col=min_col,
+                                                       max_col=max_col)) if cell.value is not None]
+    return bool(cells) and sum(1 for cell in cells if cell.font and cell.font.bold) * 2 > len(cells)
+
+
+def header_names(worksheet: Worksheet, region: Dict[str, Any]) -> List[str]:
+    """Join the header rows of a region into one name per column."""
+    min_col, max_col = region["min_col"], region["max_col"]
+    if not region["header_rows"]:
+        return [f"Column_{get_column_letter(column)}" for column in range(min_col, max_col + 1)]
+    parts = [[] for _ in range(min_col, max_col + 1)]
+    for row in worksheet.iter_rows(min_row=region["min_row"], max_row=region["min_row"] + region["header_rows"] - 1,
+                                   min_col=min_col, max_col=max_col, values_only=True):
+        for offset, value in enumerate(row):
+            if value is not None and str(value).strip():
+                parts[offset].append(str(value).strip())
+    return [" / ".join(names) if names else f"Column_{get_column_letter(min_col + offset)}"
+            for offset, names in enumerate(parts)]
+
+
+def column_kinds(block: np.ndarray) -> List[str]:
+    """Name the most common non-empty kind in each column of a block's data rows."""
+    kinds = []
+    for column in block.T:
+        counts = np.bincount(column, minlength=len(KIND_NAMES))
+        counts[CELL_EMPTY] = 0
+        kinds.append(KIND_NAMES[int(counts.argmax())] if counts.any() else "empty")
+    return kinds
+
+
+def detect_regions(worksheet: Worksheet) -> List[Dict[str, Any]]:
+    """
+    Find rectangular data blocks on a sheet and the header rows of each.
+
+    Regions use 1-based sheet coordinates and are cached on the worksheet, so
+    every analyzer that needs the sheet's tables shares one detection pass.
+    """
+    regions = getattr(worksheet, 'detected_regions', None)
+    if regions is not None:
+        return regions
+
+    grid = get_type_grid(worksheet)
+    regions = []
+    for box in label_blocks(grid != CELL_EMPTY):
+        rows = box["max_row"] - box["min_row"] + 1
+        columns = box["max_col"] - box["min_col"] + 1
+        if rows < MIN_TABLE_ROWS or columns < MIN_TABLE_COLUMNS:
+            continue
+        block = grid[box["min_row"]:box["max_row"] + 1, box["min_col"]:box["max_col"] + 1]
+        region = {
+            "min_row": box["min_row"] + 1,
+            "max_row": box["max_row"] + 1,
+            "min_col": box["min_col"] + 1,
+            "max_col": box["max_col"] + 1,
+            "cells": box["cells"],
+        }
+        region["header_rows"] = count_header_rows(
+            block, is_bold_row(worksheet, region["min_row"], region["min_col"], region["max_col"]))
+        region["range"] = (f"{get_column_letter(region['min_col'])}{region['min_row']}:"
+                           f"{get_column_letter(region['max_col'])}{region['max_row']}")
+        region["headers"] = header_names(worksheet, region)
+        region["types"] = column_kinds(block[region["header_rows"]:])
+        regions.append(region)
+
+    worksheet.detected_regions = regions
+    return regions
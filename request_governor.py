@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional, Any, Dict
+
+from llm_backends import LLMBackendError
+from pipeline_metrics import JobMetrics
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Block until `amount` tokens are available and take them.
+
+        Requests larger than the bucket wait for a full bucket and then leave it
+        in debt, so oversized prompts are throttled instead of rejected.
+        Returns the time spent waiting.
+        """
+        waited = 0.0
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return waited
+                delay = (needed - self.tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestGovernor:
+    """
+    Shared admission control for LLM calls.
+
+    Requests and tokens per minute are enforced with token buckets. Concurrency
+    follows AIMD: each success raises the limit by additive_increase / limit
+    (about +1 per window of successful calls) and every 429 or 5xx multiplies it
+    by multiplicative_decrease. Retryable failures are retried with exponential
+    backoff and full jitter, honoring any retry-after hint from the provider.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 2_000_000,
+                 max_concurrency: int = 4, min_concurrency: int = 1, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 additive_increase: float = 1.0, multiplicative_decrease: float = 0.5):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.active = 0
+        self.stats = {"calls": 0, "successes": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "failures": 0}
+        self._condition = threading.Condition()
+
+    def _enter(self) -> None:
+        with self._condition:
+            while self.active >= max(self.min_concurrency, int(self.concurrency_limit)):
+                self._condition.wait()
+            self.active += 1
+
+    def _exit(self) -> None:
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def _on_success(self) -> None:
+        with self._condition:
+            self.stats["successes"] += 1
+            self.concurrency_limit = min(self.max_concurrency,
+                                         self.concurrency_limit + self.additive_increase / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def _on_overload(self) -> None:
+        with self._condition:
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * self.multiplicative_decrease)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter, never shorter than retry_after."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, func: Callable[[], Any], estimated_tokens: int = 0,
+             metrics: Optional[JobMetrics] = None, label: str = "llm") -> Any:
+        """Run an LLM call under the rate limits, retrying 429/5xx failures."""
+        attempt = 0
+        while True:
+            self.request_bucket.acquire(1)
+            if estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+
+            self._enter()
+            with self._condition:
+                self.stats["calls"] += 1
+            try:
+                result = func()
+            except LLMBackendError as e:
+                if not e.retryable:
+                    with self._condition:
+                        self.stats["failures"] += 1
+                    raise
+                self._on_overload()
+                with self._condition:
+                    self.stats["rate_limited" if e.status_code == 429 else "server_errors"] += 1
+                if attempt >= self.max_retries:
+                    with self._condition:
+                        self.stats["failures"] += 1
+                    raise
+                delay = self.backoff_delay(attempt, e.retry_after)
+                attempt += 1
+                with self._condition:
+                    self.stats["retries"] += 1
+                if metrics:
+                    metrics.increment("llm_retries", generator=label)
+                    if e.status_code == 429:
+                        metrics.increment("llm_rate_limited", generator=label)
+                print(f"LLM call failed ({e.status_code}), retry {attempt}/{self.max_retries} in {delay:.1f}s "
+                      f"(concurrency limit {self.concurrency_limit:.2f})")
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._exit()
+
+            time.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limits and counters, for logging and reports."""
+        with self._condition:
+            return {**self.stats, "active": self.active, "concurrency_limit": round(self.concurrency_limit, 3)}
+
+
+_default_governor = None
+_default_governor_lock = threading.Lock()
+
+
+def get_default_governor() -> RequestGovernor:
+    """
+    Return the process-wide governor shared by every LLM caller.
+
+    Limits come from LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_CONCURRENCY and LLM_MAX_RETRIES.
+    """
+    global _default_governor
+    with _default_governor_lock:
+        if _default_governor is None:
+            _default_governor = RequestGovernor(
+                requests_per_minute=float(os.getenv('LLM_REQUESTS_PER_MINUTE', '60')),
+                tokens_per_minute=float(os.getenv('LLM_TOKENS_PER_MINUTE', '2000000')),
+                max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '4')),
+                max_retries=int(os.getenv('LLM_MAX_RETRIES', '5'))
+            )
+        return _default_governor
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+HASH_CHUNK_SIZE = 1024 * 1024
+MANIFEST_FILENAME = "cache_manifest.json"
+# Bump when the converters' output changes so results cached by older code are not reused
+OUTPUT_SCHEMA_VERSION = 1
+
+
+def save_upload_with_hash(file_storage, upload_root: str, filename: str) -> Tuple[str, str]:
+    """
+    Stream an uploaded file to disk while computing its SHA-256.
+
+    The file ends up at upload_root/<sha256>/<filename>, so uploads that share
+    a name no longer overwrite each other and identical uploads are stored
+    once. Returns the saved path and the hex digest.
+    """
+    os.makedirs(upload_root, exist_ok=True)
+    digest = hashlib.sha256()
+
+    fd, temp_path = tempfile.mkstemp(dir=upload_root, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for block in iter(lambda: file_storage.stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(block)
+                out.write(block)
+
+        content_hash = digest.hexdigest()
+        target_dir = os.path.join(upload_root, content_hash)
+        os.makedirs(target_dir, exist_ok=True)
+        target_path = os.path.join(target_dir, filename)
+        if os.path.exists(target_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, target_path)
+        return target_path, content_hash
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ResultCache:
+    """Content-addressed store of completed workbook conversions."""
+
+    def __init__(self, cache_root: str):
+        self.cache_root = Path(cache_root)
+        self.cache_root.mkdir(parents=True, exist_ok=True)
+
+    def cache_key(self, content_hash: str, options: Dict[str, Any]) -> str:
+        """Combine the workbook hash with the conversion options and output version that affect results."""
+        options = dict(options, output_schema_version=OUTPUT_SCHEMA_VERSION)
+        options_hash = hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+        return f"{content_hash}-{options_hash[:16]}"
+
+    def lookup(self, content_hash: str, options: Dict[str, Any]) -> Optional[Path]:
+        """Return the cached result directory for a workbook, if one is complete."""
+        entry = self.cache_root / self.cache_key(content_hash, options)
+        if (entry / MANIFEST_FILENAME).exists():
+            return entry
+        return None
+
+    def store(self, content_hash: str, options: Dict[str, Any], workbook_dir: str) -> Path:
+        """Copy a finished workbook output directory into the cache."""
+        entry = self.cache_root / self.cache_key(content_hash, options)
+        if (entry / MANIFEST_FILENAME).exists():
+            return entry
+
+        # Copy into a staging directory first so readers never see a partial entry
+        staging = Path(tempfile.mkdtemp(dir=self.cache_root, prefix=".staging-"))
+        try:
+            results_dir = staging / "results"
+            shutil.copytree(workbook_dir, results_dir)
+            manifest = {
+                "content_hash": content_hash,
+                "options": options,
+                "output_schema_version": OUTPUT_SCHEMA_VERSION,
+                "source_name": Path(workbook_dir).name,
+                "created": datetime.now().isoformat(timespec='seconds')
+            }
+            with (staging / MANIFEST_FILENAME).open('w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(staging, entry)
+        except OSError:
+            # Another worker stored the same entry first, or the copy failed
+            shutil.rmtree(staging, ignore_errors=True)
+        return entry
+
+    def materialize(self, entry: Path, destination: str) -> str:
+        """Copy a cached result into an output directory."""
+        shutil.copytree(entry / "results", destination, dirs_exist_ok=True)
+        return destination
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from excel_to_llm_converter import ExcelToLLMConverter
+from workbook_loader import WORKBOOK_EXTENSIONS
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -19,7 +20,7 @@ OUTPUT_DIR = Path("C:/Users/sueho/Documents/EXCEL_TO_LLM/output")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Find Excel files in the input directory
-excel_files = list(INPUT_DIR.glob("*.xlsx"))
+excel_files = sorted(path for path in INPUT_DIR.iterdir() if path.suffix.lower() in WORKBOOK_EXTENSIONS)
 if not excel_files:
     print("No Excel files found in the input directory!")
     exit(1)
@@ -0,0 +1,187 @@
+from typing import Dict, List, Any, Iterator
+
+import numpy as np
+from openpyxl.cell.cell import Cell
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.worksheet import Worksheet
+
+from column_profiler import table_data_bounds
+from region_detector import get_type_grid, CELL_EMPTY, CELL_FORMULA
+from workbook_loader import get_cached_value
+
+# A sheet above either threshold is converted in large-sheet mode
+LARGE_SHEET_ROWS = 10000
+LARGE_SHEET_CELLS = 100000
+# Tables with fewer data rows are always kept whole
+MIN_SAMPLED_ROWS = 500
+SAMPLE_STRATA = 20
+SAMPLE_ROWS_PER_STRATUM = 2
+SAMPLE_SEED = 0
+MAX_SAMPLE_TEXT = 40
+
+
+def is_large_sheet(worksheet: Worksheet) -> bool:
+    return worksheet.max_row > LARGE_SHEET_ROWS or len(worksheet._cells) > LARGE_SHEET_CELLS
+
+
+def stratified_rows(min_row: int, max_row: int, seed: int) -> np.ndarray:
+    """
+    Pick sample rows from equal bands of a row range, plus its first and last row.
+
+    The generator is seeded from the block's position, so the same workbook
+    always yields the same sample.
+    """
+    rng = np.random.default_rng([SAMPLE_SEED, seed])
+    edges = np.linspace(min_row, max_row + 1, SAMPLE_STRATA + 1).astype(np.int64)
+    rows = [min_row, max_row]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            count = min(SAMPLE_ROWS_PER_STRATUM, end - start)
+            rows.extend(rng.choice(np.arange(start, end), size=count, replace=False).tolist())
+    return np.unique(np.array(rows, dtype=np.int64))
+
+
+class SheetSample:
+    """
+    Which cells of a sheet are converted one by one.
+
+    Small sheets are converted whole. On a large sheet, the data rows of
+    tables that hold mostly plain values (data dumps) are replaced by a
+    stratified sample of rows; header rows, formula-driven tables and cells
+    outside tables are kept, and column profiles still describe every row.
+    """
+
+    def __init__(self, worksheet: Worksheet, tables: List[Dict[str, Any]]):
+        self.worksheet = worksheet
+        self.large = is_large_sheet(worksheet)
+        self.blocks: List[Dict[str, Any]] = []
+        if not self.large:
+            return
+
+        grid = get_type_grid(worksheet)
+        for table in tables:
+            bounds = table_data_bounds(table)
+            if not bounds or bounds["max_row"] - bounds["min_row"] + 1 < MIN_SAMPLED_ROWS:
+                continue
+            block = grid[bounds["min_row"] - 1:bounds["max_row"], bounds["min_col"] - 1:bounds["max_col"]]
+            occupied = int(np.count_nonzero(block != CELL_EMPTY))
+            if np.count_nonzero(block == CELL_FORMULA) * 2 >= occupied:
+                # Calculation blocks keep full analysis
+                continue
+            rows = stratified_rows(bounds["min_row"], bounds["max_row"], bounds["min_row"] * 16384 + bounds["min_col"])
+            self.blocks.append({
+                "table": table["name"],
+                "data_range": (f"{get_column_letter(bounds['min_col'])}{bounds['min_row']}:"
+                               f"{get_column_letter(bounds['max_col'])}{bounds['max_row']}"),
+                "bounds": bounds,
+                "headers": table.get("headers") or [],
+                "data_rows": bounds["max_row"] - bounds["min_row"] + 1,
+                "data_cells": occupied,
+                "rows": rows
+            })
+
+    @property
+    def sampled(self) -> bool:
+        return bool(self.blocks)
+
+    def _kept(self) -> np.ndarray:
+        """Mask of stored cells that are converted: everything except unsampled rows of sampled blocks."""
+        kept = get_type_grid(self.worksheet) != CELL_EMPTY
+        for block in self.blocks:
+            bounds = block["bounds"]
+            dropped = np.ones(bounds["max_row"] - bounds["min_row"] + 1, dtype=bool)
+            dropped[block["rows"] - bounds["min_row"]] = False
+            kept[np.nonzero(dropped)[0] + bounds["min_row"] - 1, bounds["min_col"] - 1:bounds["max_col"]] = False
+        return kept
+
+    def iter_cells(self) -> Iterator[Cell]:
+        """Yield the cells to convert in row order; without sampling this is every cell of the sheet."""
+        if not self.sampled:
+            for row in self.worksheet.iter_rows():
+                yield from row
+            return
+        cells = self.worksheet._cells
+        for row, column in np.argwhere(self._kept()) + 1:
+            yield cells[(int(row), int(column))]
+
+    def is_sampled_cell(self, row: int, column: int) -> bool:
+        """Check whether a cell lies in a sampled block; only its sample rows are converted."""
+        for block in self.blocks:
+            bounds = block["bounds"]
+            if bounds["min_row"] <= row <= bounds["max_row"] and bounds["min_col"] <= column <= bounds["max_col"]:
+                return True
+        return False
+
+    def summary(self) -> Dict[str, Any]:
+        """Describe what was sampled, with the sample rows as text, for the JSON and markdown output."""
+        summary = {
+            "large_sheet": self.large,
+            "rows": self.worksheet.max_row,
+            "stored_cells": len(self.worksheet._cells),
+            "thresholds": {"rows": LARGE_SHEET_ROWS, "cells": LARGE_SHEET_CELLS},
+            "blocks": []
+        }
+        cells = self.worksheet._cells
+        for block in self.blocks:
+            bounds = block["bounds"]
+            sample_rows = []
+            for row in block["rows"].tolist():
+                values = []
+                for column in range(bounds["min_col"], bounds["max_col"] + 1):
+                    cell = cells.get((row, column))
+                    value = cell.value if cell is not None else None
+                    if cell is not None and cell.data_type == 'f':
+                        cached = get_cached_value(self.worksheet, row, column)
+                        value = cached if cached is not None else value
+                    values.append("" if value is None else str(value)[:MAX_SAMPLE_TEXT])
+                sample_rows.append({"row": row, "values": values})
+            summary["blocks"].append({
+                "table": block["table"],
+                "data_range": block["data_range"],
+                "headers": block["headers"],
+                "data_rows": block["data_rows"],
+                "data_cells": block["data_cells"],
+                "sampled_rows": len(sample_rows),
+                "strata": min(SAMPLE_STRATA, block["data_rows"]),
+                "sample": sample_rows
+            })
+        return summary
+
+
+def get_sheet_sample(worksheet: Worksheet, tables: List[Dict[str, Any]]) -> SheetSample:
+    """Return the worksheet's sample, choosing it on first use."""
+    sample = getattr(worksheet, 'sheet_sample', None)
+    if sample is None:
+        sample = SheetSample(worksheet, tables)
+        worksheet.sheet_sample = sample
+    return sample
+
+
+def format_sampling(summary: Dict[str, Any]) -> str:
+    """Render the sampled blocks as a markdown section stating exactly what was left out."""
+    if not summary["blocks"]:
+        return ""
+    lines = [
+        "## Large Sheet Sampling",
+        "",
+        f"This sheet has {summary['rows']:,} rows and {summary['stored_cells']:,} stored cells, above the "
+        f"large-sheet thresholds ({summary['thresholds']['rows']:,} rows or {summary['thresholds']['cells']:,} cells). "
+        "The data rows of the tables below are represented by a stratified sample; header rows, formulas "
+        "outside these tables and the column profiles cover the full sheet.",
+        ""
+    ]
+    for block in summary["blocks"]:
+        omitted = block["data_rows"] - block["sampled_rows"]
+        lines.append(f"### Sample of {block['table']} ({block['data_range']})")
+        lines.append(f"- Data rows: {block['data_rows']:,}; shown: {block['sampled_rows']} "
+                     f"(first, last and {SAMPLE_ROWS_PER_STRATUM} per band of {block['strata']} equal row bands); "
+                     f"omitted: {omitted:,}")
+        lines.append("")
+        headers = list(block["headers"]) or [f"Column {index + 1}" for index in range(len(block["sample"][0]["values"]))]
+        lines.append("| Row | " + " | ".join(str(header).replace('|', '\\|') for header in headers) + " |")
+        lines.append("|-----|" + "|".join("---" for _ in headers) + "|")
+        for row in block["sample"]:
+            lines.append(f"| {row['row']} | " + " | ".join(value.replace('|', '\\|').replace('\n', ' ')
+                                                          for value in row["values"]) + " |")
+        lines.append("")
+    return "\n".join(lines) + "\n"
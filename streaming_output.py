@@ -0,0 +1,149 @@
+import codecs
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Dict, Any
+
+from artifact_compression import SIDECAR_SUFFIXES, sidecar_path
+from markdown_index import index_path_for, write_section_index
+
+STREAMING_MARKER_SUFFIX = ".streaming"
+FOLLOW_POLL_INTERVAL = 0.25
+FOLLOW_IDLE_TIMEOUT = 600
+FOLLOW_READ_SIZE = 64 * 1024
+
+
+def streaming_marker_path(file_path: str) -> Path:
+    """Return the marker file that exists while a report is still being written."""
+    return Path(str(file_path) + STREAMING_MARKER_SUFFIX)
+
+
+def is_streaming(file_path: str) -> bool:
+    return streaming_marker_path(file_path).exists()
+
+
+def is_streaming_marker(filename: str) -> bool:
+    return filename.endswith(STREAMING_MARKER_SUFFIX)
+
+
+def mark_report_current(file_path: str) -> None:
+    """
+    Date a finished report copied from an earlier run (such as a cached result) to now.
+
+    follow_file skips reports older than the job that asks for them. The
+    compressed sidecars get the same time so they stay valid, and the
+    section index is rewritten for the new time.
+    """
+    path = Path(file_path)
+    if not path.exists():
+        return
+    now = time.time()
+    for target in [path] + [sidecar_path(file_path, encoding) for encoding in SIDECAR_SUFFIXES]:
+        if target.exists():
+            os.utime(target, (now, now))
+    if index_path_for(file_path).exists():
+        write_section_index(file_path)
+
+
+class StreamingReport:
+    """
+    Report file that is appended to as LLM tokens arrive.
+
+    A marker file sits next to the report until it is complete, so readers
+    tailing the file know when to stop. mark/rollback let a retried request
+    discard the partial output of the failed attempt.
+    """
+
+    def __init__(self, path: str, header: str = ""):
+        self.path = str(path)
+        self.header = header
+        self._header_end = 0
+        self._file = None
+
+    def __enter__(self) -> "StreamingReport":
+        streaming_marker_path(self.path).touch()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._file.write(self.header)
+        self._file.flush()
+        self._header_end = self._file.tell()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        has_content = self._file.tell() > self._header_end
+        self._file.close()
+        if has_content and exc_type is None:
+            write_section_index(self.path)
+        else:
+            # Nothing was generated; don't leave a header-only report behind
+            os.remove(self.path)
+        streaming_marker_path(self.path).unlink(missing_ok=True)
+
+    def write(self, text: str) -> None:
+        if text:
+            self._file.write(text)
+            self._file.flush()
+
+    def mark(self) -> int:
+        return self._file.tell()
+
+    def rollback(self, position: int) -> None:
+        self._file.seek(position)
+        self._file.truncate()
+        self._file.flush()
+
+
+def follow_file(file_path: str, since: float = 0, poll_interval: float = FOLLOW_POLL_INTERVAL,
+                idle_timeout: float = FOLLOW_IDLE_TIMEOUT) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {"text": ...} events for text appended to a report until it is complete.
+
+    Waits for a report modified after `since` to appear, then tails it until its
+    streaming marker is removed. If the writer rolls back a failed attempt, a
+    {"reset": True} event is sent and the file is replayed from the start.
+    Stops after idle_timeout seconds without change.
+    """
+    path = Path(file_path)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    position = 0
+    last_change = time.monotonic()
+
+    while True:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            stat = None
+            if position and not is_streaming(file_path):
+                # The writer gave up and removed the partial report
+                return
+
+        if stat is not None and (stat.st_mtime >= since or is_streaming(file_path)):
+            if stat.st_size < position:
+                position = 0
+                decoder.reset()
+                yield {"reset": True}
+            with path.open('rb') as f:
+                f.seek(position)
+                data = f.read(FOLLOW_READ_SIZE)
+            if data:
+                position += len(data)
+                last_change = time.monotonic()
+                text = decoder.decode(data)
+                if text:
+                    yield {"text": text}
+                continue
+            if not is_streaming(file_path):
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    yield {"text": tail}
+                return
+
+        if time.monotonic() - last_change > idle_timeout:
+            return
+        time.sleep(poll_interval)
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
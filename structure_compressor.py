@@ -0,0 +1,244 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.worksheet.worksheet import Worksheet
+
+from calc_chain import get_formula_cells
+from region_detector import get_type_grid, CELL_EMPTY, CELL_FORMULA, KIND_NAMES
+
+MIN_RUN = 3
+MIN_BLOCK_REPEATS = 2
+MAX_BLOCK_ROWS = 50
+MAX_LAYOUT_CELLS = 8
+
+# A string literal or quoted sheet name (kept as is), or an A1 cell reference
+REFERENCE_PATTERN = re.compile(
+    r"""("[^"]*"|'[^']*')|(?<![A-Za-z0-9_.$])(\$?)([A-Za-z]{1,3})(\$?)([0-9]+)(?![A-Za-z0-9_.(])""")
+
+
+@lru_cache(maxsize=65536)
+def _relative_template(formula: str) -> Tuple[str, Tuple[Tuple[bool, int, bool, int], ...]]:
+    """Split a formula into text with placeholders and its references (absolute row, row, absolute column, column)."""
+    references = []
+
+    def placeholder(found: re.Match) -> str:
+        if found.group(1):
+            return found.group(1)
+        column = column_index_from_string(found.group(3).upper())
+        if column > 16384:
+            return found.group(0)
+        references.append((bool(found.group(4)), int(found.group(5)), bool(found.group(2)), column))
+        return "{}"
+
+    template = REFERENCE_PATTERN.sub(placeholder, formula.replace("{", "{{").replace("}", "}}"))
+    return template, tuple(references)
+
+
+def normalize_formula(formula: str, row: int, column: int) -> str:
+    """
+    Rewrite a formula's A1 references in R1C1 form relative to its cell.
+
+    Copies of one formula across rows or columns (=B5*C5, =B6*C6, ...)
+    normalize to the same text (=RC[-2]*RC[-1]); absolute references stay
+    absolute.
+    """
+    template, references = _relative_template(formula)
+    parts = []
+    for absolute_row, ref_row, absolute_column, ref_column in references:
+        row_part = f"R{ref_row}" if absolute_row else ("R" if ref_row == row else f"R[{ref_row - row}]")
+        column_part = f"C{ref_column}" if absolute_column else \
+            ("C" if ref_column == column else f"C[{ref_column - column}]")
+        parts.append(row_part + column_part)
+    return template.format(*parts)
+
+
+def _runs(ids: List[int], has_formula: List[bool]) -> List[Tuple[int, int]]:
+    """(first, last) index pairs of at least MIN_RUN equal, formula-bearing neighbours."""
+    runs = []
+    index = 0
+    while index < len(ids):
+        end = index
+        while end + 1 < len(ids) and ids[end + 1] == ids[index]:
+            end += 1
+        if end - index + 1 >= MIN_RUN and has_formula[index]:
+            runs.append((index, end))
+        index = end + 1
+    return runs
+
+
+class RepeatedStructure:
+    """
+    Runs and repeated blocks of identically built rows and columns on a sheet.
+
+    Every occupied row and column gets a signature of its cells' kinds and
+    their formulas in relative R1C1 form. Consecutive rows with one signature
+    form a row run, groups of rows that repeat one after another (the same
+    block per entity) form a block, and consecutive columns with one
+    signature (the same layout per period) form a column run. The first
+    instance of each pattern is converted as usual; the formulas of the
+    other instances are described by the pattern and marked as repeated.
+    """
+
+    def __init__(self, worksheet: Worksheet):
+        grid = get_type_grid(worksheet)
+        formulas: Dict[Tuple[int, int], str] = {}
+        for cell in get_formula_cells(worksheet):
+            if isinstance(cell.value, str):
+                formulas[(cell.row, cell.column)] = normalize_formula(cell.value, cell.row, cell.column)
+
+        self.row_runs: List[Dict[str, Any]] = []
+        self.row_blocks: List[Dict[str, Any]] = []
+        self.column_runs: List[Dict[str, Any]] = []
+        self.repeated = np.zeros(grid.shape, dtype=bool)
+        if not formulas:
+            return
+
+        row_ids, row_formulas = self._signatures(grid, formulas, by_row=True)
+        row_runs = _runs(row_ids, row_formulas)
+        index = 0
+        # Blocks are looked for in the rows between runs; a final empty run closes the last gap
+        for first, last in row_runs + [(len(row_ids), None)]:
+            while index < first:
+                height, repeats = self._block_at(row_ids, row_formulas, index, first)
+                if height:
+                    block_last = index + height * repeats - 1
+                    self.row_blocks.append({
+                        "rows": f"{index + 1}:{block_last + 1}",
+                        "first_block": f"{index + 1}:{index + height}",
+                        "height": height,
+                        "repeats": repeats
+                    })
+                    self.repeated[index + height:block_last + 1, :] = True
+                    index = block_last + 1
+                else:
+                    index += 1
+            if last is None:
+                break
+            self.row_runs.append({
+                "rows": f"{first + 1}:{last + 1}",
+                "first_row": first + 1,
+                "count": last - first + 1,
+                "layout": self._layout(grid, formulas, first + 1, None)
+            })
+            self.repeated[first + 1:last + 1, :] = True
+            index = last + 1
+
+        column_ids, column_formulas = self._signatures(grid, formulas, by_row=False)
+        for first, last in _runs(column_ids, column_formulas):
+            self.column_runs.append({
+                "columns": f"{get_column_letter(first + 1)}:{get_column_letter(last + 1)}",
+                "first_column": get_column_letter(first + 1),
+                "count": last - first + 1,
+                "layout": self._layout(grid, formulas, None, first + 1)
+            })
+            self.repeated[:, first + 1:last + 1] = True
+
+        # Only formulas are left out; constants of every instance are still listed
+        self.repeated &= grid == CELL_FORMULA
+
+    @staticmethod
+    def _signatures(grid: np.ndarray, formulas: Dict[Tuple[int, int], str],
+                    by_row: bool) -> Tuple[List[int], List[bool]]:
+        """Number each row (or column) by its signature; equal numbers mean equal structure."""
+        lines = grid if by_row else grid.T
+        numbers: Dict[Any, int] = {}
+        ids = []
+        has_formula = []
+        for offset, line in enumerate(lines):
+            positions = np.nonzero(line != CELL_EMPTY)[0]
+            signature = []
+            for position in positions.tolist():
+                key = (offset + 1, position + 1) if by_row else (position + 1, offset + 1)
+                signature.append((position, int(line[position]), formulas.get(key)))
+            signature = tuple(signature)
+            ids.append(numbers.setdefault(signature, len(numbers)))
+            has_formula.append(any(kind == CELL_FORMULA for _, kind, _ in signature))
+        return ids, has_formula
+
+    @staticmethod
+    def _block_at(ids: List[int], has_formula: List[bool], index: int, end: int) -> Tuple[int, int]:
+        """Find the block height at a row that repeats most often right after itself before `end`, as (height, repeats)."""
+        best = (0, 0)
+        for height in range(2, MAX_BLOCK_ROWS + 1):
+            if index + 2 * height > end:
+                break
+            if ids[index + height] != ids[index]:
+                continue
+            block = ids[index:index + height]
+            if not any(has_formula[index:index + height]):
+                continue
+            repeats = 1
+            while index + (repeats + 1) * height <= end and \
+                    ids[index + repeats * height:index + (repeats + 1) * height] == block:
+                repeats += 1
+            if repeats >= MIN_BLOCK_REPEATS and height * repeats > best[0] * best[1]:
+                best = (height, repeats)
+        return best
+
+    def _layout(self, grid: np.ndarray, formulas: Dict[Tuple[int, int], str], row: Optional[int],
+                column: Optional[int]) -> List[Dict[str, Any]]:
+        """Describe the formula cells of a pattern's first row or column, minus those already repeating a row pattern."""
+        if row is not None:
+            line = (grid[row - 1] == CELL_FORMULA) & ~self.repeated[row - 1]
+            positions = [(row, int(offset) + 1) for offset in np.nonzero(line)[0]]
+        else:
+            line = (grid[:, column - 1] == CELL_FORMULA) & ~self.repeated[:, column - 1]
+            positions = [(int(offset) + 1, column) for offset in np.nonzero(line)[0]]
+        return [{"cell": f"{get_column_letter(cell_column)}{cell_row}", "type": KIND_NAMES[CELL_FORMULA],
+                 "formula": formulas.get((cell_row, cell_column))} for cell_row, cell_column in positions]
+
+    def is_repeated(self, row: int, column: int) -> bool:
+        """Check whether a cell is a formula in a later instance of a repeated pattern."""
+        return row <= self.repeated.shape[0] and column <= self.repeated.shape[1] \
+            and bool(self.repeated[row - 1, column - 1])
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "row_runs": self.row_runs,
+            "row_blocks": self.row_blocks,
+            "column_runs": self.column_runs,
+            "repeated_formulas": int(self.repeated.sum())
+        }
+
+
+def get_repeated_structure(worksheet: Worksheet) -> RepeatedStructure:
+    """Return the worksheet's repeated structure, finding it on first use."""
+    structure = getattr(worksheet, 'repeated_structure', None)
+    if structure is None:
+        structure = RepeatedStructure(worksheet)
+        worksheet.repeated_structure = structure
+    return structure
+
+
+def _format_layout(layout: List[Dict[str, Any]]) -> str:
+    cells = [f"{entry['cell']} `{entry['formula']}`" for entry in layout[:MAX_LAYOUT_CELLS]]
+    if len(layout) > MAX_LAYOUT_CELLS:
+        cells.append(f"... {len(layout) - MAX_LAYOUT_CELLS} more")
+    return ", ".join(cells)
+
+
+def format_repeated_structure(summary: Dict[str, Any]) -> str:
+    """Render the patterns as a markdown section; formulas are shown in relative R1C1 form."""
+    if not summary["repeated_formulas"]:
+        return ""
+    lines = [
+        "## Repeated Structure",
+        "",
+        f"{summary['repeated_formulas']} formulas repeat a pattern below and are listed only for the pattern's "
+        "first instance. Formulas are shown in R1C1 form relative to their cell.",
+        ""
+    ]
+    for run in summary["row_runs"]:
+        lines.append(f"- Rows {run['rows']} ({run['count']} rows) repeat row {run['first_row']}: "
+                     f"{_format_layout(run['layout'])}")
+    for block in summary["row_blocks"]:
+        lines.append(f"- Rows {block['rows']}: block {block['first_block']} ({block['height']} rows) "
+                     f"repeated {block['repeats']} times")
+    for run in summary["column_runs"]:
+        lines.append(f"- Columns {run['columns']} ({run['count']} columns) repeat column {run['first_column']}: "
+                     f"{_format_layout(run['layout'])}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,229 @@
+import os
+import re
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+# Prompts are planned to fit this many tokens unless LLM_TOKEN_BUDGET says otherwise (0 disables planning)
+DEFAULT_TOKEN_BUDGET = 200000
+# A section is cut short rather than dropped only if this many tokens of it still fit
+MIN_PARTIAL_TOKENS = 200
+# The list of omitted sections may use up to this share of the budget
+OMITTED_NOTE_SHARE = 0.1
+
+HEADING_PATTERN = re.compile(r'^(#{1,2})\s+(.*?)\s*$')
+
+# Importance tiers, most important first; a section takes the first tier whose keywords its title contains
+TIER_KEYWORDS = [
+    ("structure", ("combined workbook", "table of contents", "workbook summary", "sheet details")),
+    ("formulas", ("formula", "calculation", "business rule", "business logic", "repeated structure", "data flow",
+                  "dependencies", "relationships", "vba")),
+    ("inputs", ("input", "assumption", "validation", "scenario", "key sections")),
+    ("outputs", ("output", "dashboard", "result", "report", "implementation")),
+    ("named_ranges", ("named range",)),
+    ("headers", ("table", "column", "notes", "comments")),
+    ("raw_data", ())
+]
+TIER_ORDER = {name: rank for rank, (name, _) in enumerate(TIER_KEYWORDS)}
+
+
+def get_token_budget() -> int:
+    """Token budget for LLM prompts from LLM_TOKEN_BUDGET; 0 turns planning off."""
+    return int(os.getenv('LLM_TOKEN_BUDGET', str(DEFAULT_TOKEN_BUDGET)))
+
+
+def section_tier(title: str, parent_tier: Optional[str] = None) -> str:
+    """Rank a section by its heading; unrecognized sections share their parent's tier or count as raw data."""
+    title = title.lower().replace("_", " ")
+    for name, keywords in TIER_KEYWORDS:
+        if any(keyword in title for keyword in keywords):
+            return name
+    return parent_tier or "raw_data"
+
+
+def split_sections(markdown: str) -> List[Dict[str, Any]]:
+    """
+    Split markdown at level 1 and 2 headings.
+
+    Level 1 headings (workbook and sheet titles) and the text before the
+    first level 2 heading below them stay together as one section of the
+    top tier; level 3 and deeper headings stay inside their section.
+    """
+    sections = []
+    current = {"title": "(preamble)", "level": 0, "lines": []}
+    sheet = ""
+    for line in markdown.splitlines(keepends=True):
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            sections.append(current)
+            level = len(heading.group(1))
+            if level == 1:
+                sheet = heading.group(2)
+            current = {"title": heading.group(2), "level": level, "sheet": sheet, "lines": []}
+        current["lines"].append(line)
+    sections.append(current)
+
+    parent_tier = None
+    for section in sections:
+        if section["level"] <= 1:
+            parent_tier = section_tier(section["title"]) if section["level"] else None
+            section["tier"] = "structure"
+            if parent_tier in ("structure", "raw_data"):
+                parent_tier = None
+        else:
+            section["tier"] = section_tier(section["title"], parent_tier)
+        section["text"] = "".join(section.pop("lines"))
+    return [section for section in sections if section["text"]]
+
+
+def _truncate(text: str, budget: int, count_tokens: Callable[[str], int]) -> Tuple[str, int]:
+    """Keep the leading lines of a section that fit the budget, noting how many lines were left out."""
+    lines = text.splitlines(keepends=True)
+    kept = []
+    used = 0
+    for line in lines:
+        line_tokens = count_tokens(line)
+        if used + line_tokens > budget:
+            break
+        kept.append(line)
+        used += line_tokens
+    omitted = len(lines) - len(kept)
+    if omitted:
+        note = f"\n_... {omitted} more lines omitted to fit the token budget_\n\n"
+        while kept and used + count_tokens(note) > budget:
+            used -= count_tokens(kept.pop())
+            omitted += 1
+            note = f"\n_... {omitted} more lines omitted to fit the token budget_\n\n"
+        kept.append(note)
+    return "".join(kept), omitted
+
+
+def _omitted_note(sections: List[Dict[str, Any]], limit: int, count_tokens: Callable[[str], int]) -> str:
+    """List the sections that were left out entirely, as many as fit in `limit` tokens, so the reader knows they exist."""
+    lines = ["", "## Omitted to Fit the Token Budget", ""]
+    used = count_tokens("\n".join(lines))
+    listed = 0
+    for section in sections:
+        where = f"{section['sheet']}: " if section.get("sheet") else ""
+        line = f"- {where}{section['title']} ({section['tokens']:,} tokens, {section['tier'].replace('_', ' ')})"
+        used += count_tokens(line + "\n")
+        if used > limit:
+            break
+        lines.append(line)
+        listed += 1
+    if listed < len(sections):
+        lines.append(f"- ... and {len(sections) - listed} more sections")
+    return "\n".join(lines) + "\n"
+
+
+def _select(sections: List[Dict[str, Any]], budget: int,
+            count_tokens: Callable[[str], int]) -> Tuple[Dict[int, str], List[Dict[str, Any]]]:
+    """Choose whole and shortened sections for a budget; returns {section index: text} and the shortened ones."""
+    # Most important tiers first; within a tier, smaller sections first so more of them fit whole
+    order = sorted(range(len(sections)),
+                   key=lambda index: (TIER_ORDER[sections[index]["tier"]], sections[index]["tokens"], index))
+    chosen: Dict[int, str] = {}
+    remaining = budget
+    for index in order:
+        section = sections[index]
+        if section["tokens"] <= remaining:
+            chosen[index] = section["text"]
+            remaining -= section["tokens"]
+
+    # What is left is shared by the sections that did not fit, most important tier first
+    truncated = []
+    for tier in TIER_ORDER:
+        pending = [index for index in order if index not in chosen and sections[index]["tier"] == tier]
+        for position, index in enumerate(pending):
+            share = remaining // (len(pending) - position)
+            if share < MIN_PARTIAL_TOKENS:
+                continue
+            section = sections[index]
+            text, omitted_lines = _truncate(section["text"], share, count_tokens)
+            chosen[index] = text
+            remaining -= count_tokens(text)
+            truncated.append({"title": section["title"], "sheet": section.get("sheet", ""),
+                              "tier": section["tier"], "omitted_lines": omitted_lines})
+    return chosen, truncated
+
+
+def _plan(sections: List[Dict[str, Any]], budget: int,
+          count_tokens: Callable[[str], int]) -> Tuple[str, Dict[str, Any]]:
+    """Select sections for a budget that includes the note listing the omitted ones."""
+    # Omitting more sections makes the note longer, so grow its reserve until the note fits in it;
+    # the reserve only grows and the note is capped by OMITTED_NOTE_SHARE, so this ends
+    note_limit = int(budget * OMITTED_NOTE_SHARE)
+    reserve = 0
+    while True:
+        chosen, truncated = _select(sections, budget - reserve, count_tokens)
+        omitted = [section for index, section in enumerate(sections) if index not in chosen]
+        note = _omitted_note(omitted, note_limit, count_tokens) if omitted else ""
+        note_tokens = count_tokens(note)
+        if note_tokens <= reserve:
+            break
+        reserve = note_tokens
+
+    text = "".join(chosen[index] for index in sorted(chosen))
+    if omitted:
+        text = text.rstrip("\n") + "\n" + note
+    return text, {
+        "truncated_sections": truncated,
+        "omitted_sections": [{"title": section["title"], "sheet": section.get("sheet", ""),
+                              "tier": section["tier"], "tokens": section["tokens"]} for section in omitted]
+    }
+
+
+def fit_to_budget(markdown: str, budget: int, count_tokens: Callable[[str], int],
+                  input_tokens: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Select the most informative part of a workbook's markdown that fits in `budget` tokens.
+
+    Sections are ranked by tier (formulas, inputs, outputs, named ranges,
+    table headers, then raw data) and taken whole greedily. The tokens left
+    over are split between the sections that did not fit, in tier order, and
+    each is cut at a line boundary; sections that get nothing are listed by
+    name at the end. Returns the planned markdown and a report of what was cut.
+    """
+    if input_tokens is None:
+        input_tokens = count_tokens(markdown)
+    report = {"budget": budget, "input_tokens": input_tokens, "output_tokens": input_tokens,
+              "truncated_sections": [], "omitted_sections": []}
+    if input_tokens <= budget:
+        return markdown, report
+
+    sections = split_sections(markdown)
+    for section in sections:
+        section["tokens"] = count_tokens(section["text"])
+
+    # Per-section counts are not exactly additive, so tighten the budget by any overshoot and plan again;
+    # only a budget too small for the omitted-sections note itself can stop the result from fitting
+    target = budget
+    while True:
+        text, cuts = _plan(sections, target, count_tokens)
+        output_tokens = count_tokens(text)
+        if output_tokens <= budget or target <= 0:
+            break
+        target -= output_tokens - budget
+    report.update(cuts, output_tokens=output_tokens)
+    return text, report
+
+
+def apply_token_budget(markdown: str, content_tokens: int, budget: int, count_tokens: Callable[[str], int],
+                       metrics: Any, generator: str) -> Tuple[str, int]:
+    """
+    Trim content above a token budget (0 means none) to its most informative sections.
+
+    Returns the content and its token count, and records the trimmed tokens
+    for the generator.
+    """
+    if not budget or content_tokens <= budget:
+        return markdown, content_tokens
+    markdown, report = fit_to_budget(markdown, budget, count_tokens, content_tokens)
+    print(format_budget_report(report))
+    metrics.increment("llm_budget_trimmed_tokens", content_tokens - report["output_tokens"], generator=generator)
+    return markdown, report["output_tokens"]
+
+
+def format_budget_report(report: Dict[str, Any]) -> str:
+    """One-line description of a plan for the console."""
+    return (f"Fitted {report['input_tokens']:,} tokens into {report['output_tokens']:,} "
+            f"(budget {report['budget']:,}): {len(report['truncated_sections'])} sections shortened, "
+            f"{len(report['omitted_sections'])} omitted")
@@ -0,0 +1,85 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.worksheet import Worksheet
+
+from region_detector import get_type_grid, CELL_FORMULA
+
+
+class ValidationIndex:
+    """
+    Data validation rules of a sheet, resolved per cell.
+
+    openpyxl keeps validations in worksheet.data_validations as rules with
+    sqref ranges; cells have no data_validation attribute. The index parses
+    every rule's ranges once into rectangles clipped to the sheet's used area
+    and files them by column, so a cell's rule is found among the few row
+    intervals of its column. Only rules with a validation type are indexed.
+    """
+
+    def __init__(self, worksheet: Worksheet):
+        self.worksheet = worksheet
+        self.rules: List[DataValidation] = []
+        # (min_row, min_col, max_row, max_col, rule number) per sqref range, clipped to the used area
+        self.rectangles: List[Tuple[int, int, int, int, int]] = []
+        for validation in worksheet.data_validations.dataValidation:
+            if not validation.type:
+                continue
+            self.rules.append(validation)
+            for cell_range in validation.sqref.ranges:
+                max_row = min(cell_range.max_row, worksheet.max_row)
+                max_col = min(cell_range.max_col, worksheet.max_column)
+                if cell_range.min_row <= max_row and cell_range.min_col <= max_col:
+                    self.rectangles.append((cell_range.min_row, cell_range.min_col, max_row, max_col,
+                                            len(self.rules)))
+
+        # (min_row, max_row, rule number) per column, in rule order
+        self.columns: Dict[int, List[Tuple[int, int, int]]] = {}
+        for min_row, min_col, max_row, max_col, number in self.rectangles:
+            for column in range(min_col, max_col + 1):
+                self.columns.setdefault(column, []).append((min_row, max_row, number))
+
+    def validation_for(self, row: int, column: int) -> Optional[DataValidation]:
+        """Return the validation rule applying to a cell, if any."""
+        # Later rules win where ranges overlap, as in Excel
+        for min_row, max_row, number in reversed(self.columns.get(column, ())):
+            if min_row <= row <= max_row:
+                return self.rules[number - 1]
+        return None
+
+    def has_validation(self, row: int, column: int) -> bool:
+        return self.validation_for(row, column) is not None
+
+    def input_ranges(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one entry per validated range: its address, rule, first input
+        cell and number of input cells.
+
+        Formula cells are computed rather than entered, so they do not count
+        as inputs and ranges holding only formulas are skipped.
+        """
+        grid = get_type_grid(self.worksheet)
+        for min_row, min_col, max_row, max_col, number in self.rectangles:
+            inputs = np.argwhere(grid[min_row - 1:max_row, min_col - 1:max_col] != CELL_FORMULA)
+            if not len(inputs):
+                continue
+            address = f"{get_column_letter(min_col)}{min_row}"
+            if (min_row, min_col) != (max_row, max_col):
+                address += f":{get_column_letter(max_col)}{max_row}"
+            yield {
+                "address": address,
+                "rule": self.rules[number - 1],
+                "first_input": (int(inputs[0][0]) + min_row, int(inputs[0][1]) + min_col),
+                "input_cells": len(inputs)
+            }
+
+
+def get_validation_index(worksheet: Worksheet) -> ValidationIndex:
+    """Return the worksheet's validation index, building it on first use."""
+    index = getattr(worksheet, 'validation_index', None)
+    if index is None:
+        index = ValidationIndex(worksheet)
+        worksheet.validation_index = index
+    return index
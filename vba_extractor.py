@@ -0,0 +1,144 @@
+import os
+import struct
+import zipfile
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import olefile
+except ImportError:  # VBA extraction is optional; workbooks load without it
+    olefile = None
+
+VBA_PROJECT_PART = "vbaProject.bin"
+
+# dir stream record ids ([MS-OVBA] 2.3.4.2)
+PROJECT_CODEPAGE = 0x0003
+PROJECT_VERSION = 0x0009
+MODULE_NAME = 0x0019
+MODULE_STREAM_NAME = 0x001A
+MODULE_OFFSET = 0x0031
+MODULE_TERMINATOR = 0x002B
+
+
+def decompress_vba(data: bytes) -> bytes:
+    """Decompress an MS-OVBA compressed container (dir stream and module source)."""
+    if not data or data[0] != 0x01:
+        raise ValueError("not a compressed VBA container")
+    output = bytearray()
+    pos = 1
+    while pos + 2 <= len(data):
+        header = struct.unpack_from("<H", data, pos)[0]
+        chunk_end = min(pos + 2 + (header & 0x0FFF) + 1, len(data))
+        pos += 2
+        if not header & 0x8000:
+            # Uncompressed chunks hold 4096 literal bytes
+            output += data[pos:pos + 4096]
+            pos += 4096
+            continue
+        chunk_start = len(output)
+        while pos < chunk_end:
+            flags = data[pos]
+            pos += 1
+            for bit in range(8):
+                if pos >= chunk_end:
+                    break
+                if not flags & (1 << bit):
+                    output.append(data[pos])
+                    pos += 1
+                    continue
+                token = struct.unpack_from("<H", data, pos)[0]
+                pos += 2
+                bit_count = max((len(output) - chunk_start - 1).bit_length(), 4)
+                length = (token & (0xFFFF >> bit_count)) + 3
+                offset = (token >> (16 - bit_count)) + 1
+                for _ in range(length):
+                    output.append(output[-offset])
+    return bytes(output)
+
+
+def parse_dir_stream(data: bytes) -> Tuple[str, List[Tuple[str, str, int]]]:
+    """
+    Read the project's code page and its modules from the decompressed dir stream.
+
+    Returns (codec, [(module name, stream name, source offset), ...]).
+    """
+    codec = "cp1252"
+    modules = []
+    module: Dict[str, Any] = {}
+    pos = 0
+    while pos + 6 <= len(data):
+        record_id, size = struct.unpack_from("<HI", data, pos)
+        pos += 6
+        if record_id == PROJECT_VERSION:
+            # The size field is always 4 but the record carries 6 bytes
+            size = 6
+        value = data[pos:pos + size]
+        pos += size
+        if record_id == PROJECT_CODEPAGE:
+            codec = f"cp{struct.unpack('<H', value)[0]}"
+        elif record_id == MODULE_NAME:
+            module = {"name": value.decode(codec, errors="replace")}
+        elif record_id == MODULE_STREAM_NAME:
+            module["stream"] = value.decode(codec, errors="replace")
+        elif record_id == MODULE_OFFSET:
+            module["offset"] = struct.unpack("<I", value)[0]
+        elif record_id == MODULE_TERMINATOR and module:
+            modules.append((module["name"], module.get("stream", module["name"]), module.get("offset", 0)))
+            module = {}
+    return codec, modules
+
+
+def extract_vba_project(data: bytes) -> Dict[str, str]:
+    """Return {module name: source} from the bytes of a vbaProject.bin storage."""
+    modules = {}
+    with olefile.OleFileIO(data) as ole:
+        codec, entries = parse_dir_stream(decompress_vba(ole.openstream("VBA/dir").read()))
+        for name, stream, offset in entries:
+            try:
+                source = decompress_vba(ole.openstream(f"VBA/{stream}").read()[offset:])
+                modules[name] = source.decode(codec, errors="replace").replace("\r\n", "\n").strip()
+            except Exception as e:
+                print(f"Warning: Could not read VBA module {name}: {str(e)}")
+    return modules
+
+
+def read_vba_modules(filename: Any) -> Dict[str, str]:
+    """
+    Read the VBA modules of a macro-enabled workbook (.xlsm or .xlsb).
+
+    Returns {} for packages without a VBA project, or when the optional
+    olefile package is not installed.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        part = next((name for name in archive.namelist() if name.endswith(VBA_PROJECT_PART)), None)
+        if part is None:
+            return {}
+        if olefile is None:
+            print("Warning: The workbook contains VBA macros; install olefile to include them")
+            return {}
+        data = archive.read(part)
+    try:
+        return extract_vba_project(data)
+    except Exception as e:
+        print(f"Error reading VBA project: {str(e)}")
+        return {}
+
+
+def code_modules(modules: Dict[str, str]) -> Dict[str, str]:
+    """Drop modules without code; the ones Excel creates for every sheet are usually just headers."""
+    return {name: source for name, source in modules.items()
+            if not all(line.startswith("Attribute ") or line.strip() in ("", "Option Explicit")
+                       for line in source.splitlines())}
+
+
+def write_vba_markdown(modules: Dict[str, str], output_dir: str) -> Optional[str]:
+    """Write the modules with code to vba_modules.md in the workbook's output directory."""
+    modules = code_modules(modules)
+    if not modules:
+        return None
+    path = os.path.join(output_dir, "vba_modules.md")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# VBA Modules\n\n")
+        for name, source in modules.items():
+            code = "\n".join(line for line in source.splitlines() if not line.startswith("Attribute VB_"))
+            f.write(f"## {name}\n\n```vba\n{code.strip()}\n```\n\n")
+    return path
@@ -0,0 +1,183 @@
+from typing import Any, Dict, Tuple
+
+import openpyxl
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.packaging.relationship import RelationshipList, get_dependents, get_rels_path
+from openpyxl.pivot.table import TableDefinition
+from openpyxl.reader.drawings import find_images
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.utils.datetime import from_excel
+from openpyxl.worksheet._reader import WorkSheetParser, WorksheetReader
+from openpyxl.worksheet.table import Table
+from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.xml.constants import SHEET_MAIN_NS
+from openpyxl.xml.functions import fromstring
+
+from calc_chain import read_calc_chain
+from comments_extractor import read_comments
+from vba_extractor import read_vba_modules
+from xlsb_reader import is_xlsb_package, load_xlsb
+
+# File types load_workbook accepts
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xlsm', '.xlsb')
+
+VALUE_TAG = f"{{{SHEET_MAIN_NS}}}v"
+
+
+def _cast_number(value: str) -> Any:
+    """Convert a number stored as text to an int or float, as openpyxl does."""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+class CachedValueParser(WorkSheetParser):
+    """Worksheet parser that keeps the cached <v> result of formula cells and counts the formulas."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_values = {}
+        self.formula_count = 0
+
+    def parse_cell(self, element):
+        cell = super().parse_cell(element)
+        if cell['data_type'] == 'f':
+            self.formula_count += 1
+            # Files saved by tools that don't calculate (openpyxl included) write an empty <v/>
+            value = element.findtext(VALUE_TAG, None)
+            if value:
+                self.cached_values[(cell['row'], cell['column'])] = self.cast_cached_value(
+                    value, element.get('t', 'n'), cell['style_id'])
+        return cell
+
+    def cast_cached_value(self, value: str, value_type: str, style_id: int) -> Any:
+        """Convert a cached formula result the same way openpyxl converts plain values."""
+        if value_type == 'n':
+            value = _cast_number(value)
+            if style_id in self.date_formats:
+                try:
+                    return from_excel(value, self.epoch, timedelta=style_id in self.timedelta_formats)
+                except (OverflowError, ValueError):
+                    return value
+            return value
+        if value_type == 'b':
+            return bool(int(value))
+        # "str" results and "e" error codes such as #DIV/0! stay as text
+        return value
+
+
+class CachedValueWorksheetReader(WorksheetReader):
+    """WorksheetReader that records cached formula values on the worksheet."""
+
+    def __init__(self, ws, xml_source, shared_strings, data_only, rich_text):
+        super().__init__(ws, xml_source, shared_strings, data_only, rich_text)
+        self.parser = CachedValueParser(xml_source, shared_strings, data_only, ws.parent.epoch,
+                                        ws.parent._date_formats, ws.parent._timedelta_formats, rich_text)
+
+    def bind_cells(self):
+        super().bind_cells()
+        self.ws.cached_values = self.parser.cached_values
+        self.ws.formula_count = self.parser.formula_count
+
+
+class CachedValueExcelReader(ExcelReader):
+    """
+    ExcelReader whose worksheets are read by CachedValueWorksheetReader.
+
+    Follows ExcelReader.read_worksheets (openpyxl 3.1) except that comments
+    are not attached to cells; they are read by comments_extractor. Read-only
+    loads are left to openpyxl.
+    """
+
+    def read_worksheets(self):
+        if self.read_only:
+            super().read_worksheets()
+            return
+        for sheet, rel in self.parser.find_sheets():
+            if rel.target not in self.valid_files:
+                continue
+
+            if "chartsheet" in rel.Type:
+                self.read_chartsheet(sheet, rel)
+                continue
+
+            rels_path = get_rels_path(rel.target)
+            rels = RelationshipList()
+            if rels_path in self.valid_files:
+                rels = get_dependents(self.archive, rels_path)
+
+            with self.archive.open(rel.target) as fh:
+                ws = self.wb.create_sheet(sheet.name)
+                ws._rels = rels
+                ws_parser = CachedValueWorksheetReader(ws, fh, self.shared_strings, self.data_only, self.rich_text)
+                ws_parser.bind_all()
+
+            # Preserve the link to the VML file if VBA is kept
+            if self.wb.vba_archive and ws.legacy_drawing:
+                ws.legacy_drawing = rels.get(ws.legacy_drawing).target
+            else:
+                ws.legacy_drawing = None
+
+            for table_path in ws_parser.tables:
+                ws.add_table(Table.from_tree(fromstring(self.archive.read(table_path))))
+
+            for drawing in rels.find(SpreadsheetDrawing._rel_type):
+                charts, images = find_images(self.archive, drawing.target)
+                for chart in charts:
+                    ws.add_chart(chart, chart.anchor)
+                for image in images:
+                    ws.add_image(image, image.anchor)
+
+            for pivot_rel in rels.find(TableDefinition.rel_type):
+                pivot = TableDefinition.from_tree(fromstring(self.archive.read(pivot_rel.Target)))
+                pivot.cache = self.parser.pivot_caches[pivot.cacheId]
+                ws.add_pivot(pivot)
+
+            ws.sheet_state = sheet.state
+
+
+def load_workbook(filename: str, **kwargs) -> openpyxl.Workbook:
+    """
+    Load a workbook with formulas and their cached results from a single parse.
+
+    Formula cells keep their formula text in cell.value, as with
+    data_only=False, and the value Excel last calculated is available through
+    get_cached_value. Notes and threaded comments are not attached to cells;
+    they are read from the package into comments_extractor.get_cell_notes.
+    The calculation chain, when the package has one, is kept on each sheet as
+    calc_chain for calc_chain.get_formula_cells, along with the number of
+    formulas the sheet's XML holds as formula_count.
+
+    Macro-enabled .xlsm files load the same way; binary .xlsb files are read
+    by xlsb_reader into the same cell structure. The VBA modules of either
+    are kept on the workbook as vba_modules.
+    """
+    if is_xlsb_package(filename):
+        workbook = load_xlsb(filename)
+        comments, chain = {}, None
+    else:
+        kwargs.setdefault('data_only', False)
+        reader = CachedValueExcelReader(filename, **kwargs)
+        reader.read()
+        workbook = reader.wb
+        if hasattr(filename, 'seek'):
+            filename.seek(0)
+        comments = read_comments(filename)
+        if hasattr(filename, 'seek'):
+            filename.seek(0)
+        chain = read_calc_chain(filename)
+    if hasattr(filename, 'seek'):
+        filename.seek(0)
+    workbook.vba_modules = read_vba_modules(filename)
+    for worksheet in workbook.worksheets:
+        if not hasattr(worksheet, 'cached_values'):
+            worksheet.cached_values = {}
+        worksheet.cell_notes = comments.get(worksheet.title, {})
+        worksheet.calc_chain = chain.get(worksheet.title, []) if chain is not None else None
+    return workbook
+
+
+def get_cached_value(worksheet: Worksheet, row: int, column: int) -> Any:
+    """Return the last calculated value of a formula cell, or None if it was never calculated."""
+    cached_values: Dict[Tuple[int, int], Any] = getattr(worksheet, 'cached_values', {})
+    return cached_values.get((row, column))
@@ -0,0 +1,714 @@
+import re
+import struct
+import zipfile
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import openpyxl
+from openpyxl.cell.cell import Cell
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.styles import Font
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE, is_date_format
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, from_excel
+from openpyxl.workbook.defined_name import DefinedName
+
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+WORKSHEET_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+SHARED_STRINGS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+STYLES_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+
+# BIFF12 record types ([MS-XLSB] 2.3)
+BRT_ROW_HDR = 0
+BRT_CELL_BLANK = 1
+BRT_CELL_RK = 2
+BRT_CELL_ERROR = 3
+BRT_CELL_BOOL = 4
+BRT_CELL_REAL = 5
+BRT_CELL_ST = 6
+BRT_CELL_ISST = 7
+BRT_FMLA_STRING = 8
+BRT_FMLA_NUM = 9
+BRT_FMLA_BOOL = 10
+BRT_FMLA_ERROR = 11
+BRT_SST_ITEM = 19
+BRT_NAME = 39
+BRT_FONT = 43
+BRT_FMT = 44
+BRT_XF = 47
+BRT_CELL_RSTRING = 62
+BRT_WB_PROP = 153
+BRT_BUNDLE_SH = 156
+BRT_MERGE_CELL = 176
+BRT_SUP_BOOK_SRC = 355
+BRT_SUP_SELF = 357
+BRT_SUP_SAME = 358
+BRT_SUP_TABS = 359
+BRT_EXTERN_SHEET = 362
+BRT_ARR_FMLA = 426
+BRT_SHR_FMLA = 427
+BRT_BEGIN_CELL_XFS = 617
+BRT_END_CELL_XFS = 618
+BRT_SUP_ADDIN = 667
+
+SUPPORTING_BOOKS = {BRT_SUP_BOOK_SRC, BRT_SUP_SELF, BRT_SUP_SAME, BRT_SUP_ADDIN}
+
+ERROR_CODES = {
+    0x00: "#NULL!", 0x07: "#DIV/0!", 0x0F: "#VALUE!", 0x17: "#REF!",
+    0x1D: "#NAME?", 0x24: "#NUM!", 0x2A: "#N/A", 0x2B: "#GETTING_DATA",
+}
+
+SHEET_STATES = {0: "visible", 1: "hidden", 2: "veryHidden"}
+
+MAX_ROW_INDEX = 1048575
+MAX_COLUMN_INDEX = 16383
+
+# Built-in function number -> (name, argument count); -1 marks functions stored with a
+# variable argument count (PtgFuncVar). Functions added after Excel 2007 are stored
+# as _xlfn. names instead.
+FUNCTIONS: Dict[int, Tuple[str, int]] = {
+    0: ("COUNT", -1), 1: ("IF", -1), 2: ("ISNA", 1), 3: ("ISERROR", 1), 4: ("SUM", -1),
+    5: ("AVERAGE", -1), 6: ("MIN", -1), 7: ("MAX", -1), 8: ("ROW", -1), 9: ("COLUMN", -1),
+    10: ("NA", 0), 11: ("NPV", -1), 12: ("STDEV", -1), 13: ("DOLLAR", -1), 14: ("FIXED", -1),
+    15: ("SIN", 1), 16: ("COS", 1), 17: ("TAN", 1), 18: ("ATAN", 1), 19: ("PI", 0),
+    20: ("SQRT", 1), 21: ("EXP", 1), 22: ("LN", 1), 23: ("LOG10", 1), 24: ("ABS", 1),
+    25: ("INT", 1), 26: ("SIGN", 1), 27: ("ROUND", 2), 28: ("LOOKUP", -1), 29: ("INDEX", -1),
+    30: ("REPT", 2), 31: ("MID", 3), 32: ("LEN", 1), 33: ("VALUE", 1), 34: ("TRUE", 0),
+    35: ("FALSE", 0), 36: ("AND", -1), 37: ("OR", -1), 38: ("NOT", 1), 39: ("MOD", 2),
+    40: ("DCOUNT", 3), 41: ("DSUM", 3), 42: ("DAVERAGE", 3), 43: ("DMIN", 3), 44: ("DMAX", 3),
+    45: ("DSTDEV", 3), 46: ("VAR", -1), 47: ("DVAR", 3), 48: ("TEXT", 2), 49: ("LINEST", -1),
+    50: ("TREND", -1), 51: ("LOGEST", -1), 52: ("GROWTH", -1), 56: ("PV", -1), 57: ("FV", -1),
+    58: ("NPER", -1), 59: ("PMT", -1), 60: ("RATE", -1), 61: ("MIRR", 3), 62: ("IRR", -1),
+    63: ("RAND", 0), 64: ("MATCH", -1), 65: ("DATE", 3), 66: ("TIME", 3), 67: ("DAY", 1),
+    68: ("MONTH", 1), 69: ("YEAR", 1), 70: ("WEEKDAY", -1), 71: ("HOUR", 1), 72: ("MINUTE", 1),
+    73: ("SECOND", 1), 74: ("NOW", 0), 75: ("AREAS", 1), 76: ("ROWS", 1), 77: ("COLUMNS", 1),
+    78: ("OFFSET", -1), 82: ("SEARCH", -1), 83: ("TRANSPOSE", 1), 86: ("TYPE", 1),
+    97: ("ATAN2", 2), 98: ("ASIN", 1), 99: ("ACOS", 1), 100: ("CHOOSE", -1),
+    101: ("HLOOKUP", -1), 102: ("VLOOKUP", -1), 105: ("ISREF", 1), 109: ("LOG", -1),
+    111: ("CHAR", 1), 112: ("LOWER", 1), 113: ("UPPER", 1), 114: ("PROPER", 1),
+    115: ("LEFT", -1), 116: ("RIGHT", -1), 117: ("EXACT", 2), 118: ("TRIM", 1),
+    119: ("REPLACE", 4), 120: ("SUBSTITUTE", -1), 121: ("CODE", 1), 124: ("FIND", -1),
+    125: ("CELL", -1), 126: ("ISERR", 1), 127: ("ISTEXT", 1), 128: ("ISNUMBER", 1),
+    129: ("ISBLANK", 1), 130: ("T", 1), 131: ("N", 1), 140: ("DATEVALUE", 1),
+    141: ("TIMEVALUE", 1), 142: ("SLN", 3), 143: ("SYD", 4), 144: ("DDB", -1),
+    148: ("INDIRECT", -1), 162: ("CLEAN", 1), 163: ("MDETERM", 1), 164: ("MINVERSE", 1),
+    165: ("MMULT", 2), 167: ("IPMT", -1), 168: ("PPMT", -1), 169: ("COUNTA", -1),
+    183: ("PRODUCT", -1), 184: ("FACT", 1), 189: ("DPRODUCT", 3), 190: ("ISNONTEXT", 1),
+    193: ("STDEVP", -1), 194: ("VARP", -1), 195: ("DSTDEVP", 3), 196: ("DVARP", 3),
+    197: ("TRUNC", -1), 198: ("ISLOGICAL", 1), 199: ("DCOUNTA", 3), 212: ("ROUNDUP", 2),
+    213: ("ROUNDDOWN", 2), 216: ("RANK", -1), 219: ("ADDRESS", -1), 220: ("DAYS360", -1),
+    221: ("TODAY", 0), 222: ("VDB", -1), 227: ("MEDIAN", -1), 228: ("SUMPRODUCT", -1),
+    229: ("SINH", 1), 230: ("COSH", 1), 231: ("TANH", 1), 232: ("ASINH", 1), 233: ("ACOSH", 1),
+    234: ("ATANH", 1), 235: ("DGET", 3), 244: ("INFO", 1), 247: ("DB", -1),
+    252: ("FREQUENCY", 2), 261: ("ERROR.TYPE", 1), 269: ("AVEDEV", -1), 276: ("COMBIN", 2),
+    279: ("EVEN", 1), 285: ("FLOOR", 2), 288: ("CEILING", 2), 298: ("ODD", 1),
+    299: ("PERMUT", 2), 307: ("CORREL", 2), 308: ("COVAR", 2), 309: ("FORECAST", 3),
+    311: ("INTERCEPT", 2), 312: ("PEARSON", 2), 313: ("RSQ", 2), 314: ("STEYX", 2),
+    315: ("SLOPE", 2), 318: ("DEVSQ", -1), 319: ("GEOMEAN", -1), 320: ("HARMEAN", -1),
+    321: ("SUMSQ", -1), 322: ("KURT", -1), 323: ("SKEW", -1), 325: ("LARGE", 2),
+    326: ("SMALL", 2), 327: ("QUARTILE", 2), 328: ("PERCENTILE", 2), 329: ("PERCENTRANK", -1),
+    330: ("MODE", -1), 331: ("TRIMMEAN", 2), 336: ("CONCATENATE", -1), 337: ("POWER", 2),
+    342: ("RADIANS", 1), 343: ("DEGREES", 1), 344: ("SUBTOTAL", -1), 345: ("SUMIF", -1),
+    346: ("COUNTIF", 2), 347: ("COUNTBLANK", 1), 350: ("ISPMT", 4), 351: ("DATEDIF", 3),
+    354: ("ROMAN", -1), 358: ("GETPIVOTDATA", -1), 359: ("HYPERLINK", -1),
+    361: ("AVERAGEA", -1), 362: ("MAXA", -1), 363: ("MINA", -1), 364: ("STDEVPA", -1),
+    365: ("VARPA", -1), 366: ("STDEVA", -1), 367: ("VARA", -1), 417: ("QUOTIENT", 2),
+    420: ("ISEVEN", 1), 421: ("ISODD", 1), 422: ("MROUND", 2), 429: ("XIRR", -1),
+    430: ("XNPV", 3), 445: ("NOMINAL", 2), 446: ("EFFECT", 2), 447: ("CUMPRINC", 6),
+    448: ("CUMIPMT", 6), 449: ("EDATE", 2), 450: ("EOMONTH", 2), 451: ("YEARFRAC", -1),
+    464: ("RANDBETWEEN", 2), 465: ("WEEKNUM", -1), 471: ("WORKDAY", -1),
+    472: ("NETWORKDAYS", -1), 480: ("IFERROR", 2), 481: ("COUNTIFS", -1), 482: ("SUMIFS", -1),
+    483: ("AVERAGEIF", -1), 484: ("AVERAGEIFS", -1),
+}
+USER_DEFINED_FUNCTION = 255
+
+BINARY_OPERATORS = {
+    0x03: "+", 0x04: "-", 0x05: "*", 0x06: "/", 0x07: "^", 0x08: "&", 0x09: "<", 0x0A: "<=",
+    0x0B: "=", 0x0C: ">=", 0x0D: ">", 0x0E: "<>", 0x0F: " ", 0x10: ",", 0x11: ":",
+}
+
+# Sheet names that can appear in a reference without quotes
+PLAIN_SHEET_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+CELL_LIKE = re.compile(r"^[A-Za-z]{1,3}[0-9]+$")
+
+UINT16 = struct.Struct("<H")
+UINT32 = struct.Struct("<I")
+INT32 = struct.Struct("<i")
+DOUBLE = struct.Struct("<d")
+CELL_HEADER = struct.Struct("<II")
+RFX = struct.Struct("<iiii")
+LOC = struct.Struct("<IH")
+AREA = struct.Struct("<IIHH")
+
+
+class UnsupportedFormula(Exception):
+    """Raised for formula tokens the decoder does not render, e.g. array constants or structured references."""
+    pass
+
+
+def iter_records(stream: Any, chunk_size: int = 1 << 20) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (record type, payload) for every BIFF12 record in a binary part.
+
+    The part is read in chunks, so a sheet stream is never held in memory as a
+    whole. Record types and sizes are little-endian base-128 varints of up to
+    two and four bytes.
+    """
+    buffer = b""
+    pos = 0
+    while True:
+        if len(buffer) - pos < 6:
+            buffer = buffer[pos:] + stream.read(chunk_size)
+            pos = 0
+            if not buffer:
+                return
+        byte = buffer[pos]
+        pos += 1
+        record_type = byte & 0x7F
+        if byte & 0x80:
+            record_type |= (buffer[pos] & 0x7F) << 7
+            pos += 1
+        size = 0
+        for shift in (0, 7, 14, 21):
+            byte = buffer[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+        while len(buffer) - pos < size:
+            more = stream.read(max(chunk_size, size))
+            if not more:
+                return
+            buffer = buffer[pos:] + more
+            pos = 0
+        yield record_type, buffer[pos:pos + size]
+        pos += size
+
+
+def read_wide_string(data: bytes, pos: int) -> Tuple[Optional[str], int]:
+    """Read an XLWideString (character count, UTF-16 text); a count of 0xFFFFFFFF is a null string."""
+    length = UINT32.unpack_from(data, pos)[0]
+    pos += 4
+    if length == 0xFFFFFFFF:
+        return None, pos
+    end = pos + 2 * length
+    return data[pos:end].decode("utf-16-le"), end
+
+
+def read_parsed_formula(data: bytes, pos: int) -> Tuple[bytes, bytes, int]:
+    """Read a CellParsedFormula: the token stream and its trailing extra data."""
+    size = UINT32.unpack_from(data, pos)[0]
+    pos += 4
+    rgce = data[pos:pos + size]
+    pos += size
+    extra_size = UINT32.unpack_from(data, pos)[0] if pos + 4 <= len(data) else 0
+    pos += 4
+    return rgce, data[pos:pos + extra_size], pos + extra_size
+
+
+def rk_number(value: int) -> Any:
+    """Decode an RkNumber: a 30-bit integer or the high bits of a double, optionally divided by 100 (integral results as ints)."""
+    if value & 0x02:
+        number = INT32.unpack(UINT32.pack(value))[0] >> 2
+    else:
+        number = DOUBLE.unpack(b"\x00\x00\x00\x00" + UINT32.pack(value & 0xFFFFFFFC))[0]
+    if value & 0x01:
+        number /= 100
+    return plain_number(float(number))
+
+
+def quote_sheet(title: str) -> str:
+    """Quote a sheet name for a reference the way Excel writes it."""
+    if PLAIN_SHEET_NAME.match(title) and not CELL_LIKE.match(title):
+        return title
+    return "'" + title.replace("'", "''") + "'"
+
+
+def plain_number(value: float) -> Any:
+    """Return integral doubles as ints, as openpyxl does for numbers read from .xlsx."""
+    return int(value) if value.is_integer() and abs(value) < 1e15 else value
+
+
+def number_text(value: float) -> str:
+    value = plain_number(value)
+    return str(value) if isinstance(value, int) else repr(value).replace("e", "E")
+
+
+class FormulaDecoder:
+    """
+    Renders BIFF12 parsed formulas (rgce token streams) back to formula text.
+
+    Tokens are evaluated on a stack of text fragments the way Excel evaluates
+    them. Sheet references go through the workbook's extern sheet table,
+    names through its defined names, and shared formulas are expanded
+    relative to the cell that uses them.
+    """
+
+    def __init__(self, sheet_titles: List[str], supporting_books: List[Tuple[int, List[str]]],
+                 extern_sheets: List[Tuple[int, int, int]], names: List[str]):
+        self.sheet_titles = sheet_titles
+        self.supporting_books = supporting_books
+        self.extern_sheets = extern_sheets
+        self.names = names
+
+    def sheet_prefix(self, xti: int) -> str:
+        """Sheet part of a 3-D reference, including the trailing '!'."""
+        if xti >= len(self.extern_sheets):
+            raise UnsupportedFormula(f"extern sheet {xti}")
+        book, first, last = self.extern_sheets[xti]
+        if first < 0:
+            # -2 is the workbook itself (names), -1 a deleted sheet
+            return "" if first == -2 else "#REF!"
+        kind, tabs = self.supporting_books[book] if book < len(self.supporting_books) else (None, [])
+        if kind in (BRT_SUP_SELF, BRT_SUP_SAME):
+            titles = self.sheet_titles
+            prefix = ""
+        else:
+            titles = tabs
+            external = [index for index, (other, _) in enumerate(self.supporting_books) if other == BRT_SUP_BOOK_SRC]
+            prefix = f"[{external.index(book) + 1}]" if book in external else ""
+        if first >= len(titles) or last >= len(titles):
+            raise UnsupportedFormula(f"sheet index {first}")
+        sheets = titles[first] if first == last else f"{titles[first]}:{titles[last]}"
+        return quote_sheet(prefix + sheets) + "!"
+
+    @staticmethod
+    def cell_text(row: int, column: int, row_relative: bool, column_relative: bool) -> str:
+        return (f"{'' if column_relative else '$'}{get_column_letter(column + 1)}"
+                f"{'' if row_relative else '$'}{row + 1}")
+
+    def area_text(self, first_row: int, last_row: int, first_col: int, last_col: int,
+                  first_flags: int, last_flags: int) -> str:
+        row_rel = (bool(first_flags & 0x8000), bool(last_flags & 0x8000))
+        col_rel = (bool(first_flags & 0x4000), bool(last_flags & 0x4000))
+        if first_row == 0 and last_row == MAX_ROW_INDEX:
+            return (f"{'' if col_rel[0] else '$'}{get_column_letter(first_col + 1)}:"
+                    f"{'' if col_rel[1] else '$'}{get_column_letter(last_col + 1)}")
+        if first_col == 0 and last_col == MAX_COLUMN_INDEX:
+            return f"{'' if row_rel[0] else '$'}{first_row + 1}:{'' if row_rel[1] else '$'}{last_row + 1}"
+        return (f"{self.cell_text(first_row, first_col, row_rel[0], col_rel[0])}:"
+                f"{self.cell_text(last_row, last_col, row_rel[1], col_rel[1])}")
+
+    @staticmethod
+    def relative(base: int, offset: int, relative: bool, bits: int, limit: int) -> int:
+        """Resolve a row or column of a shared formula token against the cell using it."""
+        if not relative:
+            return offset
+        if offset & (1 << (bits - 1)):
+            offset -= 1 << bits
+        return (base + offset) % (limit + 1)
+
+    def decode(self, rgce: bytes, row: int, column: int,
+               shared: Optional[Dict[Tuple[int, int], Tuple[Tuple[int, int, int, int], bytes]]] = None) -> str:
+        """Render a token stream for the cell at 0-based (row, column)."""
+        stack: List[str] = []
+        pos = 0
+        while pos < len(rgce):
+            ptg = rgce[pos]
+            pos += 1
+            # Reference, value and array class variants of a token share one handler
+            token = ptg if ptg < 0x20 else (ptg & 0x1F) | 0x20
+
+            if token in BINARY_OPERATORS:
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(f"{left}{BINARY_OPERATORS[token]}{right}")
+            elif token == 0x12:
+                stack.append("+" + stack.pop())
+            elif token == 0x13:
+                stack.append("-" + stack.pop())
+            elif token == 0x14:
+                stack.append(stack.pop() + "%")
+            elif token == 0x15:
+                stack.append(f"({stack.pop()})")
+            elif token == 0x16:
+                stack.append("")
+            elif token == 0x17:
+                length = UINT16.unpack_from(rgce, pos)[0]
+                pos += 2
+                text = rgce[pos:pos + 2 * length].decode("utf-16-le")
+                pos += 2 * length
+                stack.append('"' + text.replace('"', '""') + '"')
+            elif token == 0x19:
+                flags = rgce[pos]
+                data = UINT16.unpack_from(rgce, pos + 1)[0]
+                pos += 3
+                if flags & 0x04:
+                    # tAttrChoose carries a jump table
+                    pos += 2 * (data + 1)
+                if flags & 0x10:
+                    stack.append(f"SUM({stack.pop()})")
+            elif token == 0x1C:
+                stack.append(ERROR_CODES.get(rgce[pos], "#N/A"))
+                pos += 1
+            elif token == 0x1D:
+                stack.append("TRUE" if rgce[pos] else "FALSE")
+                pos += 1
+            elif token == 0x1E:
+                stack.append(str(UINT16.unpack_from(rgce, pos)[0]))
+                pos += 2
+            elif token == 0x1F:
+                stack.append(number_text(DOUBLE.unpack_from(rgce, pos)[0]))
+                pos += 8
+            elif token == 0x01:
+                # PtgExp: the cell uses a shared or array formula anchored at the row and column it names
+                anchor_row = UINT32.unpack_from(rgce, pos)[0]
+                anchor_col = UINT16.unpack_from(rgce, pos + 4)[0] if pos + 6 <= len(rgce) else column
+                found = (shared or {}).get((anchor_row, anchor_col))
+                if found is None:
+                    raise UnsupportedFormula("shared formula not found")
+                (top, bottom, left, right), body = found
+                if not (top <= row <= bottom and left <= column <= right):
+                    raise UnsupportedFormula("cell outside its shared formula")
+                return self.decode(body, row, column)
+            elif token == 0x21:
+                number = UINT16.unpack_from(rgce, pos)[0]
+                pos += 2
+                name, count = FUNCTIONS.get(number, (None, -1))
+                if name is None or count < 0:
+                    raise UnsupportedFormula(f"function {number}")
+                arguments = stack[len(stack) - count:] if count else []
+                del stack[len(stack) - count:]
+                stack.append(f"{name}({','.join(arguments)})")
+            elif token == 0x22:
+                count = rgce[pos] & 0x7F
+                number = UINT16.unpack_from(rgce, pos + 1)[0]
+                pos += 3
+                arguments = stack[len(stack) - count:] if count else []
+                del stack[len(stack) - count:]
+                if number == USER_DEFINED_FUNCTION:
+                    # The function name is pushed as the first argument
+                    stack.append(f"{arguments[0]}({','.join(arguments[1:])})")
+                elif number in FUNCTIONS:
+                    stack.append(f"{FUNCTIONS[number][0]}({','.join(arguments)})")
+                else:
+                    raise UnsupportedFormula(f"function {number}")
+            elif token == 0x23:
+                index = UINT32.unpack_from(rgce, pos)[0]
+                pos += 4
+                if not 0 < index <= len(self.names):
+                    raise UnsupportedFormula(f"name {index}")
+                stack.append(self.names[index - 1])
+            elif token == 0x24:
+                ref_row, flags = LOC.unpack_from(rgce, pos)
+                pos += 6
+                stack.append(self.cell_text(ref_row, flags & 0x3FFF, bool(flags & 0x8000), bool(flags & 0x4000)))
+            elif token == 0x25:
+                first_row, last_row, first_flags, last_flags = AREA.unpack_from(rgce, pos)
+                pos += 12
+                stack.append(self.area_text(first_row, last_row, first_flags & 0x3FFF, last_flags & 0x3FFF,
+                                            first_flags, last_flags))
+            elif token in (0x26, 0x27, 0x28):
+                # Precomputed-area hints; the subexpression that follows is rendered as usual
+                pos += 6
+            elif token in (0x29, 0x2E, 0x2F):
+                pos += 2
+            elif token == 0x2A:
+                pos += 6
+                stack.append("#REF!")
+            elif token == 0x2B:
+                pos += 12
+                stack.append("#REF!")
+            elif token == 0x2C:
+                ref_row, flags = LOC.unpack_from(rgce, pos)
+                pos += 6
+                row_rel, col_rel = bool(flags & 0x8000), bool(flags & 0x4000)
+                stack.append(self.cell_text(self.relative(row, ref_row, row_rel, 32, MAX_ROW_INDEX),
+                                            self.relative(column, flags & 0x3FFF, col_rel, 14, MAX_COLUMN_INDEX),
+                                            row_rel, col_rel))
+            elif token == 0x2D:
+                first_row, last_row, first_flags, last_flags = AREA.unpack_from(rgce, pos)
+                pos += 12
+                stack.append(self.area_text(
+                    self.relative(row, first_row, bool(first_flags & 0x8000), 32, MAX_ROW_INDEX),
+                    self.relative(row, last_row, bool(last_flags & 0x8000), 32, MAX_ROW_INDEX),
+                    self.relative(column, first_flags & 0x3FFF, bool(first_flags & 0x4000), 14, MAX_COLUMN_INDEX),
+                    self.relative(column, last_flags & 0x3FFF, bool(last_flags & 0x4000), 14, MAX_COLUMN_INDEX),
+                    first_flags, last_flags))
+            elif token == 0x39:
+                xti = UINT16.unpack_from(rgce, pos)[0]
+                index = UINT32.unpack_from(rgce, pos + 2)[0]
+                pos += 6
+                book = self.extern_sheets[xti][0] if xti < len(self.extern_sheets) else None
+                if book is None or self.supporting_books[book][0] not in (BRT_SUP_SELF, BRT_SUP_SAME) \
+                        or not 0 < index <= len(self.names):
+                    raise UnsupportedFormula("external name")
+                stack.append(self.names[index - 1])
+            elif token == 0x3A:
+                xti = UINT16.unpack_from(rgce, pos)[0]
+                ref_row, flags = LOC.unpack_from(rgce, pos + 2)
+                pos += 8
+                stack.append(self.sheet_prefix(xti) + self.cell_text(ref_row, flags & 0x3FFF, bool(flags & 0x8000),
+                                                                     bool(flags & 0x4000)))
+            elif token == 0x3B:
+                xti = UINT16.unpack_from(rgce, pos)[0]
+                first_row, last_row, first_flags, last_flags = AREA.unpack_from(rgce, pos + 2)
+                pos += 14
+                stack.append(self.sheet_prefix(xti) + self.area_text(first_row, last_row, first_flags & 0x3FFF,
+                                                                     last_flags & 0x3FFF, first_flags, last_flags))
+            elif token == 0x3C:
+                pos += 8
+                stack.append("#REF!")
+            elif token == 0x3D:
+                pos += 14
+                stack.append("#REF!")
+            else:
+                # Array constants, structured references, data tables and other extended tokens
+                raise UnsupportedFormula(f"token 0x{ptg:02X}")
+
+        if len(stack) != 1:
+            raise UnsupportedFormula("unbalanced token stream")
+        return stack[0]
+
+
+class XlsbStyles:
+    """Cell formats from styles.bin: per XF, an openpyxl style array and whether it formats dates."""
+
+    def __init__(self, workbook: openpyxl.Workbook, stream: Optional[Any]):
+        self.styles: List[StyleArray] = []
+        self.date_styles: List[bool] = []
+        if stream is None:
+            return
+        fonts = []
+        formats = dict(BUILTIN_FORMATS)
+        cell_xfs = []
+        in_cell_xfs = False
+        for record_type, data in iter_records(stream):
+            if record_type == BRT_FONT:
+                height, flags, weight = struct.unpack_from("<HHH", data)
+                name = read_wide_string(data, 21)[0]
+                fonts.append(Font(name=name, sz=height / 20, b=weight >= 700, i=bool(flags & 0x0002)))
+            elif record_type == BRT_FMT:
+                formats[UINT16.unpack_from(data)[0]] = read_wide_string(data, 2)[0]
+            elif record_type == BRT_BEGIN_CELL_XFS:
+                in_cell_xfs = True
+            elif record_type == BRT_END_CELL_XFS:
+                in_cell_xfs = False
+            elif record_type == BRT_XF and in_cell_xfs:
+                cell_xfs.append(struct.unpack_from("<HHH", data)[1:])
+
+        for format_id, font_id in cell_xfs:
+            style = StyleArray()
+            if font_id < len(fonts):
+                style.fontId = workbook._fonts.add(fonts[font_id])
+            code = formats.get(format_id, "General")
+            if format_id in BUILTIN_FORMATS and format_id <= BUILTIN_FORMATS_MAX_SIZE:
+                style.numFmtId = format_id
+            else:
+                style.numFmtId = workbook._number_formats.add(code) + BUILTIN_FORMATS_MAX_SIZE
+            self.styles.append(style)
+            self.date_styles.append(is_date_format(code))
+
+    def style(self, xf: int) -> Optional[StyleArray]:
+        return self.styles[xf] if xf < len(self.styles) else None
+
+    def is_date(self, xf: int) -> bool:
+        return xf < len(self.date_styles) and self.date_styles[xf]
+
+
+def is_xlsb_package(filename: Any) -> bool:
+    """Check whether a package's workbook part is binary (.xlsb), whatever the file is called."""
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            workbook_part = next(get_dependents(archive, "_rels/.rels").find(OFFICE_DOCUMENT_REL))
+            return workbook_part.target.endswith(".bin")
+    except (zipfile.BadZipFile, KeyError, StopIteration):
+        return False
+    finally:
+        if hasattr(filename, "seek"):
+            filename.seek(0)
+
+
+def _part(archive: zipfile.ZipFile, rels: Any, rel_type: str) -> Optional[str]:
+    names = set(archive.namelist())
+    return next((rel.target for rel in rels.find(rel_type) if rel.target in names), None)
+
+
+def load_xlsb(filename: Any) -> openpyxl.Workbook:
+    """
+    Load a binary workbook into an openpyxl Workbook.
+
+    The result looks like a workbook read from .xlsx with data_only=False:
+    formula cells hold their formula text, their last calculated values are
+    kept in worksheet.cached_values, and defined names, merged ranges, fonts
+    and number formats are carried over. Formulas using tokens the decoder
+    does not render keep only their cached value.
+    """
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+
+    with zipfile.ZipFile(filename) as archive:
+        workbook_path = next(get_dependents(archive, "_rels/.rels").find(OFFICE_DOCUMENT_REL)).target
+        workbook_rels = get_dependents(archive, get_rels_path(workbook_path))
+
+        sheets = []
+        supporting_books: List[Tuple[int, List[str]]] = []
+        extern_sheets: List[Tuple[int, int, int]] = []
+        raw_names = []
+        with archive.open(workbook_path) as stream:
+            for record_type, data in iter_records(stream):
+                if record_type == BRT_BUNDLE_SH:
+                    state, sheet_id = struct.unpack_from("<II", data)
+                    rel_id, pos = read_wide_string(data, 8)
+                    title = read_wide_string(data, pos)[0]
+                    sheets.append((title, rel_id, SHEET_STATES.get(state, "visible")))
+                elif record_type == BRT_WB_PROP:
+                    if UINT32.unpack_from(data)[0] & 0x01:
+                        workbook.epoch = CALENDAR_MAC_1904
+                elif record_type in SUPPORTING_BOOKS:
+                    supporting_books.append((record_type, []))
+                elif record_type == BRT_SUP_TABS and supporting_books:
+                    count = UINT32.unpack_from(data)[0]
+                    pos = 4
+                    for _ in range(count):
+                        tab, pos = read_wide_string(data, pos)
+                        supporting_books[-1][1].append(tab)
+                elif record_type == BRT_EXTERN_SHEET:
+                    count = UINT32.unpack_from(data)[0]
+                    extern_sheets = [struct.unpack_from("<Iii", data, 4 + 12 * i) for i in range(count)]
+                elif record_type == BRT_NAME:
+                    flags, = UINT32.unpack_from(data)
+                    scope = INT32.unpack_from(data, 5)[0]
+                    name, pos = read_wide_string(data, 9)
+                    rgce = read_parsed_formula(data, pos)[0]
+                    if flags & 0x20 and not name.startswith("_xlnm."):
+                        # Built-in names such as Print_Area are stored without their prefix
+                        name = "_xlnm." + name
+                    raw_names.append((name, scope, rgce, flags))
+
+        titles = [title for title, _, _ in sheets]
+        decoder = FormulaDecoder(titles, supporting_books, extern_sheets, [name for name, _, _, _ in raw_names])
+
+        styles_part = _part(archive, workbook_rels, STYLES_REL)
+        if styles_part:
+            with archive.open(styles_part) as stream:
+                styles = XlsbStyles(workbook, stream)
+        else:
+            styles = XlsbStyles(workbook, None)
+
+        shared_strings = []
+        strings_part = _part(archive, workbook_rels, SHARED_STRINGS_REL)
+        if strings_part:
+            with archive.open(strings_part) as stream:
+                for record_type, data in iter_records(stream):
+                    if record_type == BRT_SST_ITEM:
+                        shared_strings.append(read_wide_string(data, 1)[0])
+
+        for title, rel_id, state in sheets:
+            rel = workbook_rels.get(rel_id) if rel_id else None
+            if rel is None or rel.Type != WORKSHEET_REL or rel.target not in archive.namelist():
+                # Chart sheets, macro sheets and dialog sheets are not loaded, as with openpyxl
+                continue
+            worksheet = workbook.create_sheet(title)
+            worksheet.sheet_state = state
+            with archive.open(rel.target) as stream:
+                _read_sheet(worksheet, stream, decoder, styles, shared_strings)
+
+        for name, scope, rgce, flags in raw_names:
+            # Hidden function names back _xlfn. functions and are not user names
+            if flags & 0x02 or name.startswith("_xlfn."):
+                continue
+            try:
+                text = decoder.decode(rgce, 0, 0)
+            except (UnsupportedFormula, IndexError, struct.error):
+                continue
+            definition = DefinedName(name, attr_text=text)
+            if 0 <= scope < len(titles) and titles[scope] in workbook.sheetnames:
+                workbook[titles[scope]].defined_names[name] = definition
+            elif scope < 0:
+                workbook.defined_names[name] = definition
+
+    return workbook
+
+
+def _read_sheet(worksheet: Any, stream: Any, decoder: FormulaDecoder, styles: XlsbStyles,
+                shared_strings: List[str]) -> None:
+    """Stream one sheet's records into worksheet cells."""
+    cells = worksheet._cells
+    cached_values = {}
+    formulas = []
+    shared = {}
+    merged = []
+    epoch = worksheet.parent.epoch
+    row = 1
+
+    for record_type, data in iter_records(stream):
+        if record_type == BRT_ROW_HDR:
+            row = UINT32.unpack_from(data)[0] + 1
+            continue
+        if BRT_CELL_BLANK < record_type <= BRT_FMLA_ERROR or record_type == BRT_CELL_RSTRING:
+            column, style = CELL_HEADER.unpack_from(data)
+            column += 1
+            xf = style & 0xFFFFFF
+            data_type = 'n'
+            if record_type == BRT_CELL_RK:
+                value = rk_number(UINT32.unpack_from(data, 8)[0])
+            elif record_type == BRT_CELL_REAL:
+                value = plain_number(DOUBLE.unpack_from(data, 8)[0])
+            elif record_type == BRT_CELL_ISST:
+                index = UINT32.unpack_from(data, 8)[0]
+                value = shared_strings[index] if index < len(shared_strings) else ""
+                data_type = 's'
+            elif record_type == BRT_CELL_ST:
+                value = read_wide_string(data, 8)[0]
+                data_type = 's'
+            elif record_type == BRT_CELL_RSTRING:
+                value = read_wide_string(data, 9)[0]
+                data_type = 's'
+            elif record_type == BRT_CELL_BOOL:
+                value = bool(data[8])
+                data_type = 'b'
+            elif record_type == BRT_CELL_ERROR:
+                value = ERROR_CODES.get(data[8], "#N/A")
+                data_type = 'e'
+            else:
+                if record_type == BRT_FMLA_STRING:
+                    cached, pos = read_wide_string(data, 8)
+                elif record_type == BRT_FMLA_NUM:
+                    cached, pos = plain_number(DOUBLE.unpack_from(data, 8)[0]), 16
+                elif record_type == BRT_FMLA_BOOL:
+                    cached, pos = bool(data[8]), 9
+                else:
+                    cached, pos = ERROR_CODES.get(data[8], "#N/A"), 9
+                if record_type == BRT_FMLA_NUM and styles.is_date(xf):
+                    cached = from_excel(cached, epoch)
+                rgce = read_parsed_formula(data, pos + 2)[0]
+                cached_values[(row, column)] = cached
+                # Decoded once the sheet is read: shared formulas follow the first cell using them
+                formulas.append((row, column, rgce))
+                value = cached
+                data_type = {str: 's', bool: 'b'}.get(type(cached), 'n')
+                if record_type == BRT_FMLA_ERROR:
+                    data_type = 'e'
+
+            if data_type == 'n' and styles.is_date(xf) and record_type != BRT_FMLA_NUM:
+                value = from_excel(value, epoch)
+                data_type = 'd'
+            cell = Cell(worksheet, row=row, column=column, style_array=styles.style(xf))
+            cell._value = value
+            cell.data_type = data_type
+            cells[(row, column)] = cell
+        elif record_type in (BRT_SHR_FMLA, BRT_ARR_FMLA):
+            top, bottom, left, right = RFX.unpack_from(data)
+            # BrtArrFmla has a flags byte before its formula
+            rgce = read_parsed_formula(data, 16 if record_type == BRT_SHR_FMLA else 17)[0]
+            shared[(top, left)] = ((top, bottom, left, right), rgce)
+        elif record_type == BRT_MERGE_CELL:
+            merged.append(RFX.unpack_from(data))
+
+    undecoded = 0
+    for formula_row, formula_column, rgce in formulas:
+        try:
+            text = decoder.decode(rgce, formula_row - 1, formula_column - 1, shared)
+        except (UnsupportedFormula, IndexError, struct.error):
+            undecoded += 1
+            continue
+        cell = cells[(formula_row, formula_column)]
+        cell._value = "=" + text
+        cell.data_type = 'f'
+    if undecoded:
+        print(f"Warning: {undecoded} formulas on {worksheet.title} could not be decoded; their cached values are kept")
+
+    for top, bottom, left, right in merged:
+        worksheet.merge_cells(start_row=top + 1, end_row=bottom + 1, start_column=left + 1, end_column=right + 1)
+    worksheet.cached_values = cached_values